@@ -0,0 +1,184 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+# Load control for the write endpoints, per worker process.
+#
+# RateLimiter is a token bucket per client: each client may make `rate`
+# requests a second on average, with bursts of up to `burst`. Buckets are
+# kept for the `max_clients` most recently seen clients; an evicted client
+# starts again with a full bucket.
+#
+# AdmissionController bounds the write requests in flight so they cannot
+# take every pooled connection. There are two priorities:
+#
+#   - interactive requests (a bill at the counter, a payment) wait in line
+#     for up to `queue_timeout` seconds when `limit` requests are already in
+#     flight, and are shed when the line is `max_queue` long
+#   - bulk requests (bulk bills, imports, sync batches) never wait. They
+#     hold at most `bulk_limit` slots and are shed while interactive
+#     requests are waiting, while the pool has no free connection, or while
+#     interactive requests take longer than `target_latency` on average
+#
+# A shed request gets Rejected with how many seconds to wait before trying
+# again, estimated from the work ahead of it.
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+
+class Rejected(Exception):
+    def __init__(self, message, retry_after, reason):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class RateLimiter:
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # key -> [tokens, updated_at]
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+
+    # Take `cost` tokens from the client's bucket. Returns 0 when the request
+    # may go ahead, otherwise the seconds until the bucket holds enough.
+    def take(self, key, cost=1):
+        if self.rate <= 0:
+            return 0.0
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                self.allowed += 1
+                return 0.0
+            self.limited += 1
+            return (cost - bucket[0]) / self.rate
+
+    def stats(self):
+        with self._lock:
+            return {'rate': self.rate, 'burst': self.burst, 'clients': len(self._buckets),
+                    'allowed': self.allowed, 'limited': self.limited}
+
+
+class AdmissionController:
+    def __init__(self, pool, limit=None, bulk_limit=None, queue_timeout=2.0, max_queue=None,
+                 target_latency=0.5, latency_window=10.0, smoothing=0.2):
+        self.pool = pool
+        self.limit = limit or pool.size + pool.max_overflow
+        self.bulk_limit = bulk_limit or max(1, self.limit // 4)
+        self.queue_timeout = queue_timeout
+        self.max_queue = self.limit * 2 if max_queue is None else max_queue
+        self.target_latency = target_latency
+        self.latency_window = latency_window
+        self.smoothing = smoothing
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._bulk = 0
+        self._queued = 0
+        self._latency = 0.0  # moving average of interactive request time, waiting included
+        self._sampled_at = 0.0
+
+        self.admitted = 0
+        self.waited = 0
+        self.shed = 0
+
+    # Average interactive latency, or 0 once no interactive request has
+    # finished for `latency_window` seconds
+    def _recent_latency(self, now):
+        return self._latency if now - self._sampled_at < self.latency_window else 0.0
+
+    def _pool_saturated(self):
+        stats = self.pool.stats()
+        return stats['in_use'] >= self.pool.size + self.pool.max_overflow
+
+    # Seconds for the requests ahead to drain, at the recent latency
+    def _retry_after(self, now):
+        latency = max(self._recent_latency(now), 0.1)
+        return max(1, math.ceil(latency * (self._in_flight + self._queued + 1) / self.limit))
+
+    def _reject(self, message, reason, now):
+        self.shed += 1
+        raise Rejected(message, self._retry_after(now), reason)
+
+    # Wait for a slot. Returns a ticket to hand back to release().
+    def admit(self, priority=INTERACTIVE):
+        now = time.monotonic()
+        if priority == BULK:
+            # pool.stats() takes the pool's own lock, so read it first
+            saturated = self._pool_saturated()
+            with self._cond:
+                if self._queued or self._in_flight >= self.limit or self._bulk >= self.bulk_limit:
+                    self._reject('Server busy with other requests', 'busy', now)
+                if saturated or self._recent_latency(now) > self.target_latency:
+                    self._reject('Server overloaded', 'overloaded', now)
+                self._bulk += 1
+                self._in_flight += 1
+                self.admitted += 1
+            return priority, now
+
+        with self._cond:
+            if self._in_flight >= self.limit:
+                if self._queued >= self.max_queue:
+                    self._reject('Too many requests waiting', 'queue_full', now)
+                self._queued += 1
+                self.waited += 1
+                deadline = now + self.queue_timeout
+                try:
+                    while self._in_flight >= self.limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._reject('Timed out waiting for the server', 'queue_timeout', time.monotonic())
+                        self._cond.wait(remaining)
+                finally:
+                    self._queued -= 1
+            self._in_flight += 1
+            self.admitted += 1
+        return priority, now
+
+    def release(self, ticket):
+        priority, started = ticket
+        now = time.monotonic()
+        with self._cond:
+            self._in_flight -= 1
+            if priority == BULK:
+                self._bulk -= 1
+            else:
+                elapsed = now - started
+                if now - self._sampled_at >= self.latency_window:
+                    self._latency = elapsed
+                else:
+                    self._latency += self.smoothing * (elapsed - self._latency)
+                self._sampled_at = now
+            self._cond.notify()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._cond:
+            return {
+                'limit': self.limit,
+                'bulk_limit': self.bulk_limit,
+                'in_flight': self._in_flight,
+                'bulk_in_flight': self._bulk,
+                'queued': self._queued,
+                'latency_ms': round(self._recent_latency(now) * 1000, 2),
+                'admitted': self.admitted,
+                'waited': self.waited,
+                'shed': self.shed,
+            }
@@ -1,201 +1,367 @@
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response, g
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import mysql.connector
 from datetime import datetime
 import os
+import atexit
+import hmac
+import math
+import socket
+import threading
+import time
+import logging
 from dotenv import load_dotenv
+import click
 
 load_dotenv()
 
+from logging_config import setup_logging
+setup_logging()
+
+from db import get_db_connection, pool
+import db
+import storage
+import stock_control
+import rollups
+import migrations
+import archive
+from catalog import ProductCatalog
+from decimal import Decimal
+from contextlib import ExitStack
+import exporter
+import importer
+import gst
+import pagination
+import queries
+import pickups
+import events
+import sync
+import verification
+from verification import BankClient, MySQLJobStore, VerificationPool
+from idempotency import RecentKeys
+from importer import ImportJobs
+from pickups import PickupQueue
+import responses
+from responses import FastJSONProvider
+import metrics
+import admission
+import auth
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.secret_key = 'msme_secret_key_2023'
-CORS(app)
+CORS(app, expose_headers=['X-Next-Cursor'])
 
-# Database connection using MySQL Workbench settings
-def get_db_connection():
-    try:
-        conn = mysql.connector.connect(
-            host=os.getenv('DB_HOST', 'localhost'),
-            user=os.getenv('DB_USER', 'root'),
-            password=os.getenv('DB_PASSWORD', ''),
-            database=os.getenv('DB_NAME', 'msme_db'),
-            port=os.getenv('DB_PORT', '3306')
-        )
-        return conn
-    except mysql.connector.Error as e:
-        print(f"❌ Database connection error: {e}")
-        return None
+catalog = ProductCatalog(
+    ttl=float(os.getenv('CATALOG_TTL', '60')),
+    max_products=int(os.getenv('CATALOG_MAX_PRODUCTS', '50000'))
+)
+
+payment_jobs = MySQLJobStore(get_db_connection, max_attempts=int(os.getenv('VERIFY_MAX_ATTEMPTS', '9')))
+verification_pool = VerificationPool(
+    BankClient(os.getenv('BANK_API_URL'), timeout=float(os.getenv('BANK_API_TIMEOUT', '10'))),
+    payment_jobs,
+    workers=int(os.getenv('VERIFY_WORKERS', '8'))
+)
+recent_payments = RecentKeys(int(os.getenv('RECENT_PAYMENTS_CAPACITY', '100000')))
+
+inventory_imports = ImportJobs(get_db_connection, workers=int(os.getenv('IMPORT_WORKERS', '1')))
+# Imported prices and stock are not patched into the cache; reload it
+inventory_imports.on_finished = lambda: catalog.invalidate()
+
+# Push channel for open dashboards (see events.py). Every stream holds a
+# request thread, so by default at most half of a worker's threads stream.
+broker = events.Broker(
+    max_subscribers=int(os.getenv('EVENTS_MAX_STREAMS', max(1, int(os.getenv('THREADS', '4')) // 2))),
+    queue_size=int(os.getenv('EVENTS_QUEUE_SIZE', '100')),
+    coalesce=('stats',)
+)
+event_relay = events.Relay(broker, get_db_connection, interval=float(os.getenv('EVENTS_RELAY_INTERVAL', '1')),
+                           local_topics=('stats',))
+verification_pool.on_settled = lambda payment_id, status: notify('payment', {'id': payment_id, 'status': status})
+
+# Pickups are journaled locally and written to MySQL in the background
+pickup_queue = PickupQueue(
+    os.getenv('PICKUP_JOURNAL', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pickup_journal.db')),
+    get_db_connection,
+    interval=float(os.getenv('PICKUP_FLUSH_INTERVAL', '0.5'))
+)
+pickup_queue.on_flushed = lambda count: dashboard_updates.trigger()
+
+# An offline store (DB_BACKEND=sqlite) pushes its changes to the central
+# server at SYNC_SERVER_URL and pulls inventory from it; the central server
+# accepts pushes from stores holding SYNC_TOKEN (see sync.py)
+SYNC_TOKEN = os.getenv('SYNC_TOKEN')
+sync_client = sync.SyncClient(
+    get_db_connection,
+    os.getenv('SYNC_SERVER_URL'),
+    os.getenv('SYNC_STORE_ID', socket.gethostname()[:64]),
+    SYNC_TOKEN,
+    batch_size=int(os.getenv('SYNC_BATCH_SIZE', sync.BATCH_SIZE)),
+    interval=float(os.getenv('SYNC_INTERVAL', '60'))
+)
+sync_client.on_pulled = lambda count: catalog.invalidate()
+
+# Rate limiting and admission control for the write endpoints (see
+# admission.py). RATE_LIMIT_RATE=0 turns the rate limit off and
+# ADMISSION_CONTROL=0 admission control. Anonymous clients are limited by
+# address: behind nginx or another reverse proxy, set TRUSTED_PROXIES to
+# the number of proxy hops in front of the app so the address is taken from
+# X-Forwarded-For (see create_app). Otherwise every client shares the
+# proxy's bucket.
+TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', '0'))
+rate_limiter = admission.RateLimiter(
+    rate=float(os.getenv('RATE_LIMIT_RATE', '10')),
+    burst=int(os.getenv('RATE_LIMIT_BURST', '30'))
+)
+ADMISSION_CONTROL = os.getenv('ADMISSION_CONTROL', '1') == '1'
+admission_control = admission.AdmissionController(
+    pool,
+    limit=int(os.getenv('ADMISSION_LIMIT', '0')) or None,
+    bulk_limit=int(os.getenv('ADMISSION_BULK_LIMIT', '0')) or None,
+    queue_timeout=float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '2')),
+    target_latency=float(os.getenv('ADMISSION_TARGET_LATENCY', '0.5'))
+)
+
+# Password hashing, session tokens and login lockouts (see auth.py). Tokens
+# are signed with AUTH_SECRET, else the app's secret key. AUTH_REQUIRED=1
+# turns away API requests without a valid token or login session.
+AUTH_REQUIRED = os.getenv('AUTH_REQUIRED', '0') == '1'
+password_hasher = auth.PasswordHasher(
+    iterations=int(os.getenv('AUTH_HASH_ITERATIONS', auth.ITERATIONS)),
+    workers=int(os.getenv('AUTH_HASH_WORKERS', '0')) or None
+)
+session_tokens = auth.TokenSigner(os.getenv('AUTH_SECRET') or app.secret_key,
+                                  ttl=int(os.getenv('AUTH_TOKEN_TTL', '43200')))
+login_lockouts = auth.Lockouts(
+    max_failures=int(os.getenv('AUTH_MAX_FAILURES', '5')),
+    lockout=float(os.getenv('AUTH_LOCKOUT_SECONDS', '300'))
+)
+
+# Where closed months of bills and payments have been archived (see archive.py)
+archive_boundaries = archive.Boundaries(get_db_connection)
+
+# 'rate' rounds GST once per rate on each bill, 'line' on every item
+GST_ROUNDING = os.getenv('GST_ROUNDING', 'rate')
+
+logger = logging.getLogger('msme')
 
 def create_tables():
-    conn = get_db_connection()
-    if not conn:
-        print("❌ Cannot connect to database. Please check your MySQL connection.")
-        return
-    
-    cursor = conn.cursor()
-    
-    try:
-        # Create users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                username VARCHAR(50) UNIQUE NOT NULL,
-                password VARCHAR(255) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        print("✅ Users table created/verified")
-        
-        # Create payments table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS payments (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                transaction_id VARCHAR(100) NOT NULL,
-                amount DECIMAL(10,2) NOT NULL,
-                status VARCHAR(20) NOT NULL,
-                verified_at TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        print("✅ Payments table created/verified")
-        
-        # Create waste_pickups table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS waste_pickups (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                waste_type VARCHAR(50) NOT NULL,
-                quantity DECIMAL(10,2) NOT NULL,
-                pickup_date DATE NOT NULL,
-                status VARCHAR(20) NOT NULL,
-                scheduled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        print("✅ Waste pickups table created/verified")
-        
-        # Create bills table with customer phone
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bills (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                customer_name VARCHAR(100) NOT NULL,
-                customer_phone VARCHAR(15),
-                subtotal DECIMAL(10,2) NOT NULL,
-                gst DECIMAL(10,2) NOT NULL,
-                total DECIMAL(10,2) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        print("✅ Bills table created/verified")
-        
-        # Create bill_items table with GST rate
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bill_items (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                bill_id INT,
-                item_name VARCHAR(100) NOT NULL,
-                quantity INT NOT NULL,
-                price DECIMAL(10,2) NOT NULL,
-                gst_rate DECIMAL(5,2) DEFAULT 18.00,
-                FOREIGN KEY (bill_id) REFERENCES bills(id)
-            )
-        ''')
-        print("✅ Bill items table created/verified")
-        
-        # Create inventory table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS inventory (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                product_name VARCHAR(255) NOT NULL,
-                category VARCHAR(100) NOT NULL,
-                price DECIMAL(10,2) NOT NULL,
-                stock INT NOT NULL,
-                description TEXT,
-                gst_rate DECIMAL(5,2) DEFAULT 18.00,
-                status VARCHAR(20) DEFAULT 'Active',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    with get_db_connection() as conn:
+        if not conn:
+            logger.error("Cannot connect to database. Please check your MySQL connection.")
+            return
+        
+        cursor = conn.cursor()
+        
+        try:
+            # Create users table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    username VARCHAR(50) UNIQUE NOT NULL,
+                    password VARCHAR(255) NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            logger.info("Users table created/verified")
+            
+            # Create payments table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS payments (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    transaction_id VARCHAR(100) NOT NULL,
+                    amount DECIMAL(10,2) NOT NULL,
+                    status VARCHAR(20) NOT NULL,
+                    verified_at TIMESTAMP,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            logger.info("Payments table created/verified")
+            
+            # Create verification job table for the background verifier
+            verification.create_table(cursor)
+            logger.info("Verification jobs table created/verified")
+            
+            # Create waste_pickups table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS waste_pickups (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    waste_type VARCHAR(50) NOT NULL,
+                    quantity DECIMAL(10,2) NOT NULL,
+                    pickup_date DATE NOT NULL,
+                    status VARCHAR(20) NOT NULL,
+                    scheduled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            logger.info("Waste pickups table created/verified")
+            
+            # Create bills table with customer phone
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS bills (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    customer_name VARCHAR(100) NOT NULL,
+                    customer_phone VARCHAR(15),
+                    subtotal DECIMAL(10,2) NOT NULL,
+                    gst DECIMAL(10,2) NOT NULL,
+                    total DECIMAL(10,2) NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            logger.info("Bills table created/verified")
+            
+            # Create bill_items table with GST rate
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS bill_items (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    bill_id INT,
+                    item_name VARCHAR(100) NOT NULL,
+                    quantity INT NOT NULL,
+                    price DECIMAL(10,2) NOT NULL,
+                    gst_rate DECIMAL(5,2) DEFAULT 18.00,
+                    FOREIGN KEY (bill_id) REFERENCES bills(id)
+                )
+            ''')
+            logger.info("Bill items table created/verified")
+            
+            # Create inventory table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS inventory (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    product_name VARCHAR(255) NOT NULL,
+                    category VARCHAR(100) NOT NULL,
+                    price DECIMAL(10,2) NOT NULL,
+                    stock INT NOT NULL,
+                    description TEXT,
+                    gst_rate DECIMAL(5,2) DEFAULT 18.00,
+                    status VARCHAR(20) DEFAULT 'Active',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                )
+            ''')
+            logger.info("Inventory table created/verified")
+            
+            # Create import job table for bulk inventory uploads
+            importer.create_table(cursor)
+            logger.info("Import jobs table created/verified")
+            
+            # Create the table that relays dashboard events between workers
+            events.create_table(cursor)
+            logger.info("Broadcast events table created/verified")
+            
+            # Create stock reservation tables for carts held open at the counter
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS stock_reservations (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    status VARCHAR(20) NOT NULL DEFAULT 'held',
+                    expires_at DATETIME NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    INDEX idx_reservations_status_expiry (status, expires_at)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS stock_reservation_items (
+                    reservation_id INT NOT NULL,
+                    product_id INT NOT NULL,
+                    quantity INT NOT NULL,
+                    PRIMARY KEY (reservation_id, product_id),
+                    FOREIGN KEY (reservation_id) REFERENCES stock_reservations(id)
+                )
+            ''')
+            logger.info("Stock reservation tables created/verified")
+            
+            # Create summary counter and daily rollup tables
+            rollups.create_tables(cursor)
+            logger.info("Rollup tables created/verified")
+            
+            # Apply versioned schema changes (secondary indexes etc.)
+            for version, description in migrations.migrate(conn):
+                logger.info('Migration applied', extra={'version': version, 'description': description})
+            
+            # Insert sample user if not exists
+            cursor.execute(
+                "INSERT IGNORE INTO users (username, password) VALUES (%s, %s)",
+                ('ayman', password_hasher.hash('password123'))
             )
-        ''')
-        print("✅ Inventory table created/verified")
-        
-        # Insert sample user if not exists
-        cursor.execute('''
-            INSERT IGNORE INTO users (username, password) 
-            VALUES ('ayman', 'password123')
-        ''')
-        print("✅ Sample user 'ayman' inserted")
-        
-        # Insert sample payments
-        cursor.execute('''
-            INSERT IGNORE INTO payments (transaction_id, amount, status) 
-            VALUES 
-            ('TXN001234', 2500.00, 'verified'),
-            ('TXN001233', 1800.00, 'pending'),
-            ('TXN001232', 3200.00, 'verified'),
-            ('TXN001231', 1500.00, 'verified'),
-            ('TXN001230', 2800.00, 'failed')
-        ''')
-        print("✅ Sample payments inserted")
-        
-        # Insert sample waste pickups
-        cursor.execute('''
-            INSERT IGNORE INTO waste_pickups (waste_type, quantity, pickup_date, status) 
-            VALUES 
-            ('plastic', 5.5, '2024-01-15', 'completed'),
-            ('paper', 3.2, '2024-01-16', 'scheduled'),
-            ('metal', 2.1, '2024-01-18', 'completed'),
-            ('glass', 4.8, '2024-01-20', 'scheduled')
-        ''')
-        print("✅ Sample waste pickups inserted")
-        
-        # Insert sample bills
-        cursor.execute('''
-            INSERT IGNORE INTO bills (customer_name, customer_phone, subtotal, gst, total) 
-            VALUES 
-            ('Rajesh Kumar', '9876543210', 1000.00, 180.00, 1180.00),
-            ('Priya Singh', '8765432109', 2500.00, 450.00, 2950.00),
-            ('Amit Sharma', '7654321098', 1500.00, 270.00, 1770.00)
-        ''')
-        print("✅ Sample bills inserted")
-        
-        # Insert sample bill items
-        cursor.execute('''
-            INSERT IGNORE INTO bill_items (bill_id, item_name, quantity, price, gst_rate) 
-            VALUES 
-            (1, 'Laptop', 1, 45000.00, 18.00),
-            (1, 'Mouse', 2, 800.00, 18.00),
-            (2, 'Office Chair', 1, 7500.00, 18.00),
-            (2, 'Desk Lamp', 2, 1500.00, 18.00),
-            (3, 'Notebooks', 5, 120.00, 12.00)
-        ''')
-        print("✅ Sample bill items inserted")
-        
-        # Insert sample inventory
-        cursor.execute('''
-            INSERT IGNORE INTO inventory (product_name, category, price, stock, description, gst_rate) 
-            VALUES 
-            ('Laptop', 'electronics', 45000.00, 12, 'High-performance business laptop', 18.00),
-            ('Office Chair', 'furniture', 7500.00, 8, 'Ergonomic office chair', 18.00),
-            ('Notebooks', 'stationery', 120.00, 150, 'A4 size notebooks pack of 10', 12.00),
-            ('Wireless Mouse', 'electronics', 800.00, 2, 'Bluetooth wireless mouse', 18.00),
-            ('Desk Lamp', 'furniture', 1500.00, 0, 'LED desk lamp with adjustable arm', 18.00),
-            ('Pen Set', 'stationery', 250.00, 50, 'Premium pen set with case', 12.00),
-            ('Monitor', 'electronics', 12000.00, 6, '24-inch HD monitor', 18.00),
-            ('Keyboard', 'electronics', 1800.00, 15, 'Mechanical keyboard', 18.00)
-        ''')
-        print("✅ Sample inventory inserted")
-        
-        conn.commit()
-        
-        # Verify data was created
-        cursor.execute("SELECT COUNT(*) as user_count FROM users")
-        user_count = cursor.fetchone()
-        print(f"✅ User verification: {user_count[0]} users found")
-        
-    except mysql.connector.Error as e:
-        print(f"❌ Error creating tables: {e}")
-    finally:
-        cursor.close()
-        conn.close()
+            logger.info("Sample user 'ayman' inserted")
+            
+            # Insert sample payments
+            cursor.execute('''
+                INSERT IGNORE INTO payments (transaction_id, amount, status) 
+                VALUES 
+                ('TXN001234', 2500.00, 'verified'),
+                ('TXN001233', 1800.00, 'pending'),
+                ('TXN001232', 3200.00, 'verified'),
+                ('TXN001231', 1500.00, 'verified'),
+                ('TXN001230', 2800.00, 'failed')
+            ''')
+            logger.info("Sample payments inserted")
+            
+            # Insert sample waste pickups
+            cursor.execute('''
+                INSERT IGNORE INTO waste_pickups (waste_type, quantity, pickup_date, status) 
+                VALUES 
+                ('plastic', 5.5, '2024-01-15', 'completed'),
+                ('paper', 3.2, '2024-01-16', 'scheduled'),
+                ('metal', 2.1, '2024-01-18', 'completed'),
+                ('glass', 4.8, '2024-01-20', 'scheduled')
+            ''')
+            logger.info("Sample waste pickups inserted")
+            
+            # Insert sample bills
+            cursor.execute('''
+                INSERT IGNORE INTO bills (customer_name, customer_phone, subtotal, gst, total) 
+                VALUES 
+                ('Rajesh Kumar', '9876543210', 1000.00, 180.00, 1180.00),
+                ('Priya Singh', '8765432109', 2500.00, 450.00, 2950.00),
+                ('Amit Sharma', '7654321098', 1500.00, 270.00, 1770.00)
+            ''')
+            logger.info("Sample bills inserted")
+            
+            # Insert sample bill items
+            cursor.execute('''
+                INSERT IGNORE INTO bill_items (bill_id, item_name, quantity, price, gst_rate) 
+                VALUES 
+                (1, 'Laptop', 1, 45000.00, 18.00),
+                (1, 'Mouse', 2, 800.00, 18.00),
+                (2, 'Office Chair', 1, 7500.00, 18.00),
+                (2, 'Desk Lamp', 2, 1500.00, 18.00),
+                (3, 'Notebooks', 5, 120.00, 12.00)
+            ''')
+            logger.info("Sample bill items inserted")
+            
+            # Insert sample inventory
+            cursor.execute('''
+                INSERT IGNORE INTO inventory (product_name, category, price, stock, description, gst_rate) 
+                VALUES 
+                ('Laptop', 'electronics', 45000.00, 12, 'High-performance business laptop', 18.00),
+                ('Office Chair', 'furniture', 7500.00, 8, 'Ergonomic office chair', 18.00),
+                ('Notebooks', 'stationery', 120.00, 150, 'A4 size notebooks pack of 10', 12.00),
+                ('Wireless Mouse', 'electronics', 800.00, 2, 'Bluetooth wireless mouse', 18.00),
+                ('Desk Lamp', 'furniture', 1500.00, 0, 'LED desk lamp with adjustable arm', 18.00),
+                ('Pen Set', 'stationery', 250.00, 50, 'Premium pen set with case', 12.00),
+                ('Monitor', 'electronics', 12000.00, 6, '24-inch HD monitor', 18.00),
+                ('Keyboard', 'electronics', 1800.00, 15, 'Mechanical keyboard', 18.00)
+            ''')
+            logger.info("Sample inventory inserted")
+            
+            conn.commit()
+            
+            # Bring rollups in line with the sample data
+            rollups.rebuild(cursor)
+            conn.commit()
+            logger.info("Summary rollups rebuilt")
+            
+            # Verify data was created
+            cursor.execute("SELECT COUNT(*) as user_count FROM users")
+            user_count = cursor.fetchone()
+            logger.info('User verification', extra={'users': user_count[0]})
+            
+        except mysql.connector.Error as e:
+            logger.error('Error creating tables', extra={'error': str(e)})
+        finally:
+            cursor.close()
 
 # Routes
 @app.route('/')
@@ -371,6 +537,115 @@ def login_page():
     </html>
     """
 
+# Request instrumentation
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+# Who is making the request: the subject of a valid bearer token, else the
+# user of the login session. Neither needs a database lookup.
+PUBLIC_ENDPOINTS = {'login', 'api_status', 'sync_state', 'sync_push', 'sync_pull'}
+
+@app.before_request
+def authenticate():
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        claims = session_tokens.verify(header[7:])
+        g.user = claims['sub'] if claims else None
+    else:
+        g.user = session.get('user')
+    if AUTH_REQUIRED and g.user is None and request.method != 'OPTIONS' \
+            and request.path.startswith('/api/') and request.endpoint not in PUBLIC_ENDPOINTS:
+        return jsonify({'success': False, 'message': 'Authentication required'}), 401
+    return None
+
+@app.after_request
+def record_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        elapsed = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.request_duration.observe(elapsed, route, request.method)
+        metrics.requests_total.inc(route, request.method, str(response.status_code))
+        logger.debug('Request handled', extra={
+            'route': route,
+            'method': request.method,
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 2)
+        })
+    return response
+
+# Registered after record_request so it runs first and is included in timings
+app.after_request(responses.compress_response)
+
+# Write endpoints under rate limiting and admission control, by priority.
+# Interactive requests wait briefly for a slot; bulk requests are shed
+# first and retried by the caller after Retry-After.
+WRITE_ENDPOINTS = {
+    'create_bill': admission.INTERACTIVE,
+    'verify_payment': admission.INTERACTIVE,
+    'add_inventory': admission.INTERACTIVE,
+    'reserve_stock': admission.INTERACTIVE,
+    'release_stock': admission.INTERACTIVE,
+    'create_bills_bulk': admission.BULK,
+    'import_inventory': admission.BULK,
+    'sync_push': admission.BULK,
+}
+
+# Whose rate limit a request counts against: the store for sync pushes
+# carrying the sync token, else the logged-in user, else the client address
+def rate_limit_key():
+    if request.endpoint == 'sync_push' and SYNC_TOKEN and hmac.compare_digest(
+            request.headers.get('X-Sync-Token', '').encode(), SYNC_TOKEN.encode()):
+        return 'store:' + request.args.get('store', '')[:64]
+    user = g.get('user')
+    if user:
+        return 'user:' + user
+    return 'ip:' + (request.remote_addr or '')
+
+def too_many_requests(message, retry_after, reason):
+    metrics.requests_rejected.inc(request.url_rule.rule, reason)
+    response = jsonify({'success': False, 'message': message, 'retryAfter': round(retry_after, 3)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+@app.before_request
+def admit_request():
+    priority = WRITE_ENDPOINTS.get(request.endpoint)
+    if priority is None or request.method != 'POST':
+        return None
+    wait = rate_limiter.take(rate_limit_key())
+    if wait:
+        return too_many_requests('Rate limit exceeded', wait, 'rate_limited')
+    if ADMISSION_CONTROL:
+        try:
+            g.admission = admission_control.admit(priority)
+        except admission.Rejected as e:
+            return too_many_requests(str(e), e.retry_after, e.reason)
+    return None
+
+@app.teardown_request
+def release_admission(exc):
+    ticket = g.pop('admission', None)
+    if ticket is not None:
+        admission_control.release(ticket)
+
+metrics.registry.register(metrics.Gauge('db_pool_open', 'Open pooled connections', lambda: pool.stats()['open']))
+metrics.registry.register(metrics.Gauge('db_pool_in_use', 'Checked out pooled connections', lambda: pool.stats()['in_use']))
+metrics.registry.register(metrics.Gauge('catalog_hits', 'Product catalog cache hits', lambda: catalog.stats()['hits']))
+metrics.registry.register(metrics.Gauge('catalog_misses', 'Product catalog cache misses', lambda: catalog.stats()['misses']))
+metrics.registry.register(metrics.Gauge('verification_queued', 'Payments waiting for verification', lambda: verification_pool.stats()['queued']))
+metrics.registry.register(metrics.Gauge('pickup_queue_pending', 'Journaled pickups not yet in MySQL', lambda: pickup_queue.stats()['pending']))
+metrics.registry.register(metrics.Gauge('admission_in_flight', 'Admitted write requests in flight', lambda: admission_control.stats()['in_flight']))
+metrics.registry.register(metrics.Gauge('admission_queued', 'Write requests waiting for admission', lambda: admission_control.stats()['queued']))
+metrics.registry.register(metrics.Gauge('event_streams', 'Open dashboard event streams', lambda: broker.stats()['subscribers']))
+
+# Prometheus scrape endpoint (per worker process)
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
 # API Status Check
 @app.route('/api/status')
 def api_status():
@@ -378,222 +653,754 @@ def api_status():
         'status': 'operational',
         'message': 'MSME Business Hub API is running',
         'timestamp': datetime.now().isoformat(),
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'db_backend': db.BACKEND,
+        'db_pool': pool.stats(),
+        'catalog': catalog.stats(),
+        'verification': verification_pool.stats(),
+        'recent_payments': recent_payments.stats(),
+        'inventory_imports': inventory_imports.stats(),
+        'events': {**broker.stats(), 'relay': event_relay.stats()},
+        'pickup_queue': pickup_queue.stats(),
+        'sync': sync_client.stats(),
+        'admission': {**admission_control.stats(), 'rate_limit': rate_limiter.stats()},
+        'auth': {**password_hasher.stats(), 'credentials': credentials.stats(), 'lockouts': login_lockouts.stats()}
     })
 
+# Users by username, cached so repeated logins skip the database
+USER_CREDENTIALS = queries.Query('user_credentials', "SELECT id, username, password FROM users WHERE username = %s")
+
+def load_credentials(username):
+    with get_db_connection() as conn:
+        if not conn:
+            raise auth.Unavailable('Database connection failed')
+        return queries.fetch(conn, USER_CREDENTIALS, (username,)).first()
+
+credentials = auth.CredentialCache(load_credentials, ttl=float(os.getenv('AUTH_CACHE_TTL', '300')))
+
+# Store the password hashed at the current cost
+def rehash_password(user, password):
+    encoded = password_hasher.hash(password)
+    with get_db_connection() as conn:
+        if not conn:
+            return
+        cursor = conn.cursor()
+        try:
+            cursor.execute("UPDATE users SET password = %s WHERE id = %s", (encoded, user.id))
+            conn.commit()
+        finally:
+            cursor.close()
+    credentials.put(user.username, user._replace(password=encoded))
+
 # Login API
+# Answers with a signed token to send as "Authorization: Bearer <token>" and
+# also sets the login session. Failed logins count towards a temporary
+# lockout of the username.
 @app.route('/api/login', methods=['POST'])
 def login():
-    data = request.json
-    username = data.get('username')
-    password = data.get('password')
+    data = request.json or {}
+    username = str(data.get('username') or '')
+    password = str(data.get('password') or '')
+    
+    logger.debug('Login attempt', extra={'username': username})
+    
+    if not username or len(username) > 50:
+        return jsonify({'success': False, 'message': 'Invalid credentials'})
+    
+    locked_for = login_lockouts.locked_for(username)
+    if locked_for:
+        logger.warning('Login refused, too many failures', extra={'username': username})
+        return too_many_requests('Too many failed logins, try again later', locked_for, 'locked_out')
     
-    print(f"🔐 Login attempt: username={username}")
+    try:
+        user = credentials.get(username)
+        verified = password_hasher.verify(password, user.password if user else None)
+    except auth.Busy as e:
+        return too_many_requests(str(e), 1, 'busy')
+    except (auth.Unavailable, mysql.connector.Error) as e:
+        logger.error('Database error during login', extra={'error': str(e)})
+        return jsonify({'success': False, 'message': 'Database connection failed'})
     
-    # Temporary hardcoded login for development
-    if username == 'ayman' and password == 'password123':
-        session['user'] = username
-        return jsonify({'success': True, 'message': 'Login successful'})
+    if not verified:
+        login_lockouts.failed(username)
+        logger.warning('Login failed', extra={'username': username})
+        return jsonify({'success': False, 'message': 'Invalid credentials'})
     
-    # Fallback to database check
-    conn = get_db_connection()
-    if conn:
+    login_lockouts.succeeded(username)
+    if password_hasher.needs_rehash(user.password):
         try:
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute(
-                "SELECT * FROM users WHERE username = %s AND password = %s",
-                (username, password)
-            )
-            user = cursor.fetchone()
-            cursor.close()
-            conn.close()
-            
-            if user:
-                print(f"✅ Database login successful for: {username}")
-                session['user'] = username
-                return jsonify({'success': True, 'message': 'Login successful'})
-        except Exception as e:
-            print(f"❌ Database error: {e}")
+            rehash_password(user, password)
+        except (auth.Busy, mysql.connector.Error) as e:
+            logger.warning('Password rehash failed', extra={'username': username, 'error': str(e)})
     
-    print(f"❌ Login failed for: {username}")
-    return jsonify({'success': False, 'message': 'Invalid credentials'})
+    session['user'] = username
+    logger.info('Login successful', extra={'username': username})
+    return jsonify({
+        'success': True,
+        'message': 'Login successful',
+        'token': session_tokens.issue(username, user.id),
+        'expiresIn': session_tokens.ttl
+    })
 
 # Payment Verification API
+# Records the payment as pending and hands it to the background verifier.
+# Poll /api/verify_payment/<paymentId> (optionally with ?wait=seconds) for
+# the result. Submissions are idempotent on transactionId: a retry returns
+# the original paymentId with duplicate=True.
 @app.route('/api/verify_payment', methods=['POST'])
 def verify_payment():
-    data = request.json
+    data = request.get_json(silent=True) or {}
     transaction_id = data.get('transactionId')
     amount = data.get('amount')
     
-    # Simulate bank API verification
-    import random
-    is_verified = random.choice([True, True, False])  # 66% success rate
+    if not transaction_id or not amount:
+        return jsonify({'verified': False, 'pending': False, 'message': 'Transaction ID and amount are required'})
+    
+    # Exact to the paisa, as the bank and payments.amount DECIMAL(10,2) see it
+    try:
+        paise = gst.to_paise(amount)
+    except ValueError:
+        paise = 0
+    if paise <= 0 or paise >= 10 ** 10:
+        return jsonify({'verified': False, 'pending': False, 'message': 'Amount must be a positive number'}), 400
+    amount = gst.from_paise(paise)
+    
+    # Retries seen recently by this process, whose job is still in its
+    # verification pool, never reach MySQL
+    recent = recent_payments.get(transaction_id)
+    if recent is not None:
+        return duplicate_payment(transaction_id, amount, *recent)
     
-    # Save to database
-    conn = get_db_connection()
-    if conn:
+    with get_db_connection() as conn:
+        if not conn:
+            return jsonify({'verified': False, 'pending': False, 'message': 'Database connection failed'})
+        
         cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO payments (transaction_id, amount, status, verified_at) VALUES (%s, %s, %s, %s)",
-            (transaction_id, amount, 'verified' if is_verified else 'failed', datetime.now())
-        )
-        conn.commit()
-        cursor.close()
-        conn.close()
+        try:
+            now = datetime.now()
+            conn.start_transaction()
+            payment_id, created = payment_jobs.enqueue(cursor, transaction_id, amount, now)
+            conn.commit()
+        finally:
+            cursor.close()
+    
+    if not created:
+        return duplicate_payment(transaction_id, amount, payment_id)
+    
+    recent_payments.add(transaction_id, (payment_id, amount))
+    verification_pool.start()
+    verification_pool.submit(payment_id)
+    notify('payment', {
+        'id': payment_id,
+        'transaction_id': transaction_id,
+        'amount': amount,
+        'status': 'pending',
+        'created_at': now
+    })
     
     return jsonify({
-        'verified': is_verified,
-        'message': 'Payment verified successfully' if is_verified else 'Potential fraud detected'
+        'pending': True,
+        'paymentId': payment_id,
+        'message': 'Verification in progress'
+    }), 202
+
+# A pending payment whose job gave up, or that has no job at all (recorded
+# before verification jobs existed), would never settle: queue it again.
+# Returns True when the payment was stalled.
+def resume_verification(payment):
+    if payment['status'] != 'pending' or payment['job_status'] not in (None, 'error'):
+        return False
+    if payment_jobs.requeue(payment['id']):
+        verification_pool.start()
+        verification_pool.submit(payment['id'])
+        logger.info('Pending payment requeued for verification', extra={'payment_id': payment['id']})
+    return True
+
+# Answer a transaction id submitted before. The amount has to match the
+# recorded one, and a payment whose verification gave up is queued again.
+# `recorded_amount` comes from recent_payments and saves the lookup while
+# the job is still in this process's pool.
+def duplicate_payment(transaction_id, amount, payment_id, recorded_amount=None):
+    if recorded_amount is None or not verification_pool.in_flight(payment_id):
+        payment = payment_jobs.status(payment_id)
+        if payment:
+            recorded_amount = Decimal(payment['amount'])
+            recent_payments.add(transaction_id, (payment_id, recorded_amount))
+            if recorded_amount == amount:
+                resume_verification(payment)
+    
+    if recorded_amount is not None and recorded_amount != amount:
+        return jsonify({
+            'paymentId': payment_id,
+            'verified': False,
+            'pending': False,
+            'message': 'Transaction ID already submitted with a different amount'
+        }), 409
+    
+    return jsonify({
+        'paymentId': payment_id,
+        'duplicate': True,
+        'pending': True,
+        'message': 'Payment already submitted'
+    })
+
+@app.route('/api/verify_payment/<int:payment_id>')
+def verification_status(payment_id):
+    try:
+        wait = min(max(float(request.args.get('wait', 0) or 0), 0), 30)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'wait must be a number of seconds'}), 400
+    
+    payment = payment_jobs.status(payment_id)
+    if not payment:
+        return jsonify({'success': False, 'message': 'Payment not found'}), 404
+    
+    stalled = resume_verification(payment)
+    if payment['status'] == 'pending' and (wait > 0 or stalled):
+        verification_pool.wait(payment_id, wait)
+        payment = payment_jobs.status(payment_id) or payment
+    
+    pending = payment['status'] == 'pending'
+    verified = payment['status'] == 'verified'
+    if pending:
+        message = 'Verification failed, please retry' if payment['job_status'] == 'error' else 'Verification in progress'
+    elif verified:
+        message = 'Payment verified successfully'
+    else:
+        message = 'Payment could not be verified' if payment['job_status'] == 'error' else 'Potential fraud detected'
+    
+    return jsonify({
+        'paymentId': payment['id'],
+        'transactionId': payment['transaction_id'],
+        'status': payment['status'],
+        'pending': pending and payment['job_status'] != 'error',
+        'verified': verified,
+        'message': message
     })
 
 # Schedule Pickup API
+# The pickup is validated and written to the local journal, then answered
+# with 202; the background flusher moves it to MySQL (see pickups.py), after
+# which it appears in /api/pickup_history.
 @app.route('/api/schedule_pickup', methods=['POST'])
 def schedule_pickup():
-    data = request.json
-    waste_type = data.get('wasteType')
-    quantity = data.get('quantity')
-    pickup_date = data.get('pickupDate')
-    
-    # Save to database
-    conn = get_db_connection()
-    if conn:
-        cursor = conn.cursor()
+    data = request.json or {}
+    try:
+        waste_type, quantity, pickup_date = pickups.validate(
+            data.get('wasteType'), data.get('quantity'), data.get('pickupDate')
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    now = datetime.now()
+    try:
+        entry_key = pickup_queue.append(waste_type, quantity, pickup_date, now)
+    except Exception:
+        logger.exception('Error journaling pickup')
+        return jsonify({'success': False, 'message': 'Pickup could not be saved, please try again'}), 503
+    
+    pickup_queue.start()
+    broker.publish('pickup', {
+        'entry_key': entry_key,
+        'waste_type': waste_type,
+        'quantity': quantity,
+        'pickup_date': pickup_date,
+        'status': 'scheduled',
+        'scheduled_at': now
+    })
+    
+    return jsonify({'success': True, 'pickupKey': entry_key, 'message': 'Pickup scheduled successfully'}), 202
+
+# Bill items are written with executemany, which mysql-connector folds into
+# multi-row INSERT statements; chunking keeps each statement well below
+# max_allowed_packet for very large wholesale invoices.
+BILL_ITEMS_CHUNK = 500
+
+# Insert a batch of bills and all of their items on an open cursor, updating
+# the summary rollups along the way. The caller owns the transaction. Each
+# bill needs its own INSERT to learn its id, while the items of every bill
+# in the batch go out as chunked multi-row inserts.
+def insert_bills(cursor, bills):
+    bill_ids = []
+    item_rows = []
+    now = datetime.now()
+    
+    for bill in bills:
         cursor.execute(
-            "INSERT INTO waste_pickups (waste_type, quantity, pickup_date, status, scheduled_at) VALUES (%s, %s, %s, %s, %s)",
-            (waste_type, quantity, pickup_date, 'scheduled', datetime.now())
+            "INSERT INTO bills (customer_name, customer_phone, subtotal, gst, total, created_at) VALUES (%s, %s, %s, %s, %s, %s)",
+            (bill['customer_name'], bill['customer_phone'], bill['subtotal'], bill['gst'], bill['total'], now)
         )
-        conn.commit()
-        cursor.close()
-        conn.close()
+        bill_id = cursor.lastrowid
+        bill_ids.append(bill_id)
+        for item, (price, quantity, rate) in zip(bill['items'], bill['lines']):
+            item_rows.append((bill_id, item['name'], quantity, gst.from_paise(price), rate))
     
-    return jsonify({'success': True, 'message': 'Pickup scheduled successfully'})
+    for i in range(0, len(item_rows), BILL_ITEMS_CHUNK):
+        cursor.executemany(
+            "INSERT INTO bill_items (bill_id, item_name, quantity, price, gst_rate) VALUES (%s, %s, %s, %s, %s)",
+            item_rows[i:i + BILL_ITEMS_CHUNK]
+        )
+    
+    rollups.record(cursor, now.date(), revenue=sum(bill['total'] for bill in bills), bills=len(bills))
+    
+    return bill_ids
+
+def prepare_bill(data):
+    customer_name = data.get('customerName')
+    customer_phone = data.get('customerPhone', '')
+    items = data.get('items', [])
+    
+    if not customer_name or not items:
+        raise ValueError('Customer name and items are required')
+    
+    lines = gst.parse_lines(items)
+    invoice = gst.as_rupees(gst.compute_invoice(lines, GST_ROUNDING))
+    return {
+        'customer_name': customer_name,
+        'customer_phone': customer_phone,
+        'subtotal': invoice['subtotal'],
+        'gst': invoice['gst'],
+        'total': invoice['total'],
+        'gst_breakup': invoice['breakup'],
+        'items': items,
+        'lines': lines
+    }
+
+# What open dashboards are told about new bills
+def bill_event(bill_ids, bills):
+    return {'bills': [
+        {'id': bill_id, 'customer_name': bill['customer_name'], 'total': bill['total']}
+        for bill_id, bill in zip(bill_ids, bills)
+    ]}
+
+def bill_response(bill_id, bill):
+    return {
+        'id': bill_id,
+        'customer_name': bill['customer_name'],
+        'customer_phone': bill['customer_phone'],
+        'subtotal': float(bill['subtotal']),
+        'gst': float(bill['gst']),
+        'total': float(bill['total']),
+        'gst_breakup': [
+            {key: float(value) if key != 'rate' else value for key, value in entry.items()}
+            for entry in bill['gst_breakup']
+        ],
+        'items': bill['items']
+    }
 
 # Enhanced Billing API with Automated Product System
 @app.route('/api/create_bill', methods=['POST'])
 def create_bill():
     try:
         data = request.json
-        customer_name = data.get('customerName')
-        customer_phone = data.get('customerPhone', '')
-        items = data.get('items', [])
         
-        print(f"📝 Creating bill for: {customer_name}")
-        print(f"📞 Phone: {customer_phone}")
-        print(f"📦 Items: {items}")
+        try:
+            bill = prepare_bill(data)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)})
         
-        if not customer_name or not items:
-            return jsonify({'success': False, 'message': 'Customer name and items are required'})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Creating bill', extra={
+                'customer': data.get('customerName'),
+                'items': len(bill['items']),
+                'subtotal': bill['subtotal'],
+                'gst': bill['gst'],
+                'total': bill['total']
+            })
         
-        # Calculate totals with individual GST rates
-        subtotal = 0
-        total_gst = 0
+        quantities = stock_control.collect_quantities(bill['items'])
+        reservation_id = data.get('reservationId')
         
-        for item in items:
-            quantity = float(item['quantity'])
-            price = float(item['price'])
-            gst_rate = float(item.get('gst', 18))  # Default to 18% if not specified
+        # Save bill and items and take stock in one transaction
+        with get_db_connection() as conn:
+            if not conn:
+                return jsonify({'success': False, 'message': 'Database connection failed'})
             
-            item_subtotal = quantity * price
-            item_gst = item_subtotal * (gst_rate / 100)
-            
-            subtotal += item_subtotal
-            total_gst += item_gst
+            cursor = conn.cursor()
+            try:
+                conn.start_transaction()
+                if reservation_id:
+                    changes = stock_control.consume_reservation(cursor, int(reservation_id), quantities)
+                else:
+                    changes = stock_control.decrement_stock(cursor, quantities)
+                bill_id, = insert_bills(cursor, [bill])
+                conn.commit()
+                catalog.apply_stock_changes(changes)
+                notify('bill', bill_event([bill_id], [bill]))
+                notify('stock', changes)
+            except stock_control.InsufficientStock as e:
+                conn.rollback()
+                return jsonify({'success': False, 'message': str(e), 'shortages': e.shortages})
+            except ValueError as e:
+                conn.rollback()
+                return jsonify({'success': False, 'message': str(e)})
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
         
-        total = subtotal + total_gst
+        logger.info('Bill created', extra={'bill_id': bill_id, 'total': bill['total']})
         
-        print(f"💰 Calculated - Subtotal: {subtotal}, GST: {total_gst}, Total: {total}")
+        return jsonify({
+            'success': True,
+            'bill': bill_response(bill_id, bill),
+            'message': 'Bill created successfully'
+        })
         
-        # Save to database
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'message': 'Database connection failed'})
+    except Exception as e:
+        logger.exception('Error creating bill')
+        return jsonify({'success': False, 'message': f'Error creating bill: {str(e)}'})
+
+# Bulk Billing API for end-of-day sync from offline counters
+@app.route('/api/create_bills_bulk', methods=['POST'])
+def create_bills_bulk():
+    try:
+        data = request.json or {}
+        invoices = data.get('bills', [])
         
-        cursor = conn.cursor()
+        if not invoices:
+            return jsonify({'success': False, 'message': 'No bills provided'})
         
-        # Insert bill
-        cursor.execute(
-            "INSERT INTO bills (customer_name, customer_phone, subtotal, gst, total) VALUES (%s, %s, %s, %s, %s)",
-            (customer_name, customer_phone, subtotal, total_gst, total)
-        )
-        bill_id = cursor.lastrowid
+        # Invalid invoices are reported back by position, the rest are saved
+        bills = []
+        positions = []
+        errors = []
+        for index, invoice in enumerate(invoices):
+            try:
+                bills.append(prepare_bill(invoice))
+                positions.append(index)
+            except (ValueError, KeyError, TypeError) as e:
+                errors.append({'index': index, 'message': str(e)})
         
-        # Insert bill items with individual GST rates
-        for item in items:
-            cursor.execute(
-                "INSERT INTO bill_items (bill_id, item_name, quantity, price, gst_rate) VALUES (%s, %s, %s, %s, %s)",
-                (bill_id, item['name'], item['quantity'], item['price'], item.get('gst', 18))
-            )
+        logger.debug('Bulk billing', extra={'valid': len(bills), 'rejected': len(errors)})
         
-        conn.commit()
-        cursor.close()
-        conn.close()
+        # Stock for the whole batch is taken in one statement
+        quantities = stock_control.collect_quantities(item for bill in bills for item in bill['items'])
+        
+        bill_ids = []
+        if bills:
+            with get_db_connection() as conn:
+                if not conn:
+                    return jsonify({'success': False, 'message': 'Database connection failed'})
+                
+                cursor = conn.cursor()
+                try:
+                    conn.start_transaction()
+                    changes = stock_control.decrement_stock(cursor, quantities)
+                    bill_ids = insert_bills(cursor, bills)
+                    conn.commit()
+                    catalog.apply_stock_changes(changes)
+                    notify('bill', bill_event(bill_ids, bills))
+                    notify('stock', changes)
+                except stock_control.InsufficientStock as e:
+                    conn.rollback()
+                    return jsonify({'success': False, 'message': str(e), 'shortages': e.shortages})
+                except Exception:
+                    conn.rollback()
+                    raise
+                finally:
+                    cursor.close()
         
-        print(f"✅ Bill created successfully with ID: {bill_id}")
+        logger.info('Bulk billing saved', extra={'bills': len(bill_ids), 'rejected': len(errors)})
+        
+        return jsonify({
+            'success': not errors,
+            'created': len(bill_ids),
+            'bills': [
+                {'index': index, **bill_response(bill_id, bill)}
+                for index, bill_id, bill in zip(positions, bill_ids, bills)
+            ],
+            'errors': errors,
+            'message': f'{len(bill_ids)} bills created, {len(errors)} rejected'
+        })
+        
+    except Exception as e:
+        logger.exception('Error creating bills')
+        return jsonify({'success': False, 'message': f'Error creating bills: {str(e)}'})
+
+# Store Sync APIs
+# Delta sync API for offline stores (see sync.py). Bodies are gzip-compressed
+# JSON with decimals as strings; the endpoints answer 404 unless SYNC_TOKEN
+# is set.
+def sync_response(payload, status=200):
+    compress = 'gzip' in request.headers.get('Accept-Encoding', '')
+    response = Response(sync.encode(payload, compress), status=status, mimetype='application/json')
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def check_sync_token():
+    if not SYNC_TOKEN:
+        return sync_response({'success': False, 'message': 'Sync is not enabled'}, 404)
+    if not hmac.compare_digest(request.headers.get('X-Sync-Token', '').encode(), SYNC_TOKEN.encode()):
+        return sync_response({'success': False, 'message': 'Invalid sync token'}, 403)
+    return None
+
+@app.route('/api/sync/state')
+def sync_state():
+    denied = check_sync_token()
+    if denied:
+        return denied
+    store = request.args.get('store')
+    if not store:
+        return sync_response({'success': False, 'message': 'Store id is required'}, 400)
+    
+    with get_db_connection() as conn:
+        if not conn:
+            return sync_response({'success': False, 'message': 'Database connection failed'}, 503)
+        acked = sync.acked_seq(conn, store[:64])
+    return sync_response({'success': True, 'acked': acked})
+
+@app.route('/api/sync/push', methods=['POST'])
+def sync_push():
+    denied = check_sync_token()
+    if denied:
+        return denied
+    if (request.content_length or 0) > sync.MAX_BODY_SIZE:
+        return sync_response({'success': False, 'message': 'Sync batch too large'}, 413)
+    try:
+        batch = sync.decode(request.get_data(), request.headers.get('Content-Encoding'))
+    except ValueError as e:
+        return sync_response({'success': False, 'message': str(e)}, 400)
+    
+    with get_db_connection() as conn:
+        if not conn:
+            return sync_response({'success': False, 'message': 'Database connection failed'}, 503)
+        try:
+            acked, conflicts, counts, changes = sync.apply_batch(conn, batch)
+        except sync.SyncGap as e:
+            return sync_response({'success': False, 'message': str(e), 'acked': e.acked}, 409)
+        except (KeyError, TypeError, ValueError, ArithmeticError) as e:
+            return sync_response({'success': False, 'message': f'Malformed sync batch: {e}'}, 400)
+        except mysql.connector.Error as e:
+            logger.error('Error applying sync batch', extra={'store': batch.get('store'), 'error': str(e)})
+            return sync_response({'success': False, 'message': 'Database error'}, 503)
+    
+    catalog.apply_stock_changes(changes)
+    if changes:
+        notify('stock', changes)
+    elif any(counts.values()):
+        dashboard_updates.trigger()
+    logger.info('Sync batch applied', extra={'store': batch['store'], 'acked': acked, **counts,
+                                             'conflicts': len(conflicts)})
+    return sync_response({'success': True, 'acked': acked, 'counts': counts, 'conflicts': conflicts})
+
+@app.route('/api/sync/pull')
+def sync_pull():
+    denied = check_sync_token()
+    if denied:
+        return denied
+    try:
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+        after = int(request.args.get('after', 0))
+        limit = min(max(int(request.args.get('limit', sync.PULL_PAGE_SIZE)), 1), 5000)
+    except ValueError as e:
+        return sync_response({'success': False, 'message': str(e)}, 400)
+    
+    with get_db_connection() as conn:
+        if not conn:
+            return sync_response({'success': False, 'message': 'Database connection failed'}, 503)
+        rows, next_cursor = sync.read_products(conn, since, after, limit)
+    return sync_response({'success': True, 'columns': sync.PRODUCT_FIELDS, 'rows': rows, 'next': next_cursor})
+
+# Stock Reservation APIs
+@app.route('/api/stock/reserve', methods=['POST'])
+def reserve_stock():
+    try:
+        data = request.json or {}
+        quantities = stock_control.collect_quantities(data.get('items', []))
+        ttl = int(data.get('ttl', os.getenv('RESERVATION_TTL', '900')))
+        # Held stock is out of inventory until the reservation expires
+        ttl = min(max(ttl, 1), int(os.getenv('RESERVATION_MAX_TTL', '3600')))
+        
+        if not quantities:
+            return jsonify({'success': False, 'message': 'Items with productId are required'})
+        
+        with get_db_connection() as conn:
+            if not conn:
+                return jsonify({'success': False, 'message': 'Database connection failed'})
+            
+            cursor = conn.cursor()
+            try:
+                conn.start_transaction()
+                expired = stock_control.release_expired_reservations(cursor)
+                reservation_id, expires_at, changes = stock_control.reserve_stock(cursor, quantities, ttl)
+                conn.commit()
+                catalog.apply_stock_changes(stock_control.merge_changes(expired, changes))
+            except stock_control.InsufficientStock as e:
+                conn.rollback()
+                return jsonify({'success': False, 'message': str(e), 'shortages': e.shortages})
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
         
         return jsonify({
             'success': True,
-            'bill': {
-                'id': bill_id,
-                'customer_name': customer_name,
-                'customer_phone': customer_phone,
-                'subtotal': round(subtotal, 2),
-                'gst': round(total_gst, 2),
-                'total': round(total, 2),
-                'items': items
-            },
-            'message': 'Bill created successfully'
+            'reservationId': reservation_id,
+            'expiresAt': expires_at.isoformat(),
+            'message': 'Stock reserved successfully'
         })
         
     except Exception as e:
-        print(f"❌ Error creating bill: {e}")
-        return jsonify({'success': False, 'message': f'Error creating bill: {str(e)}'})
+        logger.exception('Error reserving stock')
+        return jsonify({'success': False, 'message': f'Error reserving stock: {str(e)}'})
 
-# Get Products for Billing System
-@app.route('/api/products')
-def get_products():
+@app.route('/api/stock/release', methods=['POST'])
+def release_stock():
     try:
-        conn = get_db_connection()
+        data = request.json or {}
+        reservation_id = data.get('reservationId')
+        
+        if not reservation_id:
+            return jsonify({'success': False, 'message': 'reservationId is required'})
+        
+        with get_db_connection() as conn:
+            if not conn:
+                return jsonify({'success': False, 'message': 'Database connection failed'})
+            
+            cursor = conn.cursor()
+            try:
+                conn.start_transaction()
+                released = stock_control.release_reservation(cursor, int(reservation_id))
+                conn.commit()
+                if released is not None:
+                    catalog.apply_stock_changes(released)
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+        
+        if released is None:
+            return jsonify({'success': False, 'message': 'Reservation not found, expired or already used'})
+        return jsonify({'success': True, 'message': 'Reservation released'})
+        
+    except Exception as e:
+        logger.exception('Error releasing stock')
+        return jsonify({'success': False, 'message': f'Error releasing stock: {str(e)}'})
+
+def load_catalog():
+    with get_db_connection() as conn:
         if not conn:
-            return jsonify([])
+            return None
         
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT id, product_name as name, price, category, gst_rate as gst 
-            FROM inventory 
-            WHERE status = 'Active' AND stock > 0
-            ORDER BY product_name
-        """)
+        cursor.execute(PRODUCTS_QUERY)
         products = cursor.fetchall()
         cursor.close()
-        conn.close()
+    return products
+
+PRODUCTS_QUERY = """
+    SELECT id, product_name as name, price, category, gst_rate as gst, stock 
+    FROM inventory 
+    WHERE status = 'Active' AND stock > 0
+    ORDER BY product_name
+"""
+
+# Get Products for Billing System
+# Served from the in-process catalog cache; clients sending If-None-Match
+# with the current ETag get a 304 without MySQL being touched.
+@app.route('/api/products')
+def get_products():
+    try:
+        cached = catalog.get(app.json.dumps)
+        if cached is None:
+            products = load_catalog()
+            if products is None:
+                return jsonify([])
+            
+            if catalog.load(products):
+                cached = catalog.get(app.json.dumps)
+            else:
+                for product in products:
+                    del product['stock']
+                return jsonify(products)
         
-        return jsonify(products)
+        body, etag = cached
+        response = app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        return response.make_conditional(request)
         
     except Exception as e:
-        print(f"❌ Error fetching products: {e}")
+        logger.exception('Error fetching products')
         return jsonify([])
 
+SEARCH_FALLBACK_QUERY = """
+    SELECT id, product_name as name, price, category, gst_rate as gst
+    FROM inventory
+    WHERE status = 'Active' AND product_name LIKE %s AND stock > 0
+    ORDER BY product_name
+    LIMIT %s
+"""
+
+# Product search for the billing screen
+# Prefix and typo-tolerant matching on name and category from the catalog's
+# search index. Catalogs too large to cache fall back to a name prefix query.
+@app.route('/api/products/search')
+def search_products():
+    query = request.args.get('q', '').strip()
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), 50))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'limit must be a number'}), 400
+    if not query:
+        return jsonify([])
+    
+    try:
+        results = catalog.search(query, limit)
+        if results is None:
+            products = load_catalog()
+            if products is None:
+                return jsonify([])
+            if catalog.load(products):
+                results = catalog.search(query, limit)
+            else:
+                with get_db_connection() as conn:
+                    if not conn:
+                        return jsonify([])
+                    cursor = conn.cursor(dictionary=True)
+                    cursor.execute(SEARCH_FALLBACK_QUERY, (exporter.like_prefix(query), limit))
+                    results = cursor.fetchall()
+                    cursor.close()
+        
+        return jsonify(results)
+        
+    except Exception as e:
+        logger.exception('Error searching products')
+        return jsonify([])
+
+INVENTORY_COLUMNS = (
+    'id', 'sku', 'product_name', 'category', 'price', 'stock', 'gst_rate',
+    'status', 'description', 'created_at', 'updated_at'
+)
+
+def inventory_query(columns):
+    return f"SELECT {', '.join(columns)} FROM inventory ORDER BY created_at DESC"
+
 # Inventory Management APIs
+# ?fields=id,product_name,... limits the columns returned and
+# ?format=columns returns arrays per column instead of objects per row.
 @app.route('/api/inventory')
 def get_inventory():
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify([])
-        
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT * FROM inventory 
-            ORDER BY created_at DESC
-        """)
-        inventory = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        columns = responses.projection(request.args.get('fields'), INVENTORY_COLUMNS)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    try:
+        with get_db_connection() as conn:
+            if not conn:
+                return jsonify([])
+            
+            inventory = queries.fetch(conn, queries.Query('inventory', inventory_query(columns)))
         
-        return jsonify(inventory)
+        return responses.rows_response(app, inventory)
         
     except Exception as e:
-        print(f"❌ Error fetching inventory: {e}")
+        logger.exception('Error fetching inventory')
         return jsonify([])
 
 @app.route('/api/add_inventory', methods=['POST'])
@@ -606,213 +1413,589 @@ def add_inventory():
         stock = data.get('stock')
         description = data.get('description', '')
         
-        print(f"📦 Adding product: {product_name}, Category: {category}, Price: {price}, Stock: {stock}")
+        logger.debug('Adding product', extra={'product': product_name, 'category': category, 'price': price, 'stock': stock})
         
         if not product_name or not category or not price or not stock:
             return jsonify({'success': False, 'message': 'All fields are required'})
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'message': 'Database connection failed'})
-        
-        cursor = conn.cursor()
+        with get_db_connection() as conn:
+            if not conn:
+                return jsonify({'success': False, 'message': 'Database connection failed'})
+            
+            cursor = conn.cursor()
+            
+            # Insert without gst_rate column
+            cursor.execute(
+                "INSERT INTO inventory (product_name, category, price, stock, description) VALUES (%s, %s, %s, %s, %s)",
+                (product_name, category, price, stock, description)
+            )
+            product_id = cursor.lastrowid
+            conn.commit()
+            cursor.close()
         
-        # Insert without gst_rate column
-        cursor.execute(
-            "INSERT INTO inventory (product_name, category, price, stock, description) VALUES (%s, %s, %s, %s, %s)",
-            (product_name, category, price, stock, description)
-        )
-        conn.commit()
-        cursor.close()
-        conn.close()
+        product = {
+            'id': product_id,
+            'name': product_name,
+            'price': Decimal(str(price)).quantize(Decimal('0.01')),
+            'category': category,
+            'gst': Decimal('18.00'),
+            'stock': int(stock)
+        }
+        catalog.add_product(product)
+        notify('inventory', product)
         
-        print(f"✅ Product '{product_name}' added to inventory successfully!")
+        logger.info('Product added to inventory', extra={'product_id': product_id, 'product': product_name})
         return jsonify({'success': True, 'message': 'Product added to inventory successfully'})
         
     except Exception as e:
-        print(f"❌ Error adding inventory: {e}")
+        logger.exception('Error adding inventory')
         return jsonify({'success': False, 'message': f'Error adding product: {str(e)}'})
 
+# Bulk inventory import
+# Upload a .xlsx or .csv price list as the multipart field "file" with
+# columns sku, product_name, category, price and optionally stock, gst_rate
+# and description. Rows are upserted on sku in the background; poll the
+# returned job for progress and per-row errors.
+@app.route('/api/inventory/import', methods=['POST'])
+def import_inventory():
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'success': False, 'message': 'A file is required'}), 400
+    
+    source_format = importer.file_format(upload.filename)
+    if source_format is None:
+        return jsonify({'success': False, 'message': 'File must be .xlsx or .csv'}), 400
+    
+    try:
+        path = importer.save_upload(upload.stream, '.' + source_format)
+        try:
+            job_id = inventory_imports.create(upload.filename)
+        except Exception:
+            os.remove(path)
+            raise
+        inventory_imports.submit(job_id, path, source_format)
+        logger.info('Inventory import queued', extra={'job_id': job_id, 'upload': upload.filename})
+        return jsonify({'success': True, 'jobId': job_id, 'message': 'Import started'}), 202
+        
+    except Exception as e:
+        logger.exception('Error starting inventory import')
+        return jsonify({'success': False, 'message': f'Error starting import: {str(e)}'})
+
+@app.route('/api/inventory/import/<int:job_id>')
+def import_inventory_status(job_id):
+    job = inventory_imports.status(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Import job not found'}), 404
+    
+    for field in ('created_at', 'finished_at'):
+        if job[field]:
+            job[field] = job[field].isoformat()
+    return jsonify({'success': True, 'job': job})
+
 # History APIs
+# All three endpoints return newest first, 10 rows by default (limit, max 100).
+# When more rows exist the X-Next-Cursor response header carries an opaque
+# cursor; pass it back as ?cursor= to fetch the next page. Optional filters:
+# from / to (YYYY-MM-DD, inclusive) plus status or customer / phone.
+# Like /api/inventory they accept ?fields= (id and the time column are
+# always included) and ?format=columns. Bills and payments also read their
+# archive table when the range reaches into archived months (no from date
+# counts as reaching back to the start).
+
+PAYMENT_COLUMNS = ('id', 'transaction_id', 'amount', 'status', 'verified_at', 'created_at')
+PICKUP_COLUMNS = ('id', 'waste_type', 'quantity', 'pickup_date', 'status', 'scheduled_at')
+BILL_COLUMNS = ('id', 'customer_name', 'customer_phone', 'subtotal', 'gst', 'total', 'created_at')
+
+def select_columns(args, table, allowed, time_column):
+    columns = responses.projection(args.get('fields'), allowed, required=('id', time_column))
+    return f"SELECT {', '.join(columns)} FROM {table}"
+
+def payment_history_query(args, after=None, limit=pagination.DEFAULT_PAGE_SIZE, archived_before=None):
+    conditions, params = pagination.date_range('created_at', args.get('from'), args.get('to'))
+    if args.get('status'):
+        conditions.append("status = %s")
+        params.append(args['status'])
+    queries = [
+        pagination.page_query(select_columns(args, table, PAYMENT_COLUMNS, 'created_at'),
+                              'created_at', conditions, params, after, limit)
+        for table in archive.tables_for('payments', archived_before, args.get('from'))
+    ]
+    return pagination.union_page_query(queries, 'created_at', limit)
+
+def pickup_history_query(args, after=None, limit=pagination.DEFAULT_PAGE_SIZE):
+    conditions, params = pagination.date_range('scheduled_at', args.get('from'), args.get('to'))
+    if args.get('status'):
+        conditions.append("status = %s")
+        params.append(args['status'])
+    base_sql = select_columns(args, 'waste_pickups', PICKUP_COLUMNS, 'scheduled_at')
+    return pagination.page_query(base_sql, 'scheduled_at', conditions, params, after, limit)
+
+def bill_history_query(args, after=None, limit=pagination.DEFAULT_PAGE_SIZE, archived_before=None):
+    conditions, params = pagination.date_range('created_at', args.get('from'), args.get('to'))
+    if args.get('phone'):
+        conditions.append("customer_phone = %s")
+        params.append(args['phone'])
+    if args.get('customer'):
+        conditions.append("customer_name LIKE %s")
+        params.append(exporter.like_prefix(args['customer']))
+    queries = [
+        pagination.page_query(select_columns(args, table, BILL_COLUMNS, 'created_at'),
+                              'created_at', conditions, params, after, limit)
+        for table in archive.tables_for('bills', archived_before, args.get('from'))
+    ]
+    return pagination.union_page_query(queries, 'created_at', limit)
+
+def fetch_history_page(build_query, time_column, archived_table=None):
+    try:
+        cursor_token = request.args.get('cursor')
+        after = pagination.decode_cursor(cursor_token) if cursor_token else None
+        limit = pagination.page_size(request.args.get('limit'))
+        options = {}
+        if archived_table:
+            options['archived_before'] = archive_boundaries.get(archived_table)
+        sql, params = build_query(request.args, after, limit, **options)
+    except ValueError as e:
+        return None, None, (jsonify({'success': False, 'message': str(e)}), 400)
+    
+    result = queries.Result((), [])
+    with get_db_connection() as conn:
+        if conn:
+            result = queries.fetch(conn, queries.Query(request.endpoint, sql), params)
+    
+    rows, next_cursor = pagination.split_page(result.rows, result.columns, limit, time_column)
+    return queries.Result(result.columns, rows), next_cursor, None
+
+def page_response(rows, next_cursor, extra=None):
+    response = responses.rows_response(app, rows, extra)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
 @app.route('/api/payment_history')
 def payment_history():
-    conn = get_db_connection()
-    payments = []
-    if conn:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM payments ORDER BY created_at DESC LIMIT 10")
-        payments = cursor.fetchall()
-        cursor.close()
-        conn.close()
+    payments, next_cursor, error = fetch_history_page(payment_history_query, 'created_at', 'payments')
+    if error:
+        return error
     
-    return jsonify(payments)
+    return page_response(payments, next_cursor)
 
 @app.route('/api/pickup_history')
 def pickup_history():
-    conn = get_db_connection()
-    pickups = []
-    if conn:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM waste_pickups ORDER BY scheduled_at DESC LIMIT 10")
-        pickups = cursor.fetchall()
-        cursor.close()
-        conn.close()
+    pickups, next_cursor, error = fetch_history_page(pickup_history_query, 'scheduled_at')
+    if error:
+        return error
     
-    return jsonify(pickups)
+    return page_response(pickups, next_cursor)
 
 @app.route('/api/bill_history')
 def bill_history():
-    conn = get_db_connection()
-    bills = []
-    if conn:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT b.*, 
-                   COUNT(bi.id) as item_count
-            FROM bills b
-            LEFT JOIN bill_items bi ON b.id = bi.bill_id
-            GROUP BY b.id
-            ORDER BY b.created_at DESC 
-            LIMIT 10
-        """)
-        bills = cursor.fetchall()
-        cursor.close()
-        conn.close()
+    bills, next_cursor, error = fetch_history_page(bill_history_query, 'created_at', 'bills')
+    if error:
+        return error
     
-    # Convert decimal to float for JSON serialization
-    for bill in bills:
-        bill['subtotal'] = float(bill['subtotal'])
-        bill['gst'] = float(bill['gst'])
-        bill['total'] = float(bill['total'])
+    # Item counts only for the bills on this page, which may have been
+    # archived since the page was read
+    bill_ids = bills.column('id') if bills.rows else []
+    counts = {}
+    if bill_ids:
+        with get_db_connection() as conn:
+            if conn:
+                cursor = conn.cursor()
+                placeholders = ', '.join(['%s'] * len(bill_ids))
+                tables = archive.tables_for('bill_items', archive_boundaries.get('bills'), request.args.get('from'))
+                items = ' UNION ALL '.join(f"SELECT bill_id FROM {table} WHERE bill_id IN ({placeholders})"
+                                           for table in tables)
+                cursor.execute(
+                    f"SELECT bill_id, COUNT(*) FROM ({items}) items GROUP BY bill_id",
+                    bill_ids * len(tables)
+                )
+                counts = dict(cursor.fetchall())
+                cursor.close()
     
-    return jsonify(bills)
+    return page_response(bills, next_cursor, {'item_count': [counts.get(bill_id, 0) for bill_id in bill_ids]})
 
 # Reports APIs
+# Totals come from the summary counters kept up to date at write time
 @app.route('/api/reports/summary')
 def get_reports_summary():
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({})
-        
-        cursor = conn.cursor(dictionary=True)
-        
-        # Get total revenue
-        cursor.execute("SELECT COALESCE(SUM(total), 0) as total_revenue FROM bills")
-        revenue = cursor.fetchone()
-        
-        # Get total transactions
-        cursor.execute("SELECT COUNT(*) as total_transactions FROM payments")
-        transactions = cursor.fetchone()
-        
-        # Get success rate
-        cursor.execute("SELECT COUNT(*) as total, SUM(CASE WHEN status='verified' THEN 1 ELSE 0 END) as success FROM payments")
-        success_rate = cursor.fetchone()
-        
-        # Get total bills
-        cursor.execute("SELECT COUNT(*) as total_bills FROM bills")
-        total_bills = cursor.fetchone()
-        
-        # Get waste earnings (simulated)
-        cursor.execute("SELECT COUNT(*) as total_pickups FROM waste_pickups")
-        total_pickups = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn:
+            if not conn:
+                return jsonify({})
+            
+            cursor = conn.cursor()
+            summary = rollups.totals(cursor)
+            cursor.close()
         
-        success_percentage = (success_rate['success'] / success_rate['total'] * 100) if success_rate['total'] > 0 else 0
-        waste_earnings = total_pickups['total_pickups'] * 250  # Simulate ₹250 per pickup
+        success_percentage = (summary['verified_payments'] / summary['payments'] * 100) if summary['payments'] > 0 else 0
+        waste_earnings = summary['pickups'] * 250  # Simulate ₹250 per pickup
         
         return jsonify({
-            'total_revenue': float(revenue['total_revenue']),
-            'total_transactions': transactions['total_transactions'],
-            'success_rate': round(success_percentage, 2),
-            'total_bills': total_bills['total_bills'],
-            'waste_earnings': waste_earnings
+            'total_revenue': float(summary['revenue']),
+            'total_transactions': int(summary['payments']),
+            'success_rate': round(float(success_percentage), 2),
+            'total_bills': int(summary['bills']),
+            'waste_earnings': int(waste_earnings)
         })
         
     except Exception as e:
-        print(f"❌ Error generating reports: {e}")
+        logger.exception('Error generating reports')
         return jsonify({})
 
+# Streams bills with their line items as .xlsx (default) or .csv.
+# Optional filters: from / to (YYYY-MM-DD, inclusive), customer (name
+# prefix) and phone.
 @app.route('/api/export_bills_excel')
 def export_bills_excel():
+    export_format = request.args.get('format', 'xlsx')
+    if export_format not in ('xlsx', 'csv'):
+        return jsonify({'success': False, 'message': 'format must be xlsx or csv'}), 400
+    
     try:
-        conn = get_db_connection()
+        sql, params = exporter.build_query(
+            date_from=request.args.get('from'),
+            date_to=request.args.get('to'),
+            customer=request.args.get('customer'),
+            phone=request.args.get('phone'),
+            archived_before=archive_boundaries.get('bills')
+        )
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be in YYYY-MM-DD format'}), 400
+    
+    # The connection stays checked out while the response streams and goes
+    # back to the pool when the server closes the response
+    resources = ExitStack()
+    conn = resources.enter_context(get_db_connection())
+    if not conn:
+        resources.close()
+        return jsonify({'success': False, 'message': 'Database connection failed'})
+    
+    chunks = exporter.fetch_chunks(conn, sql, params)
+    filename = f"bills_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    if export_format == 'csv':
+        response = Response(exporter.csv_stream(chunks), mimetype='text/csv')
+    else:
+        response = Response(
+            exporter.xlsx_stream(chunks),
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.call_on_close(resources.close)
+    return response
+
+LOW_STOCK_QUERY = "SELECT COUNT(*) as low_stock FROM inventory WHERE stock < 5 AND stock > 0"
+OUT_OF_STOCK_QUERY = "SELECT COUNT(*) as out_of_stock FROM inventory WHERE stock = 0"
+LOW_STOCK = queries.Query('low_stock', LOW_STOCK_QUERY)
+OUT_OF_STOCK = queries.Query('out_of_stock', OUT_OF_STOCK_QUERY)
+
+def fetch_dashboard_stats():
+    with get_db_connection() as conn:
         if not conn:
-            return jsonify({'success': False, 'message': 'Database connection failed'})
+            return None
         
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT b.*, bi.item_name, bi.quantity, bi.price, bi.gst_rate
-            FROM bills b
-            LEFT JOIN bill_items bi ON b.id = bi.bill_id
-            ORDER BY b.created_at DESC
-        """)
-        bills_data = cursor.fetchall()
-        cursor.close()
-        conn.close()
         
-        # In a real application, you would generate an Excel file here
-        # For now, we'll return the data as JSON
-        return jsonify({
-            'success': True,
-            'message': f'Found {len(bills_data)} bills for export',
-            'data': bills_data
-        })
+        # Today's revenue and transactions from the daily rollups
+        today = rollups.day_totals(cursor, datetime.now().date())
+        cursor.close()
         
-    except Exception as e:
-        print(f"❌ Error exporting bills: {e}")
-        return jsonify({'success': False, 'message': f'Error exporting bills: {str(e)}'})
+        # Low stock and out of stock items
+        low_stock = queries.fetch(conn, LOW_STOCK).first()
+        out_of_stock = queries.fetch(conn, OUT_OF_STOCK).first()
+    
+    return {
+        'today_revenue': float(today['revenue']),
+        'today_transactions': int(today['payments']),
+        'low_stock_items': low_stock.low_stock,
+        'out_of_stock_items': out_of_stock.out_of_stock
+    }
 
 # Dashboard Statistics
 @app.route('/api/dashboard/stats')
 def dashboard_stats():
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({})
-        
-        cursor = conn.cursor(dictionary=True)
-        
-        # Get today's date for filtering
-        today = datetime.now().date()
-        
-        # Today's revenue
-        cursor.execute("SELECT COALESCE(SUM(total), 0) as today_revenue FROM bills WHERE DATE(created_at) = %s", (today,))
-        today_revenue = cursor.fetchone()
+        return jsonify(fetch_dashboard_stats() or {})
         
-        # Today's transactions
-        cursor.execute("SELECT COUNT(*) as today_transactions FROM payments WHERE DATE(created_at) = %s", (today,))
-        today_transactions = cursor.fetchone()
+    except Exception as e:
+        logger.exception('Error fetching dashboard stats')
+        return jsonify({})
+
+# Live dashboard updates
+# Writes publish their delta after committing and schedule one recount of the
+# dashboard stats, shared by every open dashboard and at most one per
+# EVENTS_STATS_DELAY seconds however many writes arrive. Only a worker with
+# open dashboards recounts.
+def publish_dashboard_stats():
+    if not broker.has_subscribers():
+        return
+    try:
+        stats = fetch_dashboard_stats()
+    except Exception:
+        logger.exception('Error publishing dashboard stats')
+        return
+    if stats is not None:
+        broker.publish('stats', stats)
+
+dashboard_updates = events.Debouncer(publish_dashboard_stats, delay=float(os.getenv('EVENTS_STATS_DELAY', '1')))
+# Stats are not relayed: writes in other workers trigger this worker's recount
+event_relay.on_received = dashboard_updates.trigger
+
+def notify(topic, data):
+    broker.publish(topic, data)
+    dashboard_updates.trigger()
+
+EVENT_TOPICS = ('stats', 'bill', 'payment', 'pickup', 'inventory', 'stock')
+EVENTS_HEARTBEAT = 15
+EVENTS_STREAM_SECONDS = int(os.getenv('EVENTS_STREAM_SECONDS', '300'))
+
+# Server-sent events for the dashboard: stats, bill, payment, pickup,
+# inventory and stock (product id -> stock change), plus resync when the
+# client fell behind and should refetch. ?topics=a,b narrows the stream.
+# Streams end after EVENTS_STREAM_SECONDS and EventSource reconnects with
+# Last-Event-ID, so a worker's threads are handed back now and then.
+@app.route('/api/events')
+def event_stream():
+    topics = None
+    if request.args.get('topics'):
+        topics = {topic.strip() for topic in request.args['topics'].split(',')}
+        unknown = topics.difference(EVENT_TOPICS)
+        if unknown:
+            return jsonify({'success': False, 'message': f"Unknown topic(s): {', '.join(sorted(unknown))}"}), 400
+    
+    try:
+        subscription = broker.subscribe(topics, request.headers.get('Last-Event-ID'))
+    except events.TooManySubscribers:
+        response = jsonify({'success': False, 'message': 'Too many open event streams'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+    
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            deadline = time.monotonic() + EVENTS_STREAM_SECONDS
+            while time.monotonic() < deadline:
+                batch = subscription.get(EVENTS_HEARTBEAT)
+                if batch is None:
+                    return
+                if not batch:
+                    yield ': ping\n\n'
+                    continue
+                yield ''.join(events.format_sse(event) for event in batch)
+        finally:
+            subscription.close()
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute summary counters and daily rollups from the base tables."""
+    with get_db_connection() as conn:
+        if not conn:
+            print("❌ Cannot connect to database. Please check your MySQL connection.")
+            return
         
-        # Low stock items
-        cursor.execute("SELECT COUNT(*) as low_stock FROM inventory WHERE stock < 5 AND stock > 0")
-        low_stock = cursor.fetchone()
+        cursor = conn.cursor()
+        try:
+            conn.start_transaction()
+            rollups.rebuild(cursor)
+            conn.commit()
+            print("✅ Summary rollups rebuilt")
+        except mysql.connector.Error as e:
+            conn.rollback()
+            print(f"❌ Error rebuilding rollups: {e}")
+        finally:
+            cursor.close()
+
+@app.cli.command('archive')
+@click.option('--keep-months', type=int, default=lambda: int(os.getenv('ARCHIVE_KEEP_MONTHS', '12')),
+              help='Closed months to keep in the hot tables.')
+def archive_command(keep_months):
+    """Move closed months of bills and payments to the archive tables."""
+    with get_db_connection() as conn:
+        if not conn:
+            print("❌ Cannot connect to database. Please check your MySQL connection.")
+            raise SystemExit(1)
         
-        # Out of stock items
-        cursor.execute("SELECT COUNT(*) as out_of_stock FROM inventory WHERE stock = 0")
-        out_of_stock = cursor.fetchone()
+        try:
+            archived = archive.archive_closed_periods(conn, keep_months)
+        except mysql.connector.Error as e:
+            print(f"❌ Error archiving: {e}")
+            raise SystemExit(1)
+    
+    for table, month, rows in archived:
+        print(f"✅ {table} {month:%Y-%m}: {rows} rows archived")
+    if not archived:
+        print("✅ Nothing to archive")
+
+@app.cli.command('sync')
+def sync_command():
+    """Push pending changes to the central server and pull inventory."""
+    if not sync_client.url:
+        print("❌ SYNC_SERVER_URL is not set")
+        raise SystemExit(1)
+    
+    try:
+        summary = sync_client.sync()
+    except (sync.SyncError, OSError, mysql.connector.Error) as e:
+        print(f"❌ Sync failed: {e}")
+        raise SystemExit(1)
+    
+    for conflict in summary['conflicts']:
+        print(f"⚠️  Conflict: {conflict}")
+    print(f"✅ {summary['changes']} changes pushed in {summary['batches']} batches, "
+          f"{summary['pulled']} products pulled ({summary['seconds']}s)")
+
+@app.cli.command('hash-passwords')
+def hash_passwords_command():
+    """Hash user passwords still stored in plaintext."""
+    with get_db_connection() as conn:
+        if not conn:
+            print("❌ Cannot connect to database. Please check your MySQL connection.")
+            raise SystemExit(1)
         
-        cursor.close()
-        conn.close()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT id, password FROM users")
+            plaintext = [(user_id, password) for user_id, password in cursor.fetchall() if not auth.is_hashed(password)]
+            for user_id, password in plaintext:
+                cursor.execute("UPDATE users SET password = %s WHERE id = %s",
+                               (password_hasher.hash(password), user_id))
+            conn.commit()
+        except mysql.connector.Error as e:
+            print(f"❌ Error hashing passwords: {e}")
+            raise SystemExit(1)
+        finally:
+            cursor.close()
+    
+    print(f"✅ {len(plaintext)} passwords hashed")
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations."""
+    with get_db_connection() as conn:
+        if not conn:
+            print("❌ Cannot connect to database. Please check your MySQL connection.")
+            return
         
-        return jsonify({
-            'today_revenue': float(today_revenue['today_revenue']),
-            'today_transactions': today_transactions['today_transactions'],
-            'low_stock_items': low_stock['low_stock'],
-            'out_of_stock_items': out_of_stock['out_of_stock']
-        })
+        applied = migrations.migrate(conn)
+        for version, description in applied:
+            print(f"✅ Migration {version} applied: {description}")
+        if not applied:
+            print("✅ Schema is up to date")
+
+# Queries on the request path that must be served from an index. The
+# inventory listing (GET /api/inventory) is left out: it returns every
+# product, so it reads the whole table whatever the plan, and sorting the
+# rows costs less than fetching each one through idx_inventory_created.
+HOT_QUERIES = [
+    ('products', PRODUCTS_QUERY, ()),
+    ('product_search_fallback', SEARCH_FALLBACK_QUERY, ('note%', 10)),
+    ('payment_history', *payment_history_query({})),
+    ('payment_history_by_status', *payment_history_query({'status': 'verified'}, after=(datetime(2024, 1, 31), 1000))),
+    ('pickup_history', *pickup_history_query({'from': '2024-01-01', 'to': '2024-01-31'})),
+    ('bill_history', *bill_history_query({}, after=(datetime(2024, 1, 31), 1000))),
+    ('bill_history_by_phone', *bill_history_query({'phone': '9876543210'})),
+    ('bill_history_archived', *bill_history_query({'from': '2023-01-01'}, archived_before=datetime(2024, 1, 1))),
+    ('payment_history_archived', *payment_history_query({'status': 'failed'}, archived_before=datetime(2024, 1, 1))),
+    ('export_bills', *exporter.build_query(date_from='2024-01-01', date_to='2024-01-31')),
+    ('export_bills_by_phone', *exporter.build_query(phone='9876543210')),
+    ('export_bills_archived', *exporter.build_query(date_from='2023-01-01', date_to='2023-03-31',
+                                                    archived_before=datetime(2024, 1, 1))),
+    ('low_stock', LOW_STOCK_QUERY, ()),
+    ('out_of_stock', OUT_OF_STOCK_QUERY, ()),
+]
+
+@app.cli.command('explain-queries')
+def explain_queries_command():
+    """Fail if any hot query plans a table access without an index."""
+    with get_db_connection() as conn:
+        if not conn:
+            print("❌ Cannot connect to database. Please check your MySQL connection.")
+            raise SystemExit(1)
+        if storage.dialect(conn) != 'mysql':
+            print("❌ explain-queries reads MySQL query plans; run it with DB_BACKEND=mysql")
+            raise SystemExit(1)
         
-    except Exception as e:
-        print(f"❌ Error fetching dashboard stats: {e}")
-        return jsonify({})
+        failures = migrations.unindexed_queries(conn, HOT_QUERIES)
+    
+    for name, rows in failures.items():
+        for row in rows:
+            print(f"❌ {name}: {row['table']} type={row['type']} rows={row['rows']} extra={row.get('Extra')}")
+    if failures:
+        raise SystemExit(1)
+    print(f"✅ All {len(HOT_QUERIES)} hot queries use an index")
 
-if __name__ == '__main__':
-    print("🔧 Initializing database...")
+@app.cli.command('init-db')
+def init_db_command():
+    """Create tables, apply migrations and load sample data."""
     create_tables()
-    print("\n🚀 Starting MSME Business Hub...")
-    print("📊 Database tables initialized successfully!")
+
+# Application lifecycle
+# Production workers build the app through create_app() (see gunicorn.conf.py);
+# the schema is created once, separately, with `flask --app app init-db`.
+_started = False
+_lifecycle_lock = threading.Lock()
+
+# Preload what the first requests would otherwise pay for: a few pooled
+# connections, the billing catalog and replay of unfinished verifications
+# and journaled pickups
+def warm_up():
+    pool.warm(int(os.getenv('DB_POOL_WARM', '2')))
+    products = load_catalog()
+    if products is not None:
+        catalog.load(products)
+    verification_pool.start()
+    pickup_queue.start()
+
+# End event streams, let in-flight verifications finish, then close pooled
+# connections
+def shutdown():
+    global _started
+    with _lifecycle_lock:
+        if not _started:
+            return
+        _started = False
+    broker.close()
+    dashboard_updates.cancel()
+    verification_pool.stop(drain=True, timeout=float(os.getenv('SHUTDOWN_TIMEOUT', '30')))
+    inventory_imports.stop()
+    pickup_queue.stop()
+    sync_client.stop()
+    event_relay.stop()
+    password_hasher.close()
+    pool.close()
+
+def create_app():
+    global _started
+    with _lifecycle_lock:
+        if _started:
+            return app
+        _started = True
+    # Client address, scheme and host from the trusted proxies' X-Forwarded-* headers
+    if TRUSTED_PROXIES:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES,
+                                x_host=TRUSTED_PROXIES)
+    if os.getenv('WARM_UP', '1') == '1':
+        warm_up()
+    if event_relay.interval > 0:
+        event_relay.start()
+    if sync_client.url:
+        if db.BACKEND == 'sqlite':
+            sync_client.start()
+        else:
+            logger.warning('SYNC_SERVER_URL ignored: only an offline store on DB_BACKEND=sqlite syncs')
+    atexit.register(shutdown)
+    return app
+
+if __name__ == '__main__':
+    create_app()
+    print("\n🚀 Starting MSME Business Hub (development server)...")
+    print("📊 Create tables once with: flask --app app init-db")
+    print("🏭 For production run: gunicorn -c gunicorn.conf.py 'app:create_app()'")
     print("🌐 Backend running on http://localhost:5000")
     print("📱 Open frontend/index.html in your browser to use the application")
     print("\n👤 Login Credentials:")
@@ -826,5 +2009,4 @@ if __name__ == '__main__':
     print("   ✅ Business Guides")
     print("   ✅ Analytics & Reports")
     print("\nPress CTRL+C to stop the server")
-    app.run(debug=True)
-    
\ No newline at end of file
+    app.run(debug=os.getenv('FLASK_DEBUG') == '1', threaded=True, use_reloader=False)
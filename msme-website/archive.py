@@ -0,0 +1,208 @@
+import threading
+import time
+from datetime import datetime
+
+
+# Hot/cold split for bills, bill_items and payments.
+#
+# Closed months are moved out of the hot tables into *_archive tables with
+# the same columns and indexes, stored ROW_FORMAT=COMPRESSED. MySQL range
+# partitioning is not an option here: partitioned InnoDB tables cannot have
+# foreign keys (bill_items, verification_jobs) and every unique key would
+# have to include created_at, which would break uq_payments_transaction.
+#
+# archive_state keeps, per table, the time before which rows may live in the
+# archive. Readers always query the hot table, which answers a range holding
+# none of its rows with a single index seek, and add the archive table in
+# the same statement only when their time range starts before that boundary,
+# so recent history never touches the archive. archived_periods lists the
+# months that have been moved and how many rows each held.
+#
+# Readers cache the boundaries for BOUNDARY_TTL seconds. The archive job
+# therefore raises a boundary first and waits out the cache before moving
+# any row past it; each chunk of rows then moves in one transaction, and a
+# reader sees it in exactly one of the two tables.
+#
+# The archive tables are created by migration 7; a later migration that adds
+# a column to bills, bill_items or payments must add it there as well.
+# Transaction ids of archived payments are no longer seen by the duplicate
+# check in /api/verify_payment.
+
+BOUNDARY_TTL = 30
+CHUNK_SIZE = 1000
+
+ARCHIVES = {
+    'bills': 'bills_archive',
+    'bill_items': 'bill_items_archive',
+    'payments': 'payments_archive',
+}
+
+BILL_COLUMNS = 'id, customer_name, customer_phone, subtotal, gst, total, created_at, sync_key'
+BILL_ITEM_COLUMNS = 'id, bill_id, item_name, quantity, price, gst_rate'
+PAYMENT_COLUMNS = 'id, transaction_id, amount, status, verified_at, created_at'
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+# Tables a query on `table` over rows from `date_from` (YYYY-MM-DD, or None
+# for no lower bound) has to read, given the table's archive boundary
+def tables_for(table, archived_before, date_from=None):
+    start = datetime.strptime(date_from, '%Y-%m-%d') if date_from else None
+    if archived_before is not None and (start is None or start < archived_before):
+        return [table, ARCHIVES[table]]
+    return [table]
+
+
+class Boundaries:
+    def __init__(self, get_connection, ttl=BOUNDARY_TTL):
+        self.get_connection = get_connection
+        self.ttl = ttl
+        self._values = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    # Archive boundary of `table`, or None while nothing has been archived
+    def get(self, table):
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+                self._load()
+            return self._values.get(table)
+
+    def _load(self):
+        with self.get_connection() as conn:
+            if not conn:
+                return  # keep the last known boundaries
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT table_name, archived_before FROM archive_state")
+                self._values = dict(cursor.fetchall())
+            finally:
+                cursor.close()
+        self._loaded_at = time.monotonic()
+
+
+def _raise_boundary(cursor, table, cutoff):
+    cursor.execute(
+        "INSERT INTO archive_state (table_name, archived_before) VALUES (%s, %s) "
+        "ON DUPLICATE KEY UPDATE archived_before = GREATEST(archived_before, VALUES(archived_before))",
+        (table, cutoff)
+    )
+
+
+def _move_bills(cursor, ids):
+    placeholders = ', '.join(['%s'] * len(ids))
+    cursor.execute(
+        f"INSERT INTO bill_items_archive ({BILL_ITEM_COLUMNS}) "
+        f"SELECT {BILL_ITEM_COLUMNS} FROM bill_items WHERE bill_id IN ({placeholders})",
+        ids
+    )
+    cursor.execute(
+        f"INSERT INTO bills_archive ({BILL_COLUMNS}) SELECT {BILL_COLUMNS} FROM bills WHERE id IN ({placeholders})",
+        ids
+    )
+    cursor.execute(f"DELETE FROM bill_items WHERE bill_id IN ({placeholders})", ids)
+    cursor.execute(f"DELETE FROM bills WHERE id IN ({placeholders})", ids)
+
+
+def _move_payments(cursor, ids):
+    placeholders = ', '.join(['%s'] * len(ids))
+    cursor.execute(
+        f"INSERT INTO payments_archive ({PAYMENT_COLUMNS}) "
+        f"SELECT {PAYMENT_COLUMNS} FROM payments WHERE id IN ({placeholders})",
+        ids
+    )
+    # Finished verification jobs go with them; only their payment mattered
+    cursor.execute(f"DELETE FROM verification_jobs WHERE payment_id IN ({placeholders})", ids)
+    cursor.execute(f"DELETE FROM payments WHERE id IN ({placeholders})", ids)
+
+
+# table -> (mover, rows that must stay in the hot table). Payments still
+# pending verification are held back, and so is their month and every
+# later one, so the archive never holds a month only partly.
+_TABLES = {
+    'bills': (_move_bills, None),
+    'payments': (_move_payments, "status = 'pending'"),
+}
+
+
+def _move_month(conn, table, start, end, chunk_size):
+    mover, _ = _TABLES[table]
+    cursor = conn.cursor()
+    moved = 0
+    try:
+        while True:
+            conn.start_transaction()
+            cursor.execute(
+                f"SELECT id FROM {table} WHERE created_at >= %s AND created_at < %s "
+                f"ORDER BY created_at LIMIT %s FOR UPDATE",
+                (start, end, chunk_size)
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                conn.commit()
+                break
+            mover(cursor, ids)
+            conn.commit()
+            moved += len(ids)
+        if not moved:
+            return 0
+        cursor.execute(
+            "INSERT INTO archived_periods (table_name, period, row_count) VALUES (%s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE row_count = row_count + VALUES(row_count), archived_at = CURRENT_TIMESTAMP",
+            (table, start.date(), moved)
+        )
+        conn.commit()
+        return moved
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# Move every month that closed more than `keep_months` months before `now`
+# into the archive. Returns [(table, month, rows moved)]. Re-running after a
+# failure picks up where the last run stopped.
+def archive_closed_periods(conn, keep_months, now=None, chunk_size=CHUNK_SIZE, wait=BOUNDARY_TTL + 1):
+    cutoff = add_months(month_start(now or datetime.now()), -keep_months)
+    cursor = conn.cursor()
+    plans = {}
+    try:
+        for table, (_, held) in _TABLES.items():
+            table_cutoff = cutoff
+            if held:
+                cursor.execute(f"SELECT MIN(created_at) FROM {table} WHERE created_at < %s AND {held}", (cutoff,))
+                oldest_held = cursor.fetchone()[0]
+                if oldest_held is not None:
+                    table_cutoff = month_start(oldest_held)
+            cursor.execute(f"SELECT MIN(created_at) FROM {table} WHERE created_at < %s", (table_cutoff,))
+            oldest = cursor.fetchone()[0]
+            if oldest is None:
+                continue
+            _raise_boundary(cursor, table, table_cutoff)
+            conn.commit()
+            plans[table] = (month_start(oldest), table_cutoff)
+    finally:
+        cursor.close()
+
+    if not plans:
+        return []
+    # Let every reader's cached boundary catch up before rows move
+    time.sleep(wait)
+
+    archived = []
+    for table, (start, table_cutoff) in plans.items():
+        while start < table_cutoff:
+            end = add_months(start, 1)
+            moved = _move_month(conn, table, start, end, chunk_size)
+            if moved:
+                archived.append((table, start.date(), moved))
+            start = end
+    return archived
@@ -0,0 +1,243 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Password hashing, credential cache, signed session tokens and login
+# lockouts.
+#
+# Passwords are stored as "pbkdf2_sha256$<iterations>$<salt>$<hash>", with
+# a random 16-byte salt each. Hashes run on a small thread pool, one thread
+# per core by default: PBKDF2 releases the GIL while it runs, so logins
+# use every core without starving the request threads, and at most
+# `max_pending` of them queue before more are refused. Unknown usernames
+# are checked against a dummy hash of the same cost, so a failed login takes
+# as long whether the user exists or not. Stored hashes with fewer
+# iterations than the current cost, and plaintext passwords from before
+# hashing, still verify and are rehashed on the next successful login.
+#
+# A token is "<payload>.<signature>": base64url JSON claims (sub, uid, exp)
+# and their HMAC-SHA256. Checking one needs no database. A token cannot be
+# revoked before it expires, short of changing the secret.
+#
+# Credentials and lockout counters live in this process; under gunicorn each
+# worker counts failures on its own.
+
+ALGORITHM = 'pbkdf2_sha256'
+ITERATIONS = 600000
+SALT_SIZE = 16
+
+
+class Busy(Exception):
+    pass
+
+
+class Unavailable(Exception):
+    pass
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _derive(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+
+
+# (iterations, salt, digest) of a stored hash, or None for a plaintext password
+def _parse(encoded):
+    try:
+        algorithm, iterations, salt, digest = encoded.split('$')
+        if algorithm == ALGORITHM:
+            return int(iterations), _b64decode(salt), _b64decode(digest)
+    except ValueError:
+        pass
+    return None
+
+
+def is_hashed(encoded):
+    return _parse(encoded) is not None
+
+
+class PasswordHasher:
+    def __init__(self, iterations=ITERATIONS, workers=None, max_pending=64):
+        self.iterations = iterations
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        self._dummy = (iterations, os.urandom(SALT_SIZE), os.urandom(32))
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.hashed = 0
+        self.refused = 0
+
+    # Run fn on the hashing pool and wait for it
+    def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.refused += 1
+                raise Busy('Too many logins in progress')
+            self._pending += 1
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self.hashed += 1
+
+    def _hash(self, password):
+        salt = os.urandom(SALT_SIZE)
+        digest = _derive(password, salt, self.iterations)
+        return f'{ALGORITHM}${self.iterations}${_b64encode(salt)}${_b64encode(digest)}'
+
+    def _verify(self, password, encoded):
+        parsed = _parse(encoded) if encoded is not None else None
+        iterations, salt, digest = parsed or self._dummy
+        matches = hmac.compare_digest(_derive(password, salt, iterations), digest)
+        if parsed:
+            return matches
+        # Unknown user (always fails) or a plaintext password from before hashing
+        return encoded is not None and hmac.compare_digest(password.encode('utf-8'), encoded.encode('utf-8'))
+
+    def hash(self, password):
+        return self._run(self._hash, password)
+
+    # Check a password against a stored hash; `encoded` None means no such user
+    def verify(self, password, encoded):
+        return self._run(self._verify, password, encoded)
+
+    def needs_rehash(self, encoded):
+        parsed = _parse(encoded)
+        return parsed is None or parsed[0] != self.iterations
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        with self._lock:
+            return {'iterations': self.iterations, 'workers': self.workers,
+                    'pending': self._pending, 'hashed': self.hashed, 'refused': self.refused}
+
+
+# Users by username, loaded with `load(username)` (a record or None) and
+# kept for `ttl` seconds, or `negative_ttl` for usernames that do not exist
+class CredentialCache:
+    def __init__(self, load, ttl=300.0, negative_ttl=30.0, capacity=10000):
+        self.load = load
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.capacity = capacity
+        self._entries = OrderedDict()  # username -> (record, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(username)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        record = self.load(username)
+        self.put(username, record)
+        return record
+
+    def put(self, username, record):
+        expires_at = time.monotonic() + (self.ttl if record is not None else self.negative_ttl)
+        with self._lock:
+            self._entries[username] = (record, expires_at)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class TokenSigner:
+    def __init__(self, secret, ttl=43200):
+        self._key = secret.encode('utf-8') if isinstance(secret, str) else secret
+        self.ttl = ttl
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self._key, payload.encode('utf-8'), hashlib.sha256).digest())
+
+    def issue(self, username, user_id):
+        claims = {'sub': username, 'uid': user_id, 'exp': int(time.time()) + self.ttl}
+        payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+        return f'{payload}.{self._sign(payload)}'
+
+    # Claims of a valid, unexpired token, else None
+    def verify(self, token):
+        payload, _, signature = token.partition('.')
+        if not signature or not hmac.compare_digest(signature.encode('utf-8'), self._sign(payload).encode('ascii')):
+            return None
+        try:
+            claims = json.loads(_b64decode(payload))
+        except ValueError:
+            return None
+        if claims.get('exp', 0) < time.time():
+            return None
+        return claims
+
+
+# Per-username failed login counters. `max_failures` failures, each within
+# `window` seconds of the last, lock the username for `lockout` seconds.
+class Lockouts:
+    def __init__(self, max_failures=5, window=900.0, lockout=300.0, capacity=100000):
+        self.max_failures = max_failures
+        self.window = window
+        self.lockout = lockout
+        self.capacity = capacity
+        self._entries = OrderedDict()  # username -> [failures, last_failure, locked_until]
+        self._lock = threading.Lock()
+        self.locked = 0
+
+    # Seconds the username stays locked, or 0
+    def locked_for(self, username):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            return max(entry[2] - now, 0.0) if entry is not None else 0.0
+
+    def failed(self, username):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or now - entry[1] > self.window:
+                entry = self._entries[username] = [0, now, 0.0]
+            self._entries.move_to_end(username)
+            entry[0] += 1
+            entry[1] = now
+            if entry[0] >= self.max_failures:
+                entry[0] = 0
+                entry[2] = now + self.lockout
+                self.locked += 1
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def succeeded(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def stats(self):
+        with self._lock:
+            return {'tracked': len(self._entries), 'locked': self.locked}
@@ -0,0 +1,111 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+# Latency of interactive billing (POST /api/create_bill) while bulk jobs
+# (POST /api/create_bills_bulk) run alongside, with admission control off
+# and on. Clients go through the Flask test client, back to back; bulk
+# clients wait out Retry-After when shed, as a sync client or import would.
+#
+#   python benchmarks/bench_admission.py --clients 8 --bulk-clients 4 --seconds 10
+#   python benchmarks/bench_admission.py --backend mysql   # scratch database!
+
+
+def percentile(latencies, fraction):
+    return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1000
+
+
+def run(app, seconds, clients, bulk_clients, bill, bulk):
+    latencies = []
+    counts = {'bills': 0, 'bulk_bills': 0, 'interactive_429': 0, 'bulk_429': 0, 'failed': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def interactive():
+        client = app.app.test_client()
+        local = []
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            response = client.post('/api/create_bill', json=bill)
+            local.append(time.perf_counter() - start)
+            key = 'bills' if response.status_code == 200 and response.get_json()['success'] else \
+                'interactive_429' if response.status_code == 429 else 'failed'
+            with lock:
+                counts[key] += 1
+        with lock:
+            latencies.extend(local)
+
+    def background():
+        client = app.app.test_client()
+        while time.monotonic() < deadline:
+            response = client.post('/api/create_bills_bulk', json=bulk)
+            if response.status_code == 429:
+                with lock:
+                    counts['bulk_429'] += 1
+                time.sleep(min(response.get_json()['retryAfter'], max(deadline - time.monotonic(), 0)))
+                continue
+            with lock:
+                counts['bulk_bills' if response.get_json()['success'] else 'failed'] += len(bulk['bills'])
+
+    threads = [threading.Thread(target=interactive) for _ in range(clients)]
+    threads += [threading.Thread(target=background) for _ in range(bulk_clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Interactive billing latency under bulk load, admission control off/on')
+    parser.add_argument('--backend', choices=('sqlite', 'mysql'), default='sqlite')
+    parser.add_argument('--clients', type=int, default=8, help='Interactive billing clients')
+    parser.add_argument('--bulk-clients', type=int, default=4)
+    parser.add_argument('--bulk-size', type=int, default=500, help='Bills per bulk request')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--target-latency', type=float, default=0.1, help='ADMISSION_TARGET_LATENCY')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench_admission_')
+    os.environ.update(
+        DB_BACKEND=args.backend, SQLITE_PATH=os.path.join(directory, 'msme.db'),
+        PICKUP_JOURNAL=os.path.join(directory, 'journal.db'), WARM_UP='0', EVENTS_RELAY_INTERVAL='0', LOG_LEVEL='error',
+        RATE_LIMIT_RATE='0', ADMISSION_TARGET_LATENCY=str(args.target_latency)
+    )
+    import app
+
+    app.create_tables()
+    with app.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE inventory SET stock = %s", (10 ** 8,))
+        cursor.execute("SELECT id, product_name, price, gst_rate FROM inventory WHERE status = 'Active' LIMIT 3")
+        products = cursor.fetchall()
+        conn.commit()
+        cursor.close()
+
+    bill = {'customerName': 'Bench Customer', 'customerPhone': '9000000000', 'items': [
+        {'productId': product_id, 'name': name, 'price': float(price), 'quantity': 1, 'gst': float(rate)}
+        for product_id, name, price, rate in products
+    ]}
+    bulk = {'bills': [bill] * args.bulk_size}
+
+    print(f"backend={args.backend} clients={args.clients} bulk_clients={args.bulk_clients} "
+          f"bulk_size={args.bulk_size} limit={app.admission_control.limit} bulk_limit={app.admission_control.bulk_limit}")
+    for enabled in (False, True):
+        app.ADMISSION_CONTROL = enabled
+        latencies, counts = run(app, args.seconds, args.clients, args.bulk_clients, bill, bulk)
+        print(f"admission {'on ' if enabled else 'off'}  create_bill p50 {percentile(latencies, 0.5):8.1f} ms"
+              f"   p99 {percentile(latencies, 0.99):8.1f} ms   {counts['bills'] / args.seconds:7.1f} bills/s"
+              f"   bulk {counts['bulk_bills'] / args.seconds:7.1f} bills/s"
+              f"   429s {counts['interactive_429']}/{counts['bulk_429']}   failed {counts['failed']}")
+    app.pool.close()
+
+
+if __name__ == '__main__':
+    main()
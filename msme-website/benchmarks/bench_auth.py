@@ -0,0 +1,115 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+# Login throughput at a given hash cost, and what identifying the caller of
+# every other request costs once it holds a token. Logins go through the
+# Flask test client from --threads clients, each as its own user, so the
+# hashing pool (AUTH_HASH_WORKERS, one thread per core by default) is the
+# bottleneck; failed logins for unknown users show the same latency.
+#
+#   python benchmarks/bench_auth.py --iterations 600000 --threads 8 --logins 200
+#   python benchmarks/bench_auth.py --backend mysql   # scratch database!
+
+
+def run_threads(threads, count, work):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(number):
+        local = []
+        for _ in range(count // threads):
+            start = time.perf_counter()
+            work(number)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=client, args=(number,)) for number in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start, sorted(latencies)
+
+
+def report(name, count, elapsed, latencies):
+    print(f"{name:<26} {count / elapsed:>9.1f} /s"
+          f"   p50 {latencies[len(latencies) // 2] * 1000:8.2f} ms"
+          f"   p99 {latencies[int(len(latencies) * 0.99)] * 1000:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login throughput at a hash cost')
+    parser.add_argument('--backend', choices=('sqlite', 'mysql'), default='sqlite')
+    parser.add_argument('--iterations', type=int, default=600000, help='AUTH_HASH_ITERATIONS')
+    parser.add_argument('--workers', type=int, default=0, help='AUTH_HASH_WORKERS (0: one per core)')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--logins', type=int, default=200)
+    args = parser.parse_args()
+    count = args.logins - args.logins % args.threads
+
+    directory = tempfile.mkdtemp(prefix='bench_auth_')
+    os.environ.update(
+        DB_BACKEND=args.backend, SQLITE_PATH=os.path.join(directory, 'msme.db'),
+        PICKUP_JOURNAL=os.path.join(directory, 'journal.db'), WARM_UP='0', EVENTS_RELAY_INTERVAL='0', LOG_LEVEL='error',
+        AUTH_HASH_ITERATIONS=str(args.iterations), AUTH_HASH_WORKERS=str(args.workers),
+        AUTH_MAX_FAILURES=str(10 ** 9)
+    )
+    import app
+
+    app.create_tables()
+    users = [f'bench_user_{number}' for number in range(args.threads)]
+    with app.get_db_connection() as conn:
+        cursor = conn.cursor()
+        for username in users:
+            cursor.execute("INSERT INTO users (username, password) VALUES (%s, %s)",
+                           (username, app.password_hasher.hash('bench-password')))
+        conn.commit()
+        cursor.close()
+
+    start = time.perf_counter()
+    for _ in range(5):
+        app.password_hasher.hash('bench-password')
+    print(f"backend={args.backend} iterations={args.iterations} hash workers={app.password_hasher.workers} "
+          f"threads={args.threads} one hash={(time.perf_counter() - start) / 5 * 1000:.1f} ms")
+
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = app.app.test_client()
+        return local.client
+
+    def login(number):
+        body = client().post('/api/login', json={'username': users[number], 'password': 'bench-password'}).get_json()
+        assert body['success'], body
+        local.token = body['token']
+
+    def unknown_user(number):
+        body = client().post('/api/login', json={'username': f'nobody_{number}', 'password': 'x'}).get_json()
+        assert not body['success'], body
+
+    report('POST /api/login', count, *run_threads(args.threads, count, login))
+    report('POST /api/login (unknown)', count, *run_threads(args.threads, count, unknown_user))
+
+    token = app.session_tokens.issue(users[0], 1)
+    checks = 100000
+    start = time.perf_counter()
+    for _ in range(checks):
+        app.session_tokens.verify(token)
+    elapsed = time.perf_counter() - start
+    print(f"{'token check':<26} {checks / elapsed:>9.0f} /s   {elapsed / checks * 1e6:8.2f} us each")
+    print(f"credential cache: {app.credentials.stats()}")
+    app.pool.close()
+
+
+if __name__ == '__main__':
+    main()
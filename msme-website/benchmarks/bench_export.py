@@ -0,0 +1,71 @@
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import exporter
+
+
+# Peak Python memory and throughput of the export writers for growing row
+# counts. Rows are synthesized in chunks the way fetch_chunks() delivers them,
+# so this runs without a database; peak memory should not grow with --rows.
+#
+#   python benchmarks/bench_export.py --rows 1000 100000 1000000
+
+
+def synthetic_chunks(total, chunk_size=exporter.CHUNK_SIZE):
+    start = datetime(2024, 1, 1)
+    produced = 0
+    while produced < total:
+        count = min(chunk_size, total - produced)
+        yield [
+            (
+                (produced + i) // 3 + 1,
+                start + timedelta(seconds=produced + i),
+                'Rajesh Kumar',
+                '9876543210',
+                Decimal('1000.00'),
+                Decimal('180.00'),
+                Decimal('1180.00'),
+                'Notebooks',
+                5,
+                Decimal('120.00'),
+                Decimal('12.00'),
+            )
+            for i in range(count)
+        ]
+        produced += count
+
+
+def measure(name, writer, rows):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = 0
+    for block in writer(synthetic_chunks(rows)):
+        size += len(block)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<5} {rows:>10} rows   {rows / elapsed:>10.0f} rows/s   "
+          f"output {size / 1e6:8.1f} MB   peak {peak / 1e6:6.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export writer memory and throughput')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 100000])
+    parser.add_argument('--formats', nargs='+', default=['csv', 'xlsx'])
+    args = parser.parse_args()
+
+    writers = {'csv': exporter.csv_stream, 'xlsx': exporter.xlsx_stream}
+    for export_format in args.formats:
+        for rows in args.rows:
+            measure(export_format, writers[export_format], rows)
+
+
+if __name__ == '__main__':
+    main()
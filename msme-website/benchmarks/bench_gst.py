@@ -0,0 +1,86 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+import gst
+
+
+# Invoice computation over --lines bill items split into invoices of 1-20
+# lines: the old float loop, the exact per-invoice path and the NumPy batch
+# path, plus tax-inclusive re-pricing of the same number of products. Also
+# reports how many invoice totals from the float loop differ by a paisa or more.
+#
+#   python benchmarks/bench_gst.py --lines 100000
+
+
+def synthetic_invoices(lines, seed):
+    rng = random.Random(seed)
+    invoices = []
+    produced = 0
+    while produced < lines:
+        count = min(rng.randint(1, 20), lines - produced)
+        invoices.append([
+            {'price': rng.randrange(100, 5000000) / 100, 'quantity': rng.randint(1, 50), 'gst': rng.choice(gst.RATES)}
+            for _ in range(count)
+        ])
+        produced += count
+    return invoices
+
+
+# The computation create_bill() used before the GST module
+def float_totals(items):
+    subtotal = 0
+    total_gst = 0
+    for item in items:
+        item_subtotal = float(item['quantity']) * float(item['price'])
+        subtotal += item_subtotal
+        total_gst += item_subtotal * (float(item.get('gst', 18)) / 100)
+    return subtotal, total_gst, subtotal + total_gst
+
+
+def timed(label, lines, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed * 1000:>9.1f} ms   {lines / elapsed:>12.0f} lines/s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='GST computation throughput')
+    parser.add_argument('--lines', type=int, default=100000)
+    parser.add_argument('--rounding', choices=gst.ROUNDING_MODES, default='rate')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    invoices = synthetic_invoices(args.lines, args.seed)
+    print(f"{args.lines} lines in {len(invoices)} invoices, rounding={args.rounding}")
+
+    floats = timed('float loop', args.lines, lambda: [float_totals(items) for items in invoices])
+    parsed = timed('parse to paise', args.lines, lambda: [gst.parse_lines(items) for items in invoices])
+    exact = timed('exact per invoice', args.lines,
+                  lambda: [gst.compute_invoice(lines, args.rounding) for lines in parsed])
+
+    index = np.repeat(np.arange(len(parsed)), [len(lines) for lines in parsed])
+    flat = np.array([line for lines in parsed for line in lines], dtype=np.int64)
+    subtotal, tax, total = timed('numpy batch', args.lines,
+                                 lambda: gst.batch_totals(index, flat[:, 0], flat[:, 1], flat[:, 2], args.rounding))
+
+    mismatches = sum(1 for i, invoice in enumerate(exact) if (invoice['subtotal'], invoice['gst']) != (subtotal[i], tax[i]))
+    drift = sum(1 for (_, _, value), invoice in zip(floats, exact) if round(value * 100) != invoice['total'])
+    print(f"batch vs exact mismatches: {mismatches}")
+    print(f"float loop totals differing by >= 1 paisa: {drift} of {len(invoices)}")
+
+    timed('re-price, python', args.lines,
+          lambda: [price + gst.tax_paise(price, rate) for price, rate in zip(flat[:, 0].tolist(), flat[:, 2].tolist())])
+    timed('re-price, numpy', args.lines, lambda: gst.batch_inclusive_prices(flat[:, 0], flat[:, 2]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import importer
+
+
+# Parse and validate synthetic price lists of growing size the way the import
+# job does, chunk by chunk, and report rows/s and peak Python memory, which
+# should stay flat as --rows grows. The database upsert is not included.
+#
+#   python benchmarks/bench_import.py --rows 10000 100000
+
+
+def write_file(path, source_format, rows, seed):
+    rng = random.Random(seed)
+    header = ['SKU', 'Product Name', 'Category', 'Price', 'Stock', 'GST %', 'Description']
+
+    def records():
+        for number in range(rows):
+            price = rng.randrange(100, 500000) / 100 if number % 200 else 'n/a'  # some bad rows
+            yield [f'DIST-{number:07d}', f'Product {number}', rng.choice(['Grocery', 'Hardware', 'Stationery']),
+                   price, rng.randrange(0, 1000), rng.choice([5, 12, 18, 28]), '']
+
+    if source_format == 'csv':
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(records())
+    else:
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(header)
+        for record in records():
+            sheet.append(record)
+        workbook.save(path)
+
+
+def measure(path, source_format, rows):
+    tracemalloc.start()
+    start = time.perf_counter()
+    valid = failed = 0
+    for chunk in importer._chunks(importer.read_rows(path, source_format), importer.CHUNK_SIZE):
+        for _, row in chunk:
+            try:
+                importer.validate(row)
+                valid += 1
+            except (ValueError, TypeError):
+                failed += 1
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{source_format:<5} {rows:>9} rows   {rows / elapsed:>9.0f} rows/s   "
+          f"valid {valid:>9}   rejected {failed:>6}   peak {peak / 1e6:6.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inventory import parse/validate throughput and memory')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--formats', nargs='+', default=['csv', 'xlsx'])
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for source_format in args.formats:
+            for rows in args.rows:
+                path = os.path.join(directory, f'import_{rows}.{source_format}')
+                write_file(path, source_format, rows, args.seed)
+                measure(path, source_format, rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import rollups
+from pickups import PickupQueue
+
+
+# Sustained pickup insert rate: the old per-request path (one pooled
+# connection, INSERT, rollup update and COMMIT per pickup) against the
+# write-behind journal, from --threads concurrent request threads. For the
+# journal both the acknowledged rate and the end-to-end rate until every
+# pickup is in MySQL are reported. Without --mysql only the journal append
+# rate is measured.
+#
+#   python benchmarks/bench_pickups.py --pickups 20000 --threads 8 --mysql
+
+
+def run_threads(threads, count, work):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(share):
+        local = []
+        for number in range(share):
+            start = time.perf_counter()
+            work(number)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=client, args=(count // threads,)) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start, sorted(latencies)
+
+
+def report(name, count, elapsed, latencies=None):
+    line = f"{name:<26} {count / elapsed:>10.0f} pickups/s"
+    if latencies:
+        line += (f"   p50 {latencies[len(latencies) // 2] * 1000:7.3f} ms"
+                 f"   p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.3f} ms")
+    print(line)
+
+
+def direct_insert(get_connection):
+    def work(number):
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            now = datetime.now()
+            conn.start_transaction()
+            cursor.execute(
+                "INSERT INTO waste_pickups (waste_type, quantity, pickup_date, status, scheduled_at) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                ('Plastic', Decimal('12.50'), date.today(), 'scheduled', now)
+            )
+            rollups.record(cursor, now.date(), pickups=1)
+            conn.commit()
+            cursor.close()
+    return work
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pickup insert rate, per-request vs write-behind')
+    parser.add_argument('--pickups', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--mysql', action='store_true', help='also run the paths that write to MySQL')
+    args = parser.parse_args()
+    count = args.pickups - args.pickups % args.threads
+
+    get_connection = None
+    if args.mysql:
+        from db import get_db_connection as get_connection
+
+        elapsed, latencies = run_threads(args.threads, count, direct_insert(get_connection))
+        report('per-request insert', count, elapsed, latencies)
+
+    with tempfile.TemporaryDirectory() as directory:
+        queue = PickupQueue(os.path.join(directory, 'journal.db'), get_connection)
+        today = date.today()
+        elapsed, latencies = run_threads(
+            args.threads, count,
+            lambda number: queue.append('Plastic', Decimal('12.50'), today, datetime.now())
+        )
+        report('journal append (ack)', count, elapsed, latencies)
+
+        if args.mysql:
+            start = time.perf_counter()
+            while queue.flush():
+                pass
+            drained = time.perf_counter() - start
+            report('journal flush to MySQL', count, drained)
+            report('write-behind end to end', count, elapsed + drained)
+        queue.stop()
+
+
+if __name__ == '__main__':
+    main()
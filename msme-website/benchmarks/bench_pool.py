@@ -0,0 +1,95 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import mysql.connector
+
+from db import ConnectionPool
+
+
+# Compare a pooled checkout against a fresh connect() per request, running the
+# same lightweight query the way a route would.
+#
+#   python benchmarks/bench_pool.py --requests 2000 --concurrency 8
+
+QUERY = "SELECT id, product_name, price FROM inventory WHERE status = 'Active' LIMIT 20"
+
+
+def connect_args():
+    return dict(
+        host=os.getenv('DB_HOST', 'localhost'),
+        user=os.getenv('DB_USER', 'root'),
+        password=os.getenv('DB_PASSWORD', ''),
+        database=os.getenv('DB_NAME', 'msme_db'),
+        port=int(os.getenv('DB_PORT', '3306')),
+    )
+
+
+def per_request():
+    conn = mysql.connector.connect(**connect_args())
+    cursor = conn.cursor()
+    cursor.execute(QUERY)
+    cursor.fetchall()
+    cursor.close()
+    conn.close()
+
+
+def make_pooled(pool):
+    def pooled():
+        conn = pool.acquire()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(QUERY)
+            cursor.fetchall()
+            cursor.close()
+        finally:
+            pool.release(conn)
+    return pooled
+
+
+def run(name, fn, requests, concurrency):
+    latencies = []
+
+    def timed(_):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{name:<12} {requests / elapsed:>10.1f} req/s   p50 {p50:7.2f} ms   p99 {p99:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pooled vs per-request MySQL connections')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--pool-size', type=int, default=8)
+    args = parser.parse_args()
+
+    pool = ConnectionPool(size=args.pool_size, max_overflow=0, **connect_args())
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, pool size {args.pool_size}")
+    run('per-request', per_request, args.requests, args.concurrency)
+    run('pooled', make_pooled(pool), args.requests, args.concurrency)
+    print(f"pool stats: {pool.stats()}")
+    pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+# Rows per second of /api/inventory and the bill export, read the way the
+# routes used to (a dictionary cursor per call, the full SQL text sent every
+# time, Decimals converted by the encoder's fallback per value) against
+# queries.fetch()/stream(): statements prepared once per pooled connection,
+# tuple rows and one converter per column. The route rows go through the
+# Flask test client, so they include the whole request path minus HTTP.
+#
+#   python benchmarks/bench_queries.py --products 20000 --bills 20000
+#   python benchmarks/bench_queries.py --backend mysql   # scratch database!
+
+
+def best_rate(fn, rows, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return rows / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Read path rows/s: dictionary cursors vs prepared tuple rows')
+    parser.add_argument('--backend', choices=('sqlite', 'mysql'), default='sqlite')
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--bills', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench_queries_')
+    os.environ.update(
+        DB_BACKEND=args.backend, SQLITE_PATH=os.path.join(directory, 'msme.db'),
+        PICKUP_JOURNAL=os.path.join(directory, 'journal.db'), WARM_UP='0', EVENTS_RELAY_INTERVAL='0', LOG_LEVEL='error'
+    )
+    import app
+    import exporter
+    import queries
+    import responses
+    import seed
+
+    app.create_tables()
+    rng = random.Random(42)
+    with app.get_db_connection() as conn:
+        cursor = conn.cursor()
+        products = seed.seed_inventory(conn, cursor, rng, args.products)
+        seed.seed_bills(conn, cursor, rng, args.bills, products, datetime.now() - timedelta(days=30), 30 * 86400)
+        cursor.execute("SELECT COUNT(*) FROM inventory")
+        inventory_rows = cursor.fetchone()[0]
+        cursor.close()
+    export_sql, export_params = exporter.build_query()
+    with app.get_db_connection() as conn:
+        export_rows = len(queries.fetch(conn, export_sql, export_params))
+
+    def inventory_before(columnar):
+        with app.get_db_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(app.inventory_query(app.INVENTORY_COLUMNS))
+            rows = cursor.fetchall()
+            cursor.close()
+        if columnar:
+            columns = app.INVENTORY_COLUMNS
+            return app.app.json.response({'columns': columns, 'count': len(rows),
+                                          'data': [[row.get(column) for row in rows] for column in columns]})
+        return app.app.json.response(rows)
+
+    def inventory_after():
+        with app.get_db_connection() as conn:
+            result = queries.fetch(conn, queries.Query('inventory', app.inventory_query(app.INVENTORY_COLUMNS)))
+        return responses.rows_response(app.app, result)
+
+    def drain(stream):
+        for _ in stream:
+            pass
+
+    def export_before():
+        with app.get_db_connection() as conn:
+            cursor = conn.cursor(buffered=False)
+            cursor.execute(export_sql, export_params)
+
+            def chunks():
+                while True:
+                    rows = cursor.fetchmany(exporter.CHUNK_SIZE)
+                    if not rows:
+                        return
+                    yield rows
+            drain(exporter.csv_stream(chunks()))
+            cursor.close()
+
+    def export_after():
+        with app.get_db_connection() as conn:
+            drain(exporter.csv_stream(exporter.fetch_chunks(conn, export_sql, export_params)))
+
+    client = app.app.test_client()
+
+    def route(url):
+        response = client.get(url)
+        assert response.status_code == 200
+        drain(response.response)
+        response.close()
+
+    print(f"backend={args.backend} inventory={inventory_rows} rows export={export_rows} rows")
+    for name, fn, rows in (
+        ('inventory objects', lambda: inventory_before(False), inventory_rows),
+        ('inventory columns', lambda: inventory_before(True), inventory_rows),
+        ('export csv', export_before, export_rows),
+    ):
+        with app.app.test_request_context('/?format=columns' if 'columns' in name else '/'):
+            before = best_rate(fn, rows, args.repeat)
+            after = best_rate({'export csv': export_after}.get(name, inventory_after), rows, args.repeat)
+        print(f"{name:<20} before {before:>10.0f} rows/s   after {after:>10.0f} rows/s   x{after / before:.2f}")
+    for url, rows in (('/api/inventory', inventory_rows), ('/api/inventory?format=columns', inventory_rows),
+                      ('/api/export_bills_excel?format=csv', export_rows)):
+        print(f"GET {url:<36} {best_rate(lambda: route(url), rows, args.repeat):>10.0f} rows/s")
+    app.pool.close()
+
+
+if __name__ == '__main__':
+    main()
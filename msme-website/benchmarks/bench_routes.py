@@ -0,0 +1,221 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import APP_DIR, percentile, start_server, stop_server
+
+
+# Drive every API route at a fixed concurrency and write a JSON report of
+# throughput and latency per route. Reports from two commits can be compared
+# with --compare, which flags routes whose p99 or throughput got worse than
+# --threshold and exits non-zero, so the run can gate a change.
+#
+# Seed the database first (benchmarks/seed.py), then either point at a
+# running server or let the harness start gunicorn:
+#
+#   python benchmarks/bench_routes.py --start --output before.json
+#   git checkout my-branch
+#   python benchmarks/bench_routes.py --start --output after.json --compare before.json
+#
+# Write routes really write: run against a scratch database. Requests
+# answered with 4xx are counted as rejected rather than timed, and a route
+# with any rejected requests fails the --compare gate.
+
+
+def _products(state):
+    return state['products']
+
+
+def _bill(rng, state):
+    items = []
+    for product in rng.sample(_products(state), min(3, len(_products(state)))):
+        items.append({'productId': product['id'], 'name': product['name'], 'price': float(product['price']),
+                      'quantity': rng.randint(1, 3), 'gst': float(product['gst'])})
+    return {'customerName': 'Bench Customer', 'customerPhone': f"9{rng.randrange(100000000, 999999999)}",
+            'items': items}
+
+
+def _recent_day(rng):
+    return (date.today() - timedelta(days=rng.randrange(30))).isoformat()
+
+
+# name -> request factory returning (method, path, json body or None)
+SCENARIOS = {
+    'status': lambda rng, state: ('GET', '/api/status', None),
+    'products': lambda rng, state: ('GET', '/api/products', None),
+    'product_search': lambda rng, state: ('GET', f"/api/products/search?q={rng.choice(state['products'])['name'][:4]}", None),
+    'inventory': lambda rng, state: ('GET', '/api/inventory', None),
+    'dashboard_stats': lambda rng, state: ('GET', '/api/dashboard/stats', None),
+    'reports_summary': lambda rng, state: ('GET', '/api/reports/summary', None),
+    'bill_history': lambda rng, state: ('GET', '/api/bill_history?limit=20', None),
+    'bill_history_by_day': lambda rng, state: ('GET', '/api/bill_history?from={0}&to={0}'.format(_recent_day(rng)), None),
+    'payment_history': lambda rng, state: ('GET', '/api/payment_history?status=verified', None),
+    'pickup_history': lambda rng, state: ('GET', '/api/pickup_history', None),
+    'export_csv_day': lambda rng, state: ('GET', f'/api/export_bills_excel?format=csv&from={_recent_day(rng)}&to={date.today().isoformat()}', None),
+    'export_xlsx_day': lambda rng, state: ('GET', f'/api/export_bills_excel?from={date.today().isoformat()}', None),
+    'create_bill': lambda rng, state: ('POST', '/api/create_bill', _bill(rng, state)),
+    'create_bills_bulk': lambda rng, state: ('POST', '/api/create_bills_bulk', {'bills': [_bill(rng, state) for _ in range(20)]}),
+    'verify_payment': lambda rng, state: ('POST', '/api/verify_payment', {'transactionId': f"BENCH{rng.getrandbits(64):x}", 'amount': 499}),
+    'schedule_pickup': lambda rng, state: ('POST', '/api/schedule_pickup', {'wasteType': 'plastic', 'quantity': 12.5, 'pickupDate': _recent_day(rng)}),
+    'login': lambda rng, state: ('POST', '/api/login', {'username': 'ayman', 'password': 'password123'}),
+}
+
+
+def load_state(host, port):
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    conn.request('GET', '/api/products')
+    products = json.loads(conn.getresponse().read())
+    conn.close()
+    if not products:
+        raise SystemExit('No products returned; seed the database first')
+    return {'products': products[:500]}
+
+
+def drive(host, port, factory, state, concurrency, duration, seed):
+    latencies = []
+    errors = [0]
+    rejected = [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(number):
+        rng = random.Random(seed * 1000 + number)
+        conn = http.client.HTTPConnection(host, port, timeout=60)
+        local = []
+        while time.perf_counter() < stop_at:
+            method, path, body = factory(rng, state)
+            payload = json.dumps(body) if body is not None else None
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500:
+                    raise http.client.HTTPException(response.status)
+                if response.status >= 400:
+                    with lock:
+                        rejected[0] += 1
+                    continue
+                local.append(time.perf_counter() - start)
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    errors[0] += 1
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=60)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rejected': rejected[0],
+        'rps': round(len(latencies) / duration, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p90_ms': round(percentile(latencies, 0.9) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, threshold):
+    regressions = []
+    print(f"\n{'route':<20} {'rps':>10} {'was':>10} {'p99 ms':>9} {'was':>9}")
+    for name, result in report['routes'].items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            continue
+        rps_change = (result['rps'] - before['rps']) / before['rps'] if before['rps'] else 0.0
+        p99_change = (result['p99_ms'] - before['p99_ms']) / before['p99_ms'] if before['p99_ms'] else 0.0
+        flag = ''
+        if result.get('rejected'):
+            regressions.append(name)
+            flag = f"  {result['rejected']} REJECTED"
+        elif rps_change < -threshold or p99_change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<20} {result['rps']:>10.1f} {before['rps']:>10.1f} "
+              f"{result['p99_ms']:>9.2f} {before['p99_ms']:>9.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-route throughput and latency report')
+    parser.add_argument('--url', default='http://127.0.0.1:5055')
+    parser.add_argument('--start', action='store_true', help='start gunicorn on the --url port for the run')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--routes', nargs='+', choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--compare', help='baseline JSON report to diff against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='tolerated relative change')
+    args = parser.parse_args()
+
+    target = urlsplit(args.url)
+    host, port = target.hostname, target.port or 80
+    process = start_server(port, args.workers, args.threads) if args.start else None
+    try:
+        state = load_state(host, port)
+        report = {
+            'commit': git_commit(),
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'server': {'workers': args.workers, 'threads': args.threads} if args.start else args.url,
+            'routes': {},
+        }
+        print(f"{args.concurrency} clients, {args.duration}s per route")
+        print(f"{'route':<20} {'req/s':>10} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'errors':>7} {'4xx':>7}")
+        for name in args.routes:
+            result = drive(host, port, SCENARIOS[name], state, args.concurrency, args.duration, args.seed)
+            report['routes'][name] = result
+            print(f"{name:<20} {result['rps']:>10.1f} {result['p50_ms']:>8.2f} "
+                  f"{result['p90_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['errors']:>7} {result['rejected']:>7}")
+    finally:
+        if process:
+            stop_server(process)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} route(s) had rejected requests or regressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
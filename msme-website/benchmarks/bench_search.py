@@ -0,0 +1,93 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from search import ProductIndex
+from seed import ADJECTIVES, NOUNS
+
+
+# Build the product search index over a synthetic catalog and time queries:
+# prefixes as typed on the billing screen, whole words and misspellings.
+# Reports build time and p50/p99/max latency per query kind; the target is
+# top-k in under 5 ms.
+#
+#   python benchmarks/bench_search.py --products 50000
+
+
+def synthetic_products(count, seed):
+    rng = random.Random(seed)
+    brands = [f"{rng.choice('BCDFGHKLMNPRSTV')}{rng.choice('aeiou')}{rng.choice('klmnrst')}{rng.choice('aeiou')}"
+              for _ in range(400)]
+    products = []
+    for product_id in range(1, count + 1):
+        category = rng.choice(list(NOUNS))
+        name = f"{rng.choice(brands)} {rng.choice(ADJECTIVES)} {rng.choice(NOUNS[category])} {rng.choice([100, 250, 500, 1000])}g"
+        products.append({'id': product_id, 'name': name, 'category': category})
+    return products
+
+
+def typo(word, rng):
+    position = rng.randrange(len(word))
+    kind = rng.choice(['drop', 'swap', 'replace'])
+    if kind == 'drop':
+        return word[:position] + word[position + 1:]
+    if kind == 'swap' and position < len(word) - 1:
+        return word[:position] + word[position + 1] + word[position] + word[position + 2:]
+    return word[:position] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[position + 1:]
+
+
+def queries(products, rng, count):
+    words = [word for product in products[:2000] for word in product['name'].lower().split() if word.isalpha() and len(word) > 4]
+    return {
+        'prefix': [rng.choice(words)[:rng.randint(2, 4)] for _ in range(count)],
+        'word': [rng.choice(words) for _ in range(count)],
+        'two words': [f"{rng.choice(words)} {rng.choice(words)[:3]}" for _ in range(count)],
+        'typo': [typo(rng.choice(words), rng) for _ in range(count)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Product search latency')
+    parser.add_argument('--products', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    products = synthetic_products(args.products, args.seed)
+    start = time.perf_counter()
+    index = ProductIndex.build(products)
+    print(f"built index over {args.products} products in {(time.perf_counter() - start) * 1000:.0f} ms: {index.stats()}")
+
+    start = time.perf_counter()
+    for product in products[:1000]:
+        index.add(product['id'] + args.products, product['name'] + ' refill', product['category'])
+    print(f"incremental add: {(time.perf_counter() - start) * 1000:.3f} us per product")
+
+    start = time.perf_counter()
+    index.refresh(products)
+    print(f"refresh on catalog reload: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    rng = random.Random(args.seed)
+    print(f"{'kind':<10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'hits':>6}")
+    for kind, texts in queries(products, rng, args.queries).items():
+        latencies = []
+        found = 0
+        for text in texts:
+            start = time.perf_counter()
+            results = index.search(text, args.limit)
+            latencies.append(time.perf_counter() - start)
+            found += bool(results)
+        latencies.sort()
+        print(f"{kind:<10} {latencies[len(latencies) // 2] * 1000:>8.3f} "
+              f"{latencies[int(len(latencies) * 0.99)] * 1000:>8.3f} {latencies[-1] * 1000:>8.3f} "
+              f"{found / len(texts):>6.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import gzip
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import responses
+
+
+# Payload size and encode time of an /api/inventory response: Flask's stock
+# JSON provider against FastJSONProvider, all columns against the billing
+# screen's projection, objects per row against ?format=columns, and each
+# uncompressed, gzipped and (when installed) brotli-compressed.
+#
+#   python benchmarks/bench_serialization.py --rows 20000
+
+
+def inventory_rows(count, seed):
+    rng = random.Random(seed)
+    created = datetime(2024, 1, 1)
+    return [
+        {
+            'id': number,
+            'sku': f'SKU-{number:07d}',
+            'product_name': f'Product {number}',
+            'category': rng.choice(['Grocery', 'Hardware', 'Stationery', 'Textiles']),
+            'price': Decimal(rng.randrange(100, 500000)) / 100,
+            'stock': rng.randrange(0, 1000),
+            'gst_rate': Decimal('18.00'),
+            'status': 'Active',
+            'description': 'Imported from distributor price list. ' * rng.randint(1, 6),
+            'created_at': created + timedelta(minutes=number),
+            'updated_at': created + timedelta(minutes=number),
+        }
+        for number in range(1, count + 1)
+    ]
+
+
+def columnar(rows, columns):
+    return {'columns': columns, 'data': [[row.get(column) for row in rows] for column in columns], 'count': len(rows)}
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON payload size and encode time')
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    stock = DefaultJSONProvider(app)
+    fast = responses.FastJSONProvider(app)
+    rows = inventory_rows(args.rows, args.seed)
+    all_columns = list(rows[0])
+    billing_columns = ['id', 'product_name', 'category', 'price', 'stock']
+    projected = [{column: row[column] for column in billing_columns} for row in rows]
+
+    print(f"/api/inventory with {args.rows} rows (best of {args.repeat})")
+    print(f"{'encoder':<8} {'payload':<22} {'encode ms':>10} {'raw KB':>9} {'gzip KB':>9} {'gzip ms':>8} {'br KB':>9} {'br ms':>8}")
+    cases = [
+        ('rows, all columns', rows),
+        ('rows, projected', projected),
+        ('columns, projected', columnar(projected, billing_columns)),
+        ('columns, all', columnar(rows, all_columns)),
+    ]
+    for name, payload in cases:
+        for label, provider in (('flask', stock), ('fast', fast)):
+            body, elapsed = timed(lambda: provider.dumps(payload).encode('utf-8'), args.repeat)
+            line = f"{label:<8} {name:<22} {elapsed * 1000:>10.1f} {len(body) / 1024:>9.1f}"
+            if label == 'fast':
+                gz, gz_time = timed(lambda: gzip.compress(body, responses.GZIP_LEVEL), args.repeat)
+                line += f" {len(gz) / 1024:>9.1f} {gz_time * 1000:>8.1f}"
+                if responses.brotli is not None:
+                    br, br_time = timed(lambda: responses.compress_bytes(body, 'br'), args.repeat)
+                    line += f" {len(br) / 1024:>9.1f} {br_time * 1000:>8.1f}"
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
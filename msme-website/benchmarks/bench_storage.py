@@ -0,0 +1,102 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+# Route latency on either storage backend, through the Flask test client so
+# the numbers cover the whole request path minus HTTP: POST /api/create_bill
+# (stock check, bill, items and rollups in one transaction) and a page of
+# GET /api/bill_history, from --threads concurrent clients.
+#
+#   python benchmarks/bench_storage.py --backend sqlite --bills 5000 --threads 4
+#   python benchmarks/bench_storage.py --backend mysql   # scratch database!
+#
+# The SQLite run uses a fresh database file in a temporary directory;
+# --synchronous NORMAL shows the rate without an fsync per commit.
+
+
+def run_threads(threads, count, work):
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        local = []
+        for _ in range(count // threads):
+            start = time.perf_counter()
+            work()
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=client) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start, sorted(latencies)
+
+
+def report(name, count, elapsed, latencies):
+    print(f"{name:<22} {count / elapsed:>9.0f} req/s"
+          f"   p50 {latencies[len(latencies) // 2] * 1000:7.3f} ms"
+          f"   p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Billing route latency on MySQL or SQLite')
+    parser.add_argument('--backend', choices=('sqlite', 'mysql'), default='sqlite')
+    parser.add_argument('--synchronous', choices=('FULL', 'NORMAL'), default='FULL')
+    parser.add_argument('--bills', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+    count = args.bills - args.bills % args.threads
+
+    directory = tempfile.mkdtemp(prefix='bench_storage_')
+    os.environ.update(
+        DB_BACKEND=args.backend, SQLITE_PATH=os.path.join(directory, 'msme.db'), SQLITE_SYNCHRONOUS=args.synchronous,
+        PICKUP_JOURNAL=os.path.join(directory, 'journal.db'), WARM_UP='0', EVENTS_RELAY_INTERVAL='0', LOG_LEVEL='error'
+    )
+    import app
+
+    app.create_tables()
+    with app.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE inventory SET stock = %s", (10 ** 8,))
+        cursor.execute("SELECT id, product_name, price, gst_rate FROM inventory WHERE status = 'Active' LIMIT 3")
+        products = cursor.fetchall()
+        conn.commit()
+        cursor.close()
+
+    bill = {'customerName': 'Bench Customer', 'customerPhone': '9000000000', 'items': [
+        {'productId': product_id, 'name': name, 'price': float(price), 'quantity': 1, 'gst': float(rate)}
+        for product_id, name, price, rate in products
+    ]}
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = app.app.test_client()
+        return local.client
+
+    def create_bill():
+        response = client().post('/api/create_bill', json=bill)
+        assert response.get_json()['success'], response.get_json()
+
+    def bill_history():
+        assert client().get('/api/bill_history?limit=20').status_code == 200
+
+    print(f"backend={args.backend} threads={args.threads}"
+          + (f" synchronous={args.synchronous}" if args.backend == 'sqlite' else ''))
+    report('POST /api/create_bill', count, *run_threads(args.threads, count, create_bill))
+    report('GET /api/bill_history', count, *run_threads(args.threads, count, bill_history))
+    app.pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+# Bytes on the wire and wall time to bring a central server up to date with
+# bills taken while a store was offline, over a slow link:
+#
+#   delta sync   SyncClient.sync(): compressed batches of the change log
+#   bulk JSON    one POST /api/create_bills_bulk with every bill
+#   replay       one POST /api/create_bill per bill
+#
+#   python benchmarks/bench_sync.py --bills 2000 --rtt 300 --kbps 256
+#   python benchmarks/bench_sync.py --central mysql   # scratch database!
+#
+# The central server runs in a subprocess on 127.0.0.1, behind a TCP proxy
+# that delays every chunk by half the round trip and paces it to --kbps in
+# each direction. The store is this process, on a fresh SQLite database.
+
+TOKEN = 'bench-sync-token'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class LinkProxy:
+    def __init__(self, target_port, rtt, kbps):
+        self.target_port = target_port
+        self.delay = rtt / 2000
+        self.bytes_per_second = kbps * 1000 / 8
+        self.sent = 0  # store -> server
+        self.received = 0  # server -> store
+        self._lock = threading.Lock()
+        self._server = socket.socket()
+        self._server.bind(('127.0.0.1', 0))
+        self._server.listen(64)
+        self.port = self._server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def reset(self):
+        with self._lock:
+            self.sent = self.received = 0
+
+    def _accept(self):
+        while True:
+            client, _ = self._server.accept()
+            upstream = socket.create_connection(('127.0.0.1', self.target_port))
+            threading.Thread(target=self._pump, args=(client, upstream, 'sent'), daemon=True).start()
+            threading.Thread(target=self._pump, args=(upstream, client, 'received'), daemon=True).start()
+
+    def _pump(self, source, sink, counter):
+        try:
+            while True:
+                chunk = source.recv(16384)
+                if not chunk:
+                    break
+                time.sleep(self.delay + len(chunk) / self.bytes_per_second)
+                with self._lock:
+                    setattr(self, counter, getattr(self, counter) + len(chunk))
+                sink.sendall(chunk)
+        except OSError:
+            pass
+        finally:
+            for sock in (source, sink):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+def serve_central(port):
+    import logging
+    import app
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app.create_tables()
+    with app.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE inventory SET stock = %s", (10 ** 8,))
+        conn.commit()
+        cursor.close()
+    make_server('127.0.0.1', port, app.app, threaded=True).serve_forever()
+
+
+def wait_for(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit('Central server exited')
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit('Central server did not start')
+
+
+def post_json(url, payload):
+    req = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=600) as response:
+        body = json.loads(response.read())
+    assert body['success'], body
+    return body
+
+
+def report(name, proxy, elapsed, bills):
+    print(f"{name:<12} {proxy.sent / 1024:>9.1f} KiB up {proxy.received / 1024:>8.1f} KiB down"
+          f"   {elapsed:>8.2f} s   {bills / elapsed:>8.1f} bills/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline store catch-up: delta sync vs bill replay')
+    parser.add_argument('--bills', type=int, default=1000)
+    parser.add_argument('--items', type=int, default=3, help='Items per bill')
+    parser.add_argument('--rtt', type=float, default=300, help='Round trip time in ms')
+    parser.add_argument('--kbps', type=float, default=256, help='Link bandwidth in kbit/s each way')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--replay', type=int, default=100, help='Bills to replay one request at a time')
+    parser.add_argument('--central', choices=('sqlite', 'mysql'), default='sqlite')
+    parser.add_argument('--serve-central', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench_sync_')
+    common = dict(WARM_UP='0', EVENTS_RELAY_INTERVAL='0', LOG_LEVEL='error', SYNC_TOKEN=TOKEN)
+    if args.serve_central:
+        serve_central(args.serve_central)
+        return
+
+    port = free_port()
+    central = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve-central', str(port)],
+        env={**os.environ, **common, 'DB_BACKEND': args.central, 'SQLITE_PATH': os.path.join(directory, 'central.db'),
+             'PICKUP_JOURNAL': os.path.join(directory, 'central_journal.db')}
+    )
+    try:
+        wait_for(f'http://127.0.0.1:{port}/api/status', central)
+        proxy = LinkProxy(port, args.rtt, args.kbps)
+        server_url = f'http://127.0.0.1:{proxy.port}'
+
+        os.environ.update(common, DB_BACKEND='sqlite', SQLITE_PATH=os.path.join(directory, 'store.db'),
+                          PICKUP_JOURNAL=os.path.join(directory, 'store_journal.db'), SYNC_SERVER_URL=server_url,
+                          SYNC_STORE_ID='bench-store', SYNC_BATCH_SIZE=str(args.batch_size))
+        import app
+
+        app.create_tables()
+        with app.get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, product_name, price, gst_rate FROM inventory WHERE status = 'Active' "
+                           "ORDER BY id LIMIT %s", (args.items,))
+            products = cursor.fetchall()
+            cursor.close()
+        # The store pulls the server's inventory (and pushes its sample data)
+        # first, as it would when set up
+        app.sync_client.sync()
+
+        client = app.app.test_client()
+        bills = []
+        for number in range(args.bills):
+            bill = {'customerName': f'Offline Customer {number}', 'customerPhone': f'9{number:09d}', 'items': [
+                {'productId': product_id, 'name': name, 'price': float(price), 'quantity': 1 + number % 3,
+                 'gst': float(rate)}
+                for product_id, name, price, rate in products
+            ]}
+            assert client.post('/api/create_bill', json=bill).get_json()['success']
+            bills.append(bill)
+        print(f"central={args.central} bills={args.bills} items/bill={args.items} "
+              f"rtt={args.rtt:.0f}ms bandwidth={args.kbps:.0f}kbit/s")
+
+        proxy.reset()
+        start = time.perf_counter()
+        summary = app.sync_client.sync()
+        report('delta sync', proxy, time.perf_counter() - start, args.bills)
+        assert not summary['conflicts'], summary['conflicts']
+        print(f"             {summary['batches']} batches, {summary['changes']} changes, "
+              f"{summary['pulled']} products pulled back")
+
+        proxy.reset()
+        start = time.perf_counter()
+        post_json(f'{server_url}/api/create_bills_bulk', {'bills': bills})
+        report('bulk JSON', proxy, time.perf_counter() - start, args.bills)
+
+        replay = bills[:args.replay]
+        if replay:
+            proxy.reset()
+            start = time.perf_counter()
+            for bill in replay:
+                post_json(f'{server_url}/api/create_bill', bill)
+            report('replay', proxy, time.perf_counter() - start, len(replay))
+        app.pool.close()
+    finally:
+        central.terminate()
+        central.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bank import serve
+from verification import BankClient, VerificationPool
+
+
+# Payment verification throughput against the fake bank: verifying inside a
+# fixed number of request workers (the old synchronous path) versus handing
+# payments to the background VerificationPool. No database is involved.
+#
+#   python benchmarks/bench_verification.py --payments 200 --request-workers 4 --pool-workers 64
+
+
+class NullJobStore:
+    def claim(self, payment_id):
+        return f'TXN{payment_id}', '100.00'
+
+    def complete(self, payment_id, verified):
+        pass
+
+    def fail(self, payment_id, error, retry):
+        pass
+
+    def unfinished(self):
+        return []
+
+
+def run_sync(bank, payments, request_workers):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=request_workers) as executor:
+        list(executor.map(lambda n: bank.verify(f'TXN{n}', '100.00'), range(payments)))
+    return time.perf_counter() - start
+
+
+def run_pool(bank, payments, pool_workers):
+    pool = VerificationPool(bank, NullJobStore(), workers=pool_workers)
+    pool.start(replay=False)
+    start = time.perf_counter()
+    for payment_id in range(payments):
+        pool.submit(payment_id)
+    for payment_id in range(payments):
+        pool.wait(payment_id, timeout=60)
+    elapsed = time.perf_counter() - start
+    pool.stop()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verification throughput, sync vs worker pool')
+    parser.add_argument('--payments', type=int, default=200)
+    parser.add_argument('--request-workers', type=int, default=4)
+    parser.add_argument('--pool-workers', type=int, default=64)
+    parser.add_argument('--min-latency', type=float, default=1.0)
+    parser.add_argument('--max-latency', type=float, default=3.0)
+    parser.add_argument('--port', type=int, default=8090)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.min_latency, args.max_latency, background=True)
+    bank = BankClient(f'http://127.0.0.1:{args.port}/verify')
+
+    print(f"{args.payments} payments, bank latency {args.min_latency}-{args.max_latency}s")
+    elapsed = run_sync(bank, args.payments, args.request_workers)
+    print(f"sync   ({args.request_workers:>3} request workers) {args.payments / elapsed:8.1f} payments/s")
+    elapsed = run_pool(bank, args.payments, args.pool_workers)
+    print(f"pool   ({args.pool_workers:>3} verify workers)  {args.payments / elapsed:8.1f} payments/s")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Stand-in for the bank's payment verification API. Every POST sleeps for a
+# random latency between --min-latency and --max-latency seconds and answers
+# {"verified": true|false}.
+#
+#   python benchmarks/fake_bank.py --port 8090 --min-latency 1 --max-latency 3
+#   BANK_API_URL=http://localhost:8090/verify python app.py
+
+
+def make_handler(min_latency, max_latency, success_rate):
+    class FakeBankHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            self.rfile.read(length)
+            time.sleep(random.uniform(min_latency, max_latency))
+            body = json.dumps({'verified': random.random() < success_rate}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeBankHandler
+
+
+class FakeBankServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def serve(port=8090, min_latency=1.0, max_latency=3.0, success_rate=0.66, background=False):
+    server = FakeBankServer(('127.0.0.1', port), make_handler(min_latency, max_latency, success_rate))
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    print(f"Fake bank listening on http://127.0.0.1:{port}/verify")
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake bank verification API')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--min-latency', type=float, default=1.0)
+    parser.add_argument('--max-latency', type=float, default=3.0)
+    parser.add_argument('--success-rate', type=float, default=0.66)
+    args = parser.parse_args()
+    serve(args.port, args.min_latency, args.max_latency, args.success_rate)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import argparse
+import http.client
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+# Start gunicorn with each workers x threads combination and hammer one route
+# with keep-alive clients, reporting requests per second and latency
+# percentiles so serving settings can be compared on the same machine.
+#
+#   python benchmarks/load_test.py --path /api/products --workers 1 2 4 --threads 1 4 8
+
+
+# Every client connects from 127.0.0.1, so the per-client rate limit and
+# admission control are off unless set in the environment: the runs measure
+# the routes, not how fast they answer 429
+def start_server(port, workers, threads):
+    env = {'RATE_LIMIT_RATE': '0', 'ADMISSION_CONTROL': '0', **os.environ,
+           'WEB_CONCURRENCY': str(workers), 'THREADS': str(threads), 'BIND': f'127.0.0.1:{port}'}
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:create_app()'],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/status')
+            conn.getresponse().read()
+            conn.close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('gunicorn did not come up')
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def drive(port, path, concurrency, duration):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500:
+                    raise http.client.HTTPException(response.status)
+                local.append(time.perf_counter() - start)
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    errors[0] += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), errors[0]
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput and p99 across gunicorn settings')
+    parser.add_argument('--path', default='/api/status')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+
+    print(f"GET {args.path}, {args.concurrency} clients, {args.duration}s per setting")
+    print(f"{'workers':>7} {'threads':>7} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for workers in args.workers:
+        for threads in args.threads:
+            process = start_server(args.port, workers, threads)
+            try:
+                latencies, errors = drive(args.port, args.path, args.concurrency, args.duration)
+            finally:
+                stop_server(process)
+            print(f"{workers:>7} {threads:>7} {len(latencies) / args.duration:>10.1f} "
+                  f"{percentile(latencies, 0.5) * 1000:>8.2f} {percentile(latencies, 0.99) * 1000:>8.2f} {errors:>7}")
+
+
+if __name__ == '__main__':
+    main()
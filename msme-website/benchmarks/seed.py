@@ -0,0 +1,168 @@
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import rollups
+from db import get_db_connection
+
+
+# Fill the database with realistic volumes for the route benchmarks: tens of
+# thousands of products and millions of bills with their line items, spread
+# over the last --days days, plus payments and pickups. Rows are generated
+# from --seed so two runs produce the same data set. Run `flask --app app
+# init-db` first to create the schema.
+#
+#   python benchmarks/seed.py --products 20000 --bills 1000000 --payments 200000
+
+CHUNK = 5000
+
+ADJECTIVES = ['Premium', 'Classic', 'Organic', 'Deluxe', 'Eco', 'Compact', 'Heavy Duty', 'Mini', 'Family Pack', 'Fresh']
+NOUNS = {
+    'Stationery': ['Notebook', 'Pen Set', 'Pencil Box', 'Stapler', 'Marker', 'File Folder'],
+    'Grocery': ['Basmati Rice', 'Toor Dal', 'Sunflower Oil', 'Atta', 'Sugar', 'Tea Powder'],
+    'Hardware': ['Hammer', 'Screwdriver', 'Wall Plug', 'PVC Pipe', 'Padlock', 'Measuring Tape'],
+    'Textiles': ['Cotton Saree', 'Kurta', 'Bedsheet', 'Towel', 'Dupatta', 'Shirt Fabric'],
+    'Electronics': ['LED Bulb', 'Extension Board', 'Phone Charger', 'Earphones', 'Torch', 'Ceiling Fan'],
+}
+GST_RATES = [Decimal('5.00'), Decimal('12.00'), Decimal('18.00'), Decimal('28.00')]
+FIRST_NAMES = ['Rajesh', 'Priya', 'Amit', 'Sunita', 'Vikram', 'Anjali', 'Suresh', 'Kavita', 'Arjun', 'Meena']
+LAST_NAMES = ['Kumar', 'Sharma', 'Patel', 'Singh', 'Reddy', 'Iyer', 'Gupta', 'Das', 'Nair', 'Joshi']
+WASTE_TYPES = ['plastic', 'paper', 'metal', 'electronic', 'organic']
+
+
+def next_id(cursor, table):
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+    return cursor.fetchone()[0]
+
+
+def insert_rows(conn, cursor, sql, rows):
+    for i in range(0, len(rows), CHUNK):
+        cursor.executemany(sql, rows[i:i + CHUNK])
+    conn.commit()
+
+
+def random_time(rng, since, span):
+    return since + timedelta(seconds=rng.randrange(span))
+
+
+def seed_inventory(conn, cursor, rng, count):
+    categories = list(NOUNS)
+    rows = []
+    products = []
+    first = next_id(cursor, 'inventory')
+    for offset in range(count):
+        category = rng.choice(categories)
+        name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS[category])} {first + offset}"
+        price = Decimal(rng.randrange(1000, 500000)) / 100
+        gst = rng.choice(GST_RATES)
+        rows.append((first + offset, name, category, price, rng.randrange(1000, 1000000), '', gst))
+        products.append((name, price, gst))
+    insert_rows(conn, cursor,
+                "INSERT INTO inventory (id, product_name, category, price, stock, description, gst_rate) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s)", rows)
+    return products
+
+
+def seed_bills(conn, cursor, rng, count, products, since, span):
+    bill_id = next_id(cursor, 'bills')
+    done = 0
+    while done < count:
+        bills = []
+        items = []
+        for _ in range(min(CHUNK, count - done)):
+            subtotal = Decimal('0')
+            gst = Decimal('0')
+            for _ in range(rng.randint(1, 5)):
+                name, price, rate = rng.choice(products)
+                quantity = rng.randint(1, 10)
+                subtotal += price * quantity
+                gst += price * quantity * rate / 100
+                items.append((bill_id, name, quantity, price, rate))
+            gst = gst.quantize(Decimal('0.01'))
+            customer = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            phone = f"9{rng.randrange(100000000, 999999999)}"
+            bills.append((bill_id, customer, phone, subtotal, gst, subtotal + gst, random_time(rng, since, span)))
+            bill_id += 1
+        cursor.executemany(
+            "INSERT INTO bills (id, customer_name, customer_phone, subtotal, gst, total, created_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)", bills)
+        insert_rows(conn, cursor,
+                    "INSERT INTO bill_items (bill_id, item_name, quantity, price, gst_rate) VALUES (%s, %s, %s, %s, %s)",
+                    items)
+        done += len(bills)
+        print(f"  bills {done}/{count}", end='\r', flush=True)
+    print()
+
+
+def seed_payments(conn, cursor, rng, count, since, span):
+    rows = []
+    first = next_id(cursor, 'payments')
+    for offset in range(count):
+        created = random_time(rng, since, span)
+        status = rng.choice(['verified', 'verified', 'failed'])
+        rows.append((f"SEED{first + offset:012d}", Decimal(rng.randrange(100, 2000000)) / 100,
+                     status, created + timedelta(seconds=5), created))
+    insert_rows(conn, cursor,
+                "INSERT INTO payments (transaction_id, amount, status, verified_at, created_at) VALUES (%s, %s, %s, %s, %s)",
+                rows)
+
+
+def seed_pickups(conn, cursor, rng, count, since, span):
+    rows = []
+    for _ in range(count):
+        scheduled = random_time(rng, since, span)
+        rows.append((rng.choice(WASTE_TYPES), Decimal(rng.randrange(100, 50000)) / 100,
+                     (scheduled + timedelta(days=rng.randint(1, 7))).date(),
+                     rng.choice(['scheduled', 'completed']), scheduled))
+    insert_rows(conn, cursor,
+                "INSERT INTO waste_pickups (waste_type, quantity, pickup_date, status, scheduled_at) VALUES (%s, %s, %s, %s, %s)",
+                rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed the database with benchmark volumes')
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--bills', type=int, default=1000000)
+    parser.add_argument('--payments', type=int, default=200000)
+    parser.add_argument('--pickups', type=int, default=50000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    span = args.days * 86400
+    since = datetime.now() - timedelta(seconds=span)
+
+    with get_db_connection() as conn:
+        if not conn:
+            raise SystemExit('Cannot connect to database')
+        cursor = conn.cursor()
+        try:
+            start = time.perf_counter()
+            products = seed_inventory(conn, cursor, rng, args.products)
+            print(f"inventory: {args.products} rows")
+            seed_bills(conn, cursor, rng, args.bills, products, since, span)
+            print(f"bills: {args.bills} rows")
+            seed_payments(conn, cursor, rng, args.payments, since, span)
+            print(f"payments: {args.payments} rows")
+            seed_pickups(conn, cursor, rng, args.pickups, since, span)
+            print(f"waste_pickups: {args.pickups} rows")
+            rollups.rebuild(cursor)
+            conn.commit()
+            print(f"rollups rebuilt, seeded in {time.perf_counter() - start:.1f}s")
+        finally:
+            cursor.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import hashlib
+import threading
+import time
+from bisect import bisect_left
+
+from search import ProductIndex
+
+
+# In-process cache of the billing catalog served by /api/products.
+#
+# The cache keeps every active product with its stock so that writes can be
+# patched in place: a new product is slotted into name order, a bill lowers
+# stock and drops products that run out. Anything the cache cannot patch
+# exactly (e.g. a product coming back into stock) invalidates it and the next
+# request reloads from MySQL. Entries also expire after `ttl` seconds so that
+# caches in other worker processes converge, and catalogs larger than
+# `max_products` are not cached at all. The cache also carries the search
+# index behind /api/products/search. The index outlives reloads: a reload
+# only adds products it has not seen, and it is rebuilt when that is not
+# enough (see ProductIndex.refresh).
+class ProductCatalog:
+    def __init__(self, ttl=60, max_products=50000):
+        self.ttl = ttl
+        self.max_products = max_products
+        self.version = 0
+
+        self._lock = threading.Lock()
+        self._products = None  # id -> product row including stock
+        self._order = []       # (sort key, id) in product_name order
+        self._index = None
+        self._loaded_at = 0.0
+        self._body = None
+        self._etag = None
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(product):
+        return (product['name'].lower(), product['id'])
+
+    def _fresh(self):
+        return self._products is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def _changed(self):
+        self.version += 1
+        self._body = None
+        self._etag = None
+
+    # Return (body, etag) for the cached catalog, or None on a miss.
+    def get(self, dumps):
+        with self._lock:
+            if not self._fresh():
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self._body is None:
+                visible = []
+                for _, product_id in self._order:
+                    product = self._products[product_id]
+                    if product['stock'] > 0:
+                        visible.append({k: v for k, v in product.items() if k != 'stock'})
+                self._body = dumps(visible)
+                self._etag = hashlib.md5(self._body.encode('utf-8')).hexdigest()
+            return self._body, self._etag
+
+    def load(self, rows):
+        with self._lock:
+            if len(rows) > self.max_products:
+                self._index = None
+                self._reset()
+                return False
+            self._products = {row['id']: dict(row) for row in rows}
+            self._order = sorted(self._key(row) for row in rows)
+            if self._index is None or not self._index.refresh(rows):
+                self._index = ProductIndex.build(rows)
+            self._loaded_at = time.monotonic()
+            self._changed()
+            return True
+
+    def _reset(self):
+        self._products = None
+        self._order = []
+        self._changed()
+
+    def invalidate(self):
+        with self._lock:
+            self._reset()
+
+    def add_product(self, product):
+        with self._lock:
+            if self._products is None:
+                return
+            if product['id'] in self._products or len(self._products) >= self.max_products:
+                self._reset()
+                return
+            key = self._key(product)
+            self._order.insert(bisect_left(self._order, key), key)
+            self._products[product['id']] = dict(product)
+            self._index.add(product['id'], product['name'], product.get('category'), key)
+            self._changed()
+
+    # Apply {product_id: stock delta} from a committed transaction.
+    def apply_stock_changes(self, changes):
+        if not changes:
+            return
+        with self._lock:
+            if self._products is None:
+                return
+            for product_id, delta in changes.items():
+                product = self._products.get(product_id)
+                if product is None or product['stock'] + delta < 0:
+                    # Product not in the catalog (inactive or out of stock) or
+                    # the cache has drifted: reload instead of guessing
+                    if delta > 0 or product is not None:
+                        self._products = None
+                        self._order = []
+                        break
+                    continue
+                product['stock'] += delta
+            self._changed()
+
+    # Top matches for a search query as product rows without stock, skipping
+    # products that are out of stock. Returns None on a miss.
+    def search(self, text, limit=10):
+        with self._lock:
+            if not self._fresh():
+                self.misses += 1
+                return None
+            self.hits += 1
+            products = self._products
+
+            # The index may still hold products that have since left the catalog
+            def sellable(product_id):
+                product = products.get(product_id)
+                return product is not None and product['stock'] > 0
+
+            ids = self._index.search(text, limit, accept=sellable)
+            return [{k: v for k, v in products[product_id].items() if k != 'stock'} for product_id in ids]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self.version,
+                'cached': self._products is not None,
+                'products': len(self._products) if self._products is not None else 0,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
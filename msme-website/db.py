@@ -0,0 +1,244 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import mysql.connector
+
+import metrics
+import queries
+import storage
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# Thread-safe database connection pool.
+#
+# Keeps up to `size` idle connections around and allows `max_overflow` extra
+# connections under bursts; overflow connections are closed as soon as they
+# are returned. A checkout that cannot be served waits up to `timeout`
+# seconds before raising PoolTimeout. Connections idle for longer than
+# `ping_interval` seconds are pinged before being handed out, and
+# connections older than `recycle` seconds are replaced. Connections are
+# opened with `connect(**connect_args)`, one of the storage backends.
+class ConnectionPool:
+    def __init__(self, size=5, max_overflow=5, timeout=10.0, recycle=3600,
+                 ping_interval=30.0, connect=storage.connect_mysql, **connect_args):
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        self.connect = connect
+        self.connect_args = connect_args
+
+        self._idle = deque()  # (conn, created_at, last_used)
+        self._born = {}       # id(conn) -> created_at for checked-out conns
+        self._open = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self._checkouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._timeouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+
+    # DB_BACKEND=sqlite keeps the database in SQLITE_PATH instead of MySQL
+    @classmethod
+    def from_env(cls):
+        options = dict(
+            size=int(os.getenv('DB_POOL_SIZE', '5')),
+            max_overflow=int(os.getenv('DB_POOL_MAX_OVERFLOW', '5')),
+            timeout=float(os.getenv('DB_POOL_TIMEOUT', '10')),
+            recycle=int(os.getenv('DB_POOL_RECYCLE', '3600')),
+            ping_interval=float(os.getenv('DB_POOL_PING_INTERVAL', '30')),
+        )
+        if BACKEND == 'sqlite':
+            return cls(
+                connect=storage.connect_sqlite,
+                path=os.getenv('SQLITE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'msme.db')),
+                busy_timeout=float(os.getenv('SQLITE_BUSY_TIMEOUT', '10')),
+                synchronous=os.getenv('SQLITE_SYNCHRONOUS', 'FULL'),
+                **options
+            )
+        return cls(
+            connect=storage.connect_mysql,
+            host=os.getenv('DB_HOST', 'localhost'),
+            user=os.getenv('DB_USER', 'root'),
+            password=os.getenv('DB_PASSWORD', ''),
+            database=os.getenv('DB_NAME', 'msme_db'),
+            port=int(os.getenv('DB_PORT', '3306')),
+            **options
+        )
+
+    # Each connection keeps the statements prepared on it (see queries.py)
+    def _connect(self):
+        conn = self.connect(**self.connect_args)
+        conn.statements = queries.StatementCache(conn)
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except mysql.connector.Error:
+            pass
+        with self._cond:
+            self._open -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+    def _healthy(self, conn, created_at, last_used):
+        now = time.monotonic()
+        if self.recycle and now - created_at > self.recycle:
+            return False
+        if now - last_used < self.ping_interval:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def acquire(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited_from = None
+
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout('Connection pool is closed')
+                while not self._idle and self._open >= self.size + self.max_overflow:
+                    remaining = deadline - time.monotonic()
+                    if waited_from is None:
+                        waited_from = time.monotonic()
+                        self._waits += 1
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        self._wait_time += time.monotonic() - waited_from
+                        raise PoolTimeout(f'No database connection available after {timeout}s')
+                    self._cond.wait(remaining)
+                if waited_from is not None:
+                    self._wait_time += time.monotonic() - waited_from
+                    waited_from = None
+                if self._idle:
+                    conn, created_at, last_used = self._idle.pop()
+                else:
+                    conn = None
+                    self._open += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+                created_at = time.monotonic()
+                with self._cond:
+                    self._created += 1
+            elif not self._healthy(conn, created_at, last_used):
+                self._discard(conn)
+                continue
+
+            self._born[id(conn)] = created_at
+            with self._cond:
+                self._checkouts += 1
+            return conn
+
+    def release(self, conn):
+        created_at = self._born.pop(id(conn), time.monotonic())
+        if conn.unread_result:
+            self._discard(conn)
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except mysql.connector.Error:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            if self._closed or len(self._idle) >= self.size:
+                keep = False
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+                keep = True
+                self._cond.notify()
+        if not keep:
+            self._discard(conn)
+
+    # Open up to `count` connections ahead of the first requests
+    def warm(self, count):
+        conns = []
+        try:
+            for _ in range(min(count, self.size)):
+                conns.append(self.acquire())
+        except (mysql.connector.Error, PoolTimeout) as e:
+            logger.error('Database warm-up failed', extra={'error': str(e)})
+        finally:
+            for conn in conns:
+                self.release(conn)
+        return len(conns)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle),
+                'checkouts': self._checkouts,
+                'created': self._created,
+                'discarded': self._discarded,
+                'waits': self._waits,
+                'wait_time': round(self._wait_time, 6),
+                'timeouts': self._timeouts,
+            }
+
+
+BACKEND = os.getenv('DB_BACKEND', 'mysql')
+if BACKEND not in storage.BACKENDS:
+    raise ValueError(f"DB_BACKEND must be one of {', '.join(storage.BACKENDS)}, not {BACKEND!r}")
+
+pool = ConnectionPool.from_env()
+
+
+# Check a connection out of the pool for the duration of a with-block.
+# Yields None when no connection can be obtained so callers keep their
+# existing "if not conn" fallbacks. Uncommitted work is rolled back when the
+# connection goes back to the pool.
+@contextmanager
+def get_db_connection():
+    start = time.perf_counter()
+    try:
+        conn = pool.acquire()
+    except (mysql.connector.Error, PoolTimeout) as e:
+        logger.error('Database connection error', extra={'error': str(e)})
+        yield None
+        return
+    finally:
+        metrics.pool_wait.observe(time.perf_counter() - start)
+
+    try:
+        yield metrics.InstrumentedConnection(conn)
+    finally:
+        pool.release(conn)
@@ -0,0 +1,393 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+
+import responses
+
+
+# Push channel for open dashboards, served as server-sent events by
+# /api/events.
+#
+# Write routes publish small deltas to an in-process Broker once their
+# transaction has committed. Each subscriber owns a bounded queue; publishing
+# appends to every queue and wakes the readers, so an idle dashboard is one
+# thread blocked on an Event and costs nothing until something is written.
+# Backpressure is per subscriber and never blocks the publisher:
+#
+#   - events of a coalesced topic (e.g. dashboard stats, which are always
+#     complete snapshots) replace the one still waiting in the queue
+#     instead of piling up behind it
+#   - a queue that still overflows is emptied and its reader is sent a
+#     single 'resync' event, telling the client to refetch over plain HTTP
+#
+# Event ids are "<broker token>-<sequence>". A reconnecting EventSource sends
+# the last one back in Last-Event-ID and is replayed the events it missed
+# from a short history, or told to resync when they are gone or the id was
+# issued by another worker process.
+#
+# Under gunicorn every worker has its own Broker. A Relay copies events
+# between them through the broadcast_events table: each worker batches the
+# events it publishes into one INSERT per interval, and polls for the others'
+# events only while it has subscribers of its own. Auto-increment ids are
+# handed out before the insert commits, so a poll can see a row before one
+# with a lower id; the ids it skipped over are looked for again for
+# `gap_timeout` seconds. Topics in `local_topics` (e.g. stats, which every
+# worker can compute for itself) are not relayed.
+
+QUEUE_SIZE = 100
+HISTORY_SIZE = 256
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Event:
+    __slots__ = ('id', 'topic', 'data', 'coalesce')
+
+    def __init__(self, event_id, topic, data, coalesce=False):
+        self.id = event_id
+        self.topic = topic
+        self.data = data
+        self.coalesce = coalesce
+
+
+def format_sse(event):
+    data = responses.dumps_bytes(event.data).decode('utf-8')
+    return f'id: {event.id}\nevent: {event.topic}\ndata: {data}\n\n'
+
+
+class Subscription:
+    def __init__(self, broker, topics, queue_size):
+        self.broker = broker
+        self.topics = topics
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._resync = False
+        self._closed = False
+
+    def wants(self, topic):
+        return self.topics is None or topic in self.topics
+
+    def _put(self, event):
+        with self._lock:
+            if self._closed:
+                return
+            if event.coalesce:
+                for position, queued in enumerate(self._queue):
+                    if queued.topic == event.topic:
+                        del self._queue[position]
+                        break
+            if len(self._queue) >= self.queue_size:
+                # Too slow to keep up: drop the backlog and have the client
+                # start over from a fresh fetch
+                self.dropped += len(self._queue) + 1
+                self._queue.clear()
+                self._resync = True
+            else:
+                self._queue.append(event)
+            self._ready.set()
+
+    def resync(self):
+        with self._lock:
+            self._queue.clear()
+            self._resync = True
+            self._ready.set()
+
+    # Wait up to `timeout` seconds for events. Returns a list of events,
+    # empty on timeout, or None once the subscription or broker is closed.
+    def get(self, timeout):
+        self._ready.wait(timeout)
+        with self._lock:
+            if self._closed:
+                return None
+            self._ready.clear()
+            if self._resync:
+                self._resync = False
+                self._queue.clear()
+                return [Event(self.broker.next_id(), 'resync', {})]
+            events = list(self._queue)
+            self._queue.clear()
+            return events
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._queue.clear()
+            self._ready.set()
+        self.broker._unsubscribe(self)
+
+
+class Broker:
+    def __init__(self, max_subscribers=100, queue_size=QUEUE_SIZE, history_size=HISTORY_SIZE, coalesce=()):
+        self.max_subscribers = max_subscribers
+        self.coalesce = frozenset(coalesce)
+        self.queue_size = queue_size
+        self.token = uuid.uuid4().hex[:12]
+        self.relay = None  # forwards local events to other processes
+        self._subscribers = set()
+        self._history = deque(maxlen=history_size)
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self.published = 0
+
+    def next_id(self):
+        with self._lock:
+            self._sequence += 1
+            return f'{self.token}-{self._sequence}'
+
+    # Deliver `data` to every subscriber of `topic`
+    def publish(self, topic, data, relayed=False):
+        with self._lock:
+            if self._closed:
+                return
+            self._sequence += 1
+            event = Event(f'{self.token}-{self._sequence}', topic, data, topic in self.coalesce)
+            self._history.append((self._sequence, event))
+            subscribers = list(self._subscribers)
+            self.published += 1
+        for subscription in subscribers:
+            if subscription.wants(topic):
+                subscription._put(event)
+        if self.relay is not None and not relayed:
+            self.relay.forward(event)
+
+    # Subscribe to `topics` (None for all). With the id of the last event a
+    # client saw, the events it missed are queued straight away.
+    def subscribe(self, topics=None, last_event_id=None):
+        subscription = Subscription(self, topics, self.queue_size)
+        with self._lock:
+            if self._closed or len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers()
+            self._subscribers.add(subscription)
+            missed = self._missed(last_event_id) if last_event_id else []
+        if missed is None:
+            subscription.resync()
+        else:
+            for event in missed:
+                if subscription.wants(event.topic):
+                    subscription._put(event)
+        return subscription
+
+    # Events after `last_event_id`, or None when they cannot be replayed
+    def _missed(self, last_event_id):
+        token, _, sequence = last_event_id.rpartition('-')
+        if token != self.token or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        if sequence >= self._sequence:
+            return []
+        if not self._history or self._history[0][0] > sequence + 1:
+            return None
+        return [event for number, event in self._history if number > sequence]
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    # End every open stream, e.g. on shutdown
+    def close(self):
+        with self._lock:
+            self._closed = True
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.close()
+
+    def stats(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {
+            'subscribers': len(subscribers),
+            'published': self.published,
+            'dropped': sum(subscription.dropped for subscription in subscribers),
+        }
+
+
+# Run `fn` at most once per `delay` seconds however often it is triggered,
+# e.g. to recompute dashboard stats once after a burst of bills
+class Debouncer:
+    def __init__(self, fn, delay=1.0):
+        self.fn = fn
+        self.delay = delay
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def trigger(self):
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(self.delay, self._run)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _run(self):
+        with self._lock:
+            self._timer = None
+        self.fn()
+
+    def cancel(self):
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+
+
+def create_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_events (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            origin VARCHAR(64) NOT NULL,
+            topic VARCHAR(32) NOT NULL,
+            data MEDIUMTEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_broadcast_created (created_at)
+        )
+    ''')
+
+
+# Copies events between the Brokers of different processes through MySQL
+class Relay:
+    def __init__(self, broker, get_connection, interval=1.0, retention=600, batch_size=500,
+                 gap_timeout=10.0, local_topics=()):
+        self.broker = broker
+        self.get_connection = get_connection
+        self.interval = interval
+        self.retention = retention
+        self.batch_size = batch_size
+        self.gap_timeout = gap_timeout
+        self.local_topics = frozenset(local_topics)
+        self.origin = f'{socket.gethostname()[:40]}:{os.getpid()}:{broker.token}'
+        self.on_received = None  # called after publishing events from other processes
+        self._outbox = []
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._last_id = None
+        self._gaps = {}  # ids skipped over by a poll -> when to stop looking for them
+        self._pruned_at = 0.0
+
+        self.failures = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.broker.relay = self
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='event-relay', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+        self._flush()
+
+    def forward(self, event):
+        if event.topic in self.local_topics:
+            return
+        with self._lock:
+            if len(self._outbox) < 10 * self.batch_size:
+                self._outbox.append((self.origin, event.topic, json.dumps(event.data, default=responses._default)))
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self._flush()
+                if self.broker.has_subscribers():
+                    self._poll()
+                else:
+                    self._last_id = None  # catch up from "now" once someone subscribes
+                    self._gaps.clear()
+                if time.monotonic() - self._pruned_at > self.retention:
+                    self._prune()
+            except Exception:
+                self.failures += 1
+
+    def _flush(self):
+        with self._lock:
+            rows, self._outbox = self._outbox, []
+        if not rows:
+            return
+        with self.get_connection() as conn:
+            if not conn:
+                return
+            cursor = conn.cursor()
+            try:
+                cursor.executemany("INSERT INTO broadcast_events (origin, topic, data) VALUES (%s, %s, %s)", rows)
+                conn.commit()
+            finally:
+                cursor.close()
+
+    def _poll(self):
+        with self.get_connection() as conn:
+            if not conn:
+                return
+            cursor = conn.cursor()
+            try:
+                if self._last_id is None:
+                    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM broadcast_events")
+                    self._last_id = cursor.fetchone()[0]
+                    return
+                now = time.monotonic()
+                self._gaps = {event_id: until for event_id, until in self._gaps.items() if until > now}
+                gaps = sorted(self._gaps)
+                where = "id > %s"
+                if gaps:
+                    where += f" OR id IN ({', '.join(['%s'] * len(gaps))})"
+                cursor.execute(
+                    f"SELECT id, origin, topic, data FROM broadcast_events WHERE {where} ORDER BY id LIMIT %s",
+                    (self._last_id, *gaps, self.batch_size)
+                )
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+        received = False
+        for event_id, origin, topic, data in rows:
+            if event_id > self._last_id:
+                for missing in range(self._last_id + 1, event_id):
+                    if len(self._gaps) >= self.batch_size:
+                        break
+                    self._gaps[missing] = now + self.gap_timeout
+                self._last_id = event_id
+            else:
+                self._gaps.pop(event_id, None)
+            if origin != self.origin:
+                self.broker.publish(topic, json.loads(data), relayed=True)
+                received = True
+        if received and self.on_received:
+            self.on_received()
+
+    def _prune(self):
+        self._pruned_at = time.monotonic()
+        with self.get_connection() as conn:
+            if not conn:
+                return
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    "DELETE FROM broadcast_events WHERE created_at < NOW() - INTERVAL %s SECOND LIMIT 10000",
+                    (self.retention,)
+                )
+                conn.commit()
+            finally:
+                cursor.close()
+
+    def stats(self):
+        with self._lock:
+            queued = len(self._outbox)
+        return {'running': self._thread is not None, 'outbox': queued, 'failures': self.failures}
@@ -0,0 +1,98 @@
+import csv
+import io
+import tempfile
+
+from openpyxl import Workbook
+
+import archive
+import queries
+from pagination import date_range
+
+
+# Streaming bill export. Rows are read from the connection's prepared
+# statement (see queries.py) in chunks and written out as they arrive, so
+# memory stays flat however many line items the export covers.
+
+COLUMNS = [
+    'bill_id', 'created_at', 'customer_name', 'customer_phone',
+    'subtotal', 'gst', 'total', 'item_name', 'quantity', 'price', 'gst_rate'
+]
+
+CHUNK_SIZE = 2000
+
+
+def like_prefix(value):
+    return value.replace('\\', '\\\\').replace('%', r'\%').replace('_', r'\_') + '%'
+
+
+# Build the export query from request filters. Dates are turned into a
+# half-open created_at range so the bills index can be used. Archived bills
+# are included only when the range starts before `archived_before`.
+def build_query(date_from=None, date_to=None, customer=None, phone=None, archived_before=None):
+    conditions, params = date_range('b.created_at', date_from, date_to)
+    if customer:
+        conditions.append("b.customer_name LIKE %s")
+        params.append(like_prefix(customer))
+    if phone:
+        conditions.append("b.customer_phone = %s")
+        params.append(phone)
+
+    where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+    selects = [
+        f"""
+        SELECT b.id, b.created_at, b.customer_name, b.customer_phone,
+               b.subtotal, b.gst, b.total,
+               bi.item_name, bi.quantity, bi.price, bi.gst_rate
+        FROM {bills} b
+        LEFT JOIN {items} bi ON b.id = bi.bill_id
+        {where}
+        """
+        for bills, items in zip(archive.tables_for('bills', archived_before, date_from),
+                                archive.tables_for('bill_items', archived_before, date_from))
+    ]
+    if len(selects) == 1:
+        return selects[0] + "ORDER BY b.created_at DESC, b.id DESC", params
+    # Sorting the union costs a filesort, paid only by exports reaching
+    # into archived months
+    sql = f"SELECT * FROM ({' UNION ALL '.join(selects)}) exported ORDER BY created_at DESC, id DESC"
+    return sql, params * len(selects)
+
+
+# Closing mid-stream leaves rows unread on the connection; the pool discards
+# such connections rather than draining them
+def fetch_chunks(conn, sql, params, chunk_size=CHUNK_SIZE):
+    for _, rows in queries.stream(conn, queries.Query('export_bills', sql), params, chunk_size):
+        yield rows
+
+
+def csv_stream(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+# openpyxl's write-only mode spools rows to a temporary file instead of
+# keeping cells in memory. The finished workbook is then sent in blocks.
+def xlsx_stream(chunks, block_size=64 * 1024):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Bills')
+    sheet.append(COLUMNS)
+    for rows in chunks:
+        for row in rows:
+            sheet.append(row)
+
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            block = output.read(block_size)
+            if not block:
+                break
+            yield block
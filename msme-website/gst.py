@@ -0,0 +1,153 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# GST computation in integer paise.
+#
+# Prices are converted to paise once, so line amounts and sums are exact
+# integers and only tax is ever rounded, half up to the paisa. Two rounding
+# rules are supported:
+#
+#   'rate' - taxable values are summed per rate and tax is rounded once per
+#            rate, as on a tax invoice with a rate-wise summary (default)
+#   'line' - tax is rounded on every line and the rounded amounts are summed
+#
+# Each rate's tax is split into CGST and SGST halves; an odd paisa goes to
+# CGST. A NumPy path computes the same totals for many invoices at once.
+
+RATES = (0, 5, 12, 18, 28)
+DEFAULT_RATE = 18
+ROUNDING_MODES = ('rate', 'line')
+
+_PAISA = Decimal('0.01')
+
+
+def to_paise(value):
+    if type(value) is int and value >= 0:
+        return value * 100
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f'Invalid amount: {value}')
+    if not amount.is_finite() or amount < 0:
+        raise ValueError(f'Invalid amount: {value}')
+    return int(amount.scaleb(2).to_integral_value(ROUND_HALF_UP))
+
+
+def from_paise(paise):
+    return (Decimal(paise) / 100).quantize(_PAISA)
+
+
+def parse_rate(value):
+    if type(value) is int and value in RATES:
+        return value
+    try:
+        rate = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f'Invalid GST rate: {value}')
+    if rate not in RATES:
+        raise ValueError(f'Unsupported GST rate: {value}')
+    return int(rate)
+
+
+def parse_quantity(value):
+    if type(value) is int and value > 0:
+        return value
+    try:
+        quantity = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f'Invalid quantity: {value}')
+    if quantity != quantity.to_integral_value() or quantity <= 0:
+        raise ValueError(f'Invalid quantity: {value}')
+    return int(quantity)
+
+
+# Tax on `taxable` paise at a whole-number percentage, rounded half up
+def tax_paise(taxable, rate):
+    return (taxable * rate + 50) // 100
+
+
+# Normalise bill items to (price paise, quantity, rate) tuples
+def parse_lines(items):
+    return [
+        (to_paise(item['price']), parse_quantity(item['quantity']), parse_rate(item.get('gst', DEFAULT_RATE)))
+        for item in items
+    ]
+
+
+def compute_invoice(lines, rounding='rate'):
+    if rounding not in ROUNDING_MODES:
+        raise ValueError(f'Unknown rounding mode: {rounding}')
+
+    taxable = {}
+    line_tax = {}
+    for price, quantity, rate in lines:
+        amount = price * quantity
+        taxable[rate] = taxable.get(rate, 0) + amount
+        if rounding == 'line':
+            line_tax[rate] = line_tax.get(rate, 0) + tax_paise(amount, rate)
+
+    breakup = []
+    for rate in sorted(taxable):
+        tax = line_tax[rate] if rounding == 'line' else tax_paise(taxable[rate], rate)
+        cgst = tax - tax // 2
+        breakup.append({'rate': rate, 'taxable': taxable[rate], 'cgst': cgst, 'sgst': tax - cgst, 'tax': tax})
+
+    subtotal = sum(taxable.values())
+    gst = sum(entry['tax'] for entry in breakup)
+    return {'subtotal': subtotal, 'gst': gst, 'total': subtotal + gst, 'breakup': breakup}
+
+
+# Amounts of a compute_invoice() result as rupee Decimals
+def as_rupees(invoice):
+    return {
+        'subtotal': from_paise(invoice['subtotal']),
+        'gst': from_paise(invoice['gst']),
+        'total': from_paise(invoice['total']),
+        'breakup': [
+            {'rate': entry['rate'], **{key: from_paise(entry[key]) for key in ('taxable', 'cgst', 'sgst', 'tax')}}
+            for entry in invoice['breakup']
+        ],
+    }
+
+
+# Totals for many invoices at once. Takes equal-length integer arrays with
+# one entry per line (invoice index, price in paise, quantity, rate) and
+# returns (subtotal, gst, total) arrays in paise, one entry per invoice,
+# matching compute_invoice() exactly.
+def batch_totals(invoice, price, quantity, rate, rounding='rate', invoices=None):
+    import numpy as np
+
+    if rounding not in ROUNDING_MODES:
+        raise ValueError(f'Unknown rounding mode: {rounding}')
+    invoice = np.asarray(invoice, dtype=np.int64)
+    rate = np.asarray(rate, dtype=np.int64)
+    amount = np.asarray(price, dtype=np.int64) * np.asarray(quantity, dtype=np.int64)
+    if invoices is None:
+        invoices = int(invoice.max()) + 1 if len(invoice) else 0
+
+    rates = np.asarray(RATES, dtype=np.int64)
+    rate_index = np.minimum(np.searchsorted(rates, rate), len(RATES) - 1)
+    if np.any(rates[rate_index] != rate):
+        raise ValueError('Unsupported GST rate in batch')
+
+    subtotal = np.zeros(invoices, dtype=np.int64)
+    np.add.at(subtotal, invoice, amount)
+
+    if rounding == 'line':
+        gst = np.zeros(invoices, dtype=np.int64)
+        np.add.at(gst, invoice, (amount * rate + 50) // 100)
+    else:
+        # Group by (invoice, rate), round each group's tax, then sum per invoice
+        groups = np.zeros((invoices, len(RATES)), dtype=np.int64)
+        np.add.at(groups, (invoice, rate_index), amount)
+        gst = ((groups * rates + 50) // 100).sum(axis=1)
+
+    return subtotal, gst, subtotal + gst
+
+
+# Re-price: tax-inclusive prices in paise for arrays of prices and rates,
+# e.g. to show MRP after a rate change across the whole catalog
+def batch_inclusive_prices(price, rate):
+    import numpy as np
+
+    price = np.asarray(price, dtype=np.int64)
+    return price + (price * np.asarray(rate, dtype=np.int64) + 50) // 100
@@ -0,0 +1,33 @@
+import multiprocessing
+import os
+
+# Production serving: preforked worker processes, each with a pool of threads.
+#
+#   flask --app app init-db          # once, to create the schema
+#   gunicorn -c gunicorn.conf.py 'app:create_app()'
+#
+# The app is not preloaded in the master: each worker builds its own MySQL
+# pool, caches and verification threads, none of which survive a fork.
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+# Each open dashboard event stream (/api/events) holds one of these threads
+threads = int(os.getenv('THREADS', '4'))
+preload_app = False
+
+timeout = int(os.getenv('WORKER_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+# Recycle workers now and then to bound slow leaks
+max_requests = int(os.getenv('MAX_REQUESTS', '10000'))
+max_requests_jitter = int(os.getenv('MAX_REQUESTS_JITTER', '1000'))
+
+accesslog = os.getenv('ACCESS_LOG') or None
+errorlog = '-'
+
+
+def worker_exit(server, worker):
+    from app import shutdown
+    shutdown()
@@ -0,0 +1,37 @@
+import threading
+from collections import OrderedDict
+
+
+# Bounded LRU of recently seen idempotency keys (e.g. payment transaction ids)
+# mapped to the row they created (e.g. its id and amount). Lets retried
+# submissions be answered without a database round trip; the unique index in
+# MySQL remains the source of truth for keys that have been evicted or were
+# seen by another process.
+class RecentKeys:
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def add(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'capacity': self.capacity, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,276 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import gst
+
+
+# Bulk inventory import from .xlsx or .csv price lists.
+#
+# The upload is copied to a temporary file and imported by a background
+# thread: rows are streamed from disk (openpyxl in read-only mode for .xlsx),
+# validated CHUNK_SIZE at a time and upserted on the product SKU with one
+# multi-row statement per chunk, each chunk in its own transaction. Only one
+# chunk is ever held in memory. Progress and the first MAX_REPORTED_ERRORS
+# row errors are kept in import_jobs so any worker process can report them.
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+FORMATS = ('xlsx', 'csv')
+
+# Accepted header spellings for each inventory column
+HEADERS = {
+    'sku': 'sku', 'item code': 'sku', 'product code': 'sku',
+    'product_name': 'product_name', 'product name': 'product_name', 'name': 'product_name', 'product': 'product_name',
+    'category': 'category',
+    'price': 'price', 'rate': 'price', 'mrp': 'price',
+    'stock': 'stock', 'quantity': 'stock', 'qty': 'stock',
+    'gst': 'gst_rate', 'gst_rate': 'gst_rate', 'gst rate': 'gst_rate', 'gst %': 'gst_rate',
+    'description': 'description',
+}
+REQUIRED = ('sku', 'product_name', 'category', 'price')
+
+UPSERT_SQL = (
+    "INSERT INTO inventory (sku, product_name, category, price, stock, gst_rate, description) "
+    "VALUES (%s, %s, %s, %s, %s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE product_name = VALUES(product_name), category = VALUES(category), "
+    "price = VALUES(price), stock = VALUES(stock), gst_rate = VALUES(gst_rate), "
+    "description = VALUES(description)"
+)
+
+
+def create_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            filename VARCHAR(255) NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            rows_read INT NOT NULL DEFAULT 0,
+            imported INT NOT NULL DEFAULT 0,
+            failed INT NOT NULL DEFAULT 0,
+            errors MEDIUMTEXT,
+            message VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at DATETIME
+        )
+    ''')
+
+
+def file_format(filename):
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    return extension if extension in FORMATS else None
+
+
+def _raw_rows(path, source_format):
+    if source_format == 'xlsx':
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    else:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            yield from csv.reader(f)
+
+
+# Yield (row number, {column: value}) for every non-empty data row. Row
+# numbers match what a spreadsheet shows, header being row 1.
+def read_rows(path, source_format):
+    rows = _raw_rows(path, source_format)
+    header = next(rows, None)
+    if header is None:
+        raise ValueError('File is empty')
+    columns = [HEADERS.get(str(name).strip().lower()) if name is not None else None for name in header]
+    missing = [name for name in REQUIRED if name not in columns]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+
+    for number, values in enumerate(rows, start=2):
+        if not values or all(value in (None, '') for value in values):
+            continue
+        yield number, {column: value for column, value in zip(columns, values) if column}
+
+
+def _text(row, column, limit, required=True):
+    value = row.get(column)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # spreadsheet cells hold codes like 1001 as floats
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f'{column} is required')
+    if len(value) > limit:
+        raise ValueError(f'{column} is longer than {limit} characters')
+    return value
+
+
+# Turn one file row into upsert parameters, raising ValueError on bad data
+def validate(row):
+    sku = _text(row, 'sku', 64)
+    name = _text(row, 'product_name', 255)
+    category = _text(row, 'category', 100)
+    price = row.get('price')
+    if price in (None, ''):
+        raise ValueError('price is required')
+    paise = gst.to_paise(price)
+    if paise >= 10 ** 10:  # DECIMAL(10,2)
+        raise ValueError(f'Invalid price: {price}')
+    stock = row.get('stock')
+    try:
+        stock = Decimal(0) if stock in (None, '') else Decimal(str(stock).strip())
+    except InvalidOperation:
+        raise ValueError(f'Invalid stock: {row.get("stock")}')
+    if not stock.is_finite() or stock != stock.to_integral_value() or not 0 <= stock < 2 ** 31:  # INT
+        raise ValueError(f'Invalid stock: {row.get("stock")}')
+    rate = row.get('gst_rate')
+    rate = gst.parse_rate(gst.DEFAULT_RATE if rate in (None, '') else rate)
+    description = _text(row, 'description', 65535, required=False)
+    return (sku, name, category, gst.from_paise(paise), int(stock), Decimal(rate), description)
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ImportJobs:
+    def __init__(self, get_connection, workers=1, chunk_size=CHUNK_SIZE):
+        self.get_connection = get_connection
+        self.chunk_size = chunk_size
+        self.on_finished = None  # called after a job that changed inventory
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='import')
+        self._stopping = threading.Event()
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def create(self, filename):
+        with self.get_connection() as conn:
+            if not conn:
+                raise RuntimeError('Database connection failed')
+            cursor = conn.cursor()
+            try:
+                cursor.execute("INSERT INTO import_jobs (filename) VALUES (%s)", (filename[:255],))
+                conn.commit()
+                return cursor.lastrowid
+            finally:
+                cursor.close()
+
+    # Import `path` in the background; the file is removed afterwards
+    def submit(self, job_id, path, source_format):
+        with self._lock:
+            self._active += 1
+        self._executor.submit(self._run, job_id, path, source_format)
+
+    def status(self, job_id):
+        with self.get_connection() as conn:
+            if not conn:
+                return None
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute(
+                    "SELECT id, filename, status, rows_read, imported, failed, errors, message, created_at, finished_at "
+                    "FROM import_jobs WHERE id = %s",
+                    (job_id,)
+                )
+                job = cursor.fetchone()
+            finally:
+                cursor.close()
+        if job is not None:
+            job['errors'] = json.loads(job['errors']) if job['errors'] else []
+        return job
+
+    # Stop after the chunk in progress; unfinished and queued jobs end as
+    # 'cancelled' with their files removed
+    def stop(self):
+        self._stopping.set()
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            return {'active': self._active}
+
+    def _update(self, job_id, status, progress, message=None, finished=False):
+        with self.get_connection() as conn:
+            if not conn:
+                return
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    "UPDATE import_jobs SET status = %s, rows_read = %s, imported = %s, failed = %s, errors = %s, "
+                    "message = %s, finished_at = %s WHERE id = %s",
+                    (status, progress['rows_read'], progress['imported'], progress['failed'],
+                     json.dumps(progress['errors']), message, datetime.now() if finished else None, job_id)
+                )
+                conn.commit()
+            finally:
+                cursor.close()
+
+    def _run(self, job_id, path, source_format):
+        progress = {'rows_read': 0, 'imported': 0, 'failed': 0, 'errors': []}
+        try:
+            self._update(job_id, 'running', progress)
+            for chunk in _chunks(read_rows(path, source_format), self.chunk_size):
+                if self._stopping.is_set():
+                    self._update(job_id, 'cancelled', progress, 'Stopped by server shutdown', finished=True)
+                    return
+                valid = []
+                for number, row in chunk:
+                    try:
+                        valid.append(validate(row))
+                    except (ValueError, TypeError) as e:
+                        progress['failed'] += 1
+                        if len(progress['errors']) < MAX_REPORTED_ERRORS:
+                            progress['errors'].append({'row': number, 'sku': row.get('sku'), 'message': str(e)})
+                if valid:
+                    self._upsert(valid)
+                progress['rows_read'] += len(chunk)
+                progress['imported'] += len(valid)
+                self._update(job_id, 'running', progress)
+            self._update(job_id, 'done', progress, f"{progress['imported']} rows imported, {progress['failed']} rejected",
+                         finished=True)
+        except Exception as e:
+            self._update(job_id, 'error', progress, str(e)[:255], finished=True)
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            with self._lock:
+                self._active -= 1
+            if progress['imported'] and self.on_finished:
+                self.on_finished()
+
+    def _upsert(self, rows):
+        with self.get_connection() as conn:
+            if not conn:
+                raise RuntimeError('Database connection failed')
+            cursor = conn.cursor()
+            try:
+                conn.start_transaction()
+                cursor.executemany(UPSERT_SQL, rows)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+
+# Copy an uploaded file to a temporary file in blocks for the import thread
+def save_upload(stream, suffix):
+    with tempfile.NamedTemporaryFile(prefix='inventory_import_', suffix=suffix, delete=False) as f:
+        shutil.copyfileobj(stream, f, 1024 * 1024)
+        return f.name
@@ -0,0 +1,209 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+
+
+# Minimal in-process metrics with Prometheus text exposition, plus wrappers
+# that time every query and count the rows it returns. Metrics are per
+# process: under gunicorn each worker reports its own series.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = ('{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+               for k, v in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f'{self.name}{_labels(self.labels, key)} {value}' for key, value in items]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(self.labels, key, ("le", repr(bound)))} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.labels, key, ("le", "+Inf"))} {series[-1]}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, key)} {series[-2]}')
+            lines.append(f'{self.name}_count{_labels(self.labels, key)} {series[-1]}')
+        return lines
+
+
+# Gauge read from a callback at scrape time, e.g. pool or cache stats
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def samples(self):
+        return [f'{self.name} {self.read()}']
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_duration = registry.register(Histogram(
+    'http_request_duration_seconds', 'Request latency by route', ('route', 'method')))
+requests_total = registry.register(Counter(
+    'http_requests_total', 'Requests by route and status', ('route', 'method', 'status')))
+query_duration = registry.register(Histogram(
+    'db_query_duration_seconds', 'Query execution time by statement', ('query',)))
+query_rows = registry.register(Counter(
+    'db_query_rows_total', 'Rows fetched by statement', ('query',)))
+pool_wait = registry.register(Histogram(
+    'db_pool_wait_seconds', 'Time spent waiting for a pooled connection'))
+requests_rejected = registry.register(Counter(
+    'http_requests_rejected_total', 'Write requests refused with 429 by reason', ('route', 'reason')))
+
+
+_VERB = re.compile(r'^\s*(?:EXPLAIN\s+)?(\w+)', re.IGNORECASE)
+_TABLE = {
+    'select': re.compile(r'\bFROM\s+`?(\w+)', re.IGNORECASE),
+    'delete': re.compile(r'\bFROM\s+`?(\w+)', re.IGNORECASE),
+    'insert': re.compile(r'\bINTO\s+`?(\w+)', re.IGNORECASE),
+    'replace': re.compile(r'\bINTO\s+`?(\w+)', re.IGNORECASE),
+    'update': re.compile(r'^\s*UPDATE\s+`?(\w+)', re.IGNORECASE),
+    'create': re.compile(r'\b(?:TABLE(?:\s+IF\s+NOT\s+EXISTS)?|ON)\s+`?(\w+)', re.IGNORECASE),
+}
+_statement_labels = {}
+
+
+# Reduce a SQL string to a low-cardinality label such as "select:inventory"
+def statement_label(sql):
+    label = _statement_labels.get(sql)
+    if label is None:
+        text = sql.decode('utf-8', 'replace') if isinstance(sql, bytes) else sql
+        match = _VERB.match(text)
+        verb = match.group(1).lower() if match else 'other'
+        table = _TABLE.get(verb)
+        table = table.search(text) if table else None
+        label = f'{verb}:{table.group(1)}' if table else verb
+        if len(_statement_labels) < 1000:
+            _statement_labels[sql] = label
+    return label
+
+
+# `label` names every statement the cursor runs (e.g. a named query)
+class InstrumentedCursor:
+    def __init__(self, cursor, label=None):
+        self._cursor = cursor
+        self._fixed_label = label
+        self._label = label or 'other'
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        self._label = self._fixed_label or statement_label(operation)
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            query_duration.observe(time.perf_counter() - start, self._label)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        self._label = self._fixed_label or statement_label(operation)
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            query_duration.observe(time.perf_counter() - start, self._label)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            query_rows.inc(self._label)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        query_rows.inc(self._label, amount=len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        query_rows.inc(self._label, amount=len(rows))
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
@@ -0,0 +1,229 @@
+import mysql.connector
+from mysql.connector import errorcode
+
+import storage
+import sync
+
+
+# Versioned schema changes applied on top of the tables from create_tables().
+# Each migration runs once and is recorded in schema_migrations; append new
+# ones to the end of the list and never edit one that has shipped.
+MIGRATIONS = [
+    (1, 'Secondary indexes for hot queries', [
+        # History, export and report queries order or range-scan by time
+        "CREATE INDEX idx_bills_created ON bills (created_at)",
+        "CREATE INDEX idx_payments_created ON payments (created_at)",
+        "CREATE INDEX idx_payments_status_created ON payments (status, created_at)",
+        "CREATE INDEX idx_pickups_scheduled ON waste_pickups (scheduled_at)",
+        # Billing catalog: equality on status, already in product_name order
+        "CREATE INDEX idx_inventory_status_name ON inventory (status, product_name)",
+        # Dashboard low / out of stock counts
+        "CREATE INDEX idx_inventory_stock ON inventory (stock)",
+        "CREATE INDEX idx_inventory_created ON inventory (created_at)",
+    ]),
+    (2, 'Customer phone index for bill exports', [
+        "CREATE INDEX idx_bills_phone_created ON bills (customer_phone, created_at)",
+    ]),
+    (3, 'Status index for pickup history', [
+        "CREATE INDEX idx_pickups_status_scheduled ON waste_pickups (status, scheduled_at)",
+    ]),
+    (4, 'Unique transaction_id on payments', [
+        # Keep the first row of every duplicated transaction
+        """
+            DELETE j FROM verification_jobs j
+            JOIN payments p ON p.id = j.payment_id
+            JOIN payments q ON q.transaction_id = p.transaction_id AND q.id < p.id
+        """,
+        """
+            DELETE p FROM payments p
+            JOIN payments q ON q.transaction_id = p.transaction_id AND q.id < p.id
+        """,
+        "CREATE UNIQUE INDEX uq_payments_transaction ON payments (transaction_id)",
+    ]),
+    (5, 'SKU natural key on inventory for bulk imports', [
+        # NULL for products added one at a time, which never collide
+        "ALTER TABLE inventory ADD COLUMN sku VARCHAR(64) NULL AFTER id",
+        "CREATE UNIQUE INDEX uq_inventory_sku ON inventory (sku)",
+    ]),
+    (6, 'Journal entry key on pickups for write-behind replay', [
+        # NULL for pickups written before the journal existed
+        "ALTER TABLE waste_pickups ADD COLUMN entry_key CHAR(32) NULL",
+        "CREATE UNIQUE INDEX uq_pickups_entry_key ON waste_pickups (entry_key)",
+    ]),
+    (7, 'Compressed archive tables for closed months', [
+        # Same columns and indexes as the hot tables, minus foreign keys
+        "CREATE TABLE bills_archive LIKE bills",
+        "ALTER TABLE bills_archive ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8",
+        "CREATE TABLE bill_items_archive LIKE bill_items",
+        "ALTER TABLE bill_items_archive ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8",
+        "CREATE TABLE payments_archive LIKE payments",
+        "ALTER TABLE payments_archive ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8",
+        """
+            CREATE TABLE archive_state (
+                table_name VARCHAR(32) PRIMARY KEY,
+                archived_before DATETIME NOT NULL
+            )
+        """,
+        """
+            CREATE TABLE archived_periods (
+                table_name VARCHAR(32) NOT NULL,
+                period DATE NOT NULL,
+                row_count INT NOT NULL,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (table_name, period)
+            )
+        """,
+    ]),
+    (8, 'Delta sync from offline stores', [
+        # "<store>:<local bill id>" for bills pushed by a store, else NULL
+        "ALTER TABLE bills ADD COLUMN sync_key VARCHAR(100) NULL",
+        "CREATE UNIQUE INDEX uq_bills_sync_key ON bills (sync_key)",
+        "ALTER TABLE bills_archive ADD COLUMN sync_key VARCHAR(100) NULL",
+        "CREATE UNIQUE INDEX uq_bills_archive_sync_key ON bills_archive (sync_key)",
+        "CREATE INDEX idx_inventory_updated ON inventory (updated_at, id)",
+        """
+            CREATE TABLE sync_stores (
+                store_id VARCHAR(64) PRIMARY KEY,
+                acked_seq BIGINT NOT NULL DEFAULT 0,
+                pushed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            )
+        """,
+    ]),
+]
+
+# SQLite versions of migrations whose MySQL statements storage.translate()
+# cannot rewrite (multi-table DELETE, CREATE TABLE ... LIKE). Index names are
+# per database in SQLite, so the archive tables get their own. On SQLite,
+# which offline stores run on, migration 8 also adds the change log that
+# sync.SyncClient pushes from.
+SQLITE_MIGRATIONS = {
+    4: [
+        """
+            DELETE FROM verification_jobs WHERE payment_id IN (
+                SELECT p.id FROM payments p
+                JOIN payments q ON q.transaction_id = p.transaction_id AND q.id < p.id
+            )
+        """,
+        """
+            DELETE FROM payments WHERE id IN (
+                SELECT p.id FROM payments p
+                JOIN payments q ON q.transaction_id = p.transaction_id AND q.id < p.id
+            )
+        """,
+        "CREATE UNIQUE INDEX uq_payments_transaction ON payments (transaction_id)",
+    ],
+    7: [
+        """
+            CREATE TABLE bills_archive (
+                id INTEGER PRIMARY KEY,
+                customer_name VARCHAR(100) NOT NULL,
+                customer_phone VARCHAR(15),
+                subtotal DECIMAL(10,2) NOT NULL,
+                gst DECIMAL(10,2) NOT NULL,
+                total DECIMAL(10,2) NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+        "CREATE INDEX idx_bills_archive_created ON bills_archive (created_at)",
+        "CREATE INDEX idx_bills_archive_phone_created ON bills_archive (customer_phone, created_at)",
+        """
+            CREATE TABLE bill_items_archive (
+                id INTEGER PRIMARY KEY,
+                bill_id INT,
+                item_name VARCHAR(100) NOT NULL,
+                quantity INT NOT NULL,
+                price DECIMAL(10,2) NOT NULL,
+                gst_rate DECIMAL(5,2) DEFAULT 18.00
+            )
+        """,
+        "CREATE INDEX idx_bill_items_archive_bill ON bill_items_archive (bill_id)",
+        """
+            CREATE TABLE payments_archive (
+                id INTEGER PRIMARY KEY,
+                transaction_id VARCHAR(100) NOT NULL,
+                amount DECIMAL(10,2) NOT NULL,
+                status VARCHAR(20) NOT NULL,
+                verified_at TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+        "CREATE INDEX idx_payments_archive_created ON payments_archive (created_at)",
+        "CREATE INDEX idx_payments_archive_status_created ON payments_archive (status, created_at)",
+        "CREATE UNIQUE INDEX uq_payments_archive_transaction ON payments_archive (transaction_id)",
+        *MIGRATIONS[6][2][6:],  # archive_state and archived_periods translate as they are
+    ],
+    8: [*MIGRATIONS[7][2], *sync.LOCAL_SCHEMA],
+}
+
+# MySQL cannot CREATE INDEX IF NOT EXISTS; objects left behind by a migration
+# that failed half way are skipped on the next run instead of aborting it
+_ALREADY_APPLIED = (
+    errorcode.ER_DUP_KEYNAME,
+    errorcode.ER_DUP_FIELDNAME,
+    errorcode.ER_TABLE_EXISTS_ERROR,
+)
+
+
+def create_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def current_version(cursor):
+    cursor.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_migrations")
+    row = cursor.fetchone()
+    return row['version'] if isinstance(row, dict) else row[0]
+
+
+# Apply pending migrations in order. DDL commits implicitly in MySQL, so each
+# migration is recorded as soon as its statements have run.
+def migrate(conn):
+    overrides = SQLITE_MIGRATIONS if storage.dialect(conn) == 'sqlite' else {}
+    cursor = conn.cursor()
+    try:
+        create_table(cursor)
+        version = current_version(cursor)
+        applied = []
+        for number, description, statements in MIGRATIONS:
+            if number <= version:
+                continue
+            for statement in overrides.get(number, statements):
+                try:
+                    cursor.execute(statement)
+                except mysql.connector.Error as e:
+                    if e.errno not in _ALREADY_APPLIED:
+                        raise
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                (number, description)
+            )
+            conn.commit()
+            applied.append((number, description))
+        return applied
+    finally:
+        cursor.close()
+
+
+# Run EXPLAIN for each (name, sql, params) and return the plan rows of any
+# base table access that uses no index, keyed by query name. Run it against a
+# realistically sized database: on a handful of sample rows the optimizer may
+# rightly prefer a full scan.
+def unindexed_queries(conn, queries):
+    cursor = conn.cursor(dictionary=True)
+    failures = {}
+    try:
+        for name, sql, params in queries:
+            cursor.execute('EXPLAIN ' + sql, params)
+            plan = cursor.fetchall()
+            bad = [row for row in plan
+                   if row.get('table') and not row['table'].startswith('<') and not row.get('key')]
+            if bad:
+                failures[name] = bad
+        return failures
+    finally:
+        cursor.close()
@@ -0,0 +1,89 @@
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta
+
+
+# Keyset pagination over (time column, id) for the history endpoints.
+#
+# Pages are ordered newest first. The opaque cursor handed to clients encodes
+# the time and id of the last row of a page; the next page continues strictly
+# after that key, so each page costs an index range scan no matter how deep
+# the client has paged, unlike OFFSET.
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(timestamp, row_id):
+    raw = json.dumps([timestamp.isoformat(), row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        timestamp, row_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError('Invalid cursor')
+
+
+def page_size(value):
+    if value in (None, ''):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(value), MAX_PAGE_SIZE))
+
+
+# Turn inclusive YYYY-MM-DD bounds into a half-open range on `column`, which
+# unlike DATE(column) = ... can be answered from an index on the column.
+def date_range(column, date_from=None, date_to=None):
+    conditions = []
+    params = []
+    if date_from:
+        conditions.append(f"{column} >= %s")
+        params.append(datetime.strptime(date_from, '%Y-%m-%d'))
+    if date_to:
+        conditions.append(f"{column} < %s")
+        params.append(datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1))
+    return conditions, params
+
+
+# Append keyset, ordering and limit to `base_sql`. One extra row is fetched to
+# tell whether another page exists.
+def page_query(base_sql, time_column, conditions, params, after=None, limit=DEFAULT_PAGE_SIZE):
+    conditions = list(conditions)
+    params = list(params)
+    if after:
+        timestamp, row_id = after
+        conditions.append(f"{time_column} <= %s AND ({time_column} < %s OR id < %s)")
+        params += [timestamp, timestamp, row_id]
+
+    where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+    sql = f"{base_sql} {where} ORDER BY {time_column} DESC, id DESC LIMIT %s"
+    params.append(limit + 1)
+    return sql, params
+
+
+# Combine page queries over tables holding disjoint rows, such as a hot
+# table and its archive, into one statement returning the same page. Each
+# page is a derived table, which SQLite accepts as a UNION member where it
+# rejects a parenthesised SELECT.
+def union_page_query(queries, time_column, limit=DEFAULT_PAGE_SIZE):
+    if len(queries) == 1:
+        return queries[0]
+    sql = ' UNION ALL '.join(f'SELECT * FROM ({sql}) page_{number}' for number, (sql, _) in enumerate(queries))
+    sql += f" ORDER BY {time_column} DESC, id DESC LIMIT %s"
+    params = [param for _, query_params in queries for param in query_params]
+    params.append(limit + 1)
+    return sql, params
+
+
+# Drop the extra row of a page of tuple rows with the given column names and
+# return (rows, cursor for the next page or None)
+def split_page(rows, columns, limit, time_column):
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last[columns.index(time_column)], last[columns.index('id')])
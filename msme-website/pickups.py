@@ -0,0 +1,287 @@
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import mysql.connector
+
+import rollups
+
+
+# Write-behind queue for waste pickups.
+#
+# /api/schedule_pickup appends the pickup to a local SQLite journal (WAL
+# mode, synchronous=NORMAL: one fsync-free append per request that survives
+# a process crash) and answers straight away. A flusher thread moves
+# journaled pickups to MySQL in batches, one transaction per batch together
+# with the rollup counters, and deletes them from the journal once MySQL has
+# committed. While MySQL is unreachable the flusher backs off exponentially
+# with jitter and pickups keep accumulating in the journal; whatever is left
+# there is replayed when the process starts again.
+#
+# The journal file can be shared by every worker process on a host. Batches
+# are claimed in the journal before they are written, and a claim left by a
+# worker that died is taken over after `claim_timeout` seconds. Every pickup
+# carries an entry_key that MySQL keeps unique, so a batch that was committed
+# but not yet removed from the journal is never inserted twice.
+#
+# Pickups show up in /api/pickup_history once flushed, normally within
+# `interval` seconds.
+
+BATCH_SIZE = 500
+
+logger = logging.getLogger('msme')
+
+_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS pickups (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        entry_key TEXT NOT NULL UNIQUE,
+        waste_type TEXT NOT NULL,
+        quantity TEXT NOT NULL,
+        pickup_date TEXT NOT NULL,
+        scheduled_at TEXT NOT NULL,
+        claimed_by TEXT,
+        claimed_at REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        error TEXT
+    )
+'''
+
+INSERT_SQL = (
+    "INSERT INTO waste_pickups (entry_key, waste_type, quantity, pickup_date, status, scheduled_at) "
+    "VALUES (%s, %s, %s, %s, 'scheduled', %s)"
+)
+
+
+# Check a pickup request before it is acknowledged: once journaled it can
+# only fail in the background. Returns (waste_type, quantity, pickup_date).
+def validate(waste_type, quantity, pickup_date):
+    waste_type = (waste_type or '').strip()
+    if not waste_type or quantity in (None, '') or not pickup_date:
+        raise ValueError('Waste type, quantity and pickup date are required')
+    if len(waste_type) > 50:
+        raise ValueError('Waste type is longer than 50 characters')
+    try:
+        quantity = Decimal(str(quantity)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f'Invalid quantity: {quantity}')
+    if not quantity.is_finite() or quantity <= 0 or quantity >= 10 ** 8:  # DECIMAL(10,2)
+        raise ValueError(f'Invalid quantity: {quantity}')
+    try:
+        pickup_date = datetime.strptime(str(pickup_date), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('Pickup date must be in YYYY-MM-DD format')
+    return waste_type, quantity, pickup_date
+
+
+class PickupQueue:
+    def __init__(self, path, get_connection, batch_size=BATCH_SIZE, interval=0.5, max_backoff=60.0,
+                 claim_timeout=120.0):
+        self.path = path
+        self.get_connection = get_connection
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.claim_timeout = claim_timeout
+        self.owner = f'{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.on_flushed = None  # called with the number of pickups written to MySQL
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._backoff = 0.0
+
+        self.flushed = 0
+        self.failures = 0
+
+    def _journal(self):
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(_SCHEMA)
+            self._db = db
+        return self._db
+
+    # Journal one pickup and return its entry key. Raises on a journal error
+    # (e.g. a full disk), in which case nothing was accepted.
+    def append(self, waste_type, quantity, pickup_date, scheduled_at):
+        entry_key = uuid.uuid4().hex
+        with self._db_lock:
+            self._journal().execute(
+                "INSERT INTO pickups (entry_key, waste_type, quantity, pickup_date, scheduled_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (entry_key, waste_type, str(quantity), pickup_date.isoformat(), scheduled_at.isoformat(sep=' '))
+            )
+        return entry_key
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='pickup-flusher', daemon=True)
+            self._thread.start()
+
+    # Stop the flusher after one last flush; unflushed pickups stay in the
+    # journal for the next start
+    def stop(self, timeout=10):
+        self._stopping.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+            try:
+                self.flush()
+            except Exception:
+                logger.warning('Pickups left in journal at shutdown', extra={'pending': self.pending()})
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _run(self):
+        delay = self.interval
+        while not self._stopping.wait(delay):
+            try:
+                written = self.flush()
+                self._backoff = 0.0
+                # Keep going without a pause while there is a backlog
+                delay = 0 if written == self.batch_size else self.interval
+            except Exception as e:
+                self.failures += 1
+                self._backoff = min(max(self.interval, self._backoff * 2), self.max_backoff)
+                delay = self._backoff * random.uniform(0.5, 1.0)
+                logger.warning('Pickup flush failed, retrying', extra={'error': str(e), 'retry_in': round(delay, 2)})
+
+    # Write one batch to MySQL; returns the number of pickups taken off the
+    # journal. Connection errors leave the batch in the journal and raise.
+    def flush(self):
+        batch = self._claim()
+        if not batch:
+            return 0
+        written = len(batch)
+        try:
+            self._write(batch)
+            self._remove([row[0] for row in batch])
+        except (mysql.connector.DataError, mysql.connector.IntegrityError):
+            # Some row MySQL will never accept; write the rest one by one
+            # and park the offenders in the journal
+            for row in batch:
+                try:
+                    self._write([row])
+                except (mysql.connector.DataError, mysql.connector.IntegrityError) as e:
+                    self._mark_failed(row[0], e)
+                    written -= 1
+                else:
+                    self._remove([row[0]])
+        except Exception as e:
+            self._release([row[0] for row in batch], e)
+            raise
+        self.flushed += written
+        if written and self.on_flushed:
+            self.on_flushed(written)
+        return len(batch)
+
+    def _claim(self):
+        now = time.time()
+        with self._db_lock:
+            db = self._journal()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                rows = db.execute(
+                    "SELECT seq, entry_key, waste_type, quantity, pickup_date, scheduled_at FROM pickups "
+                    "WHERE failed = 0 AND (claimed_by IS NULL OR claimed_by = ? OR claimed_at < ?) "
+                    "ORDER BY seq LIMIT ?",
+                    (self.owner, now - self.claim_timeout, self.batch_size)
+                ).fetchall()
+                if rows:
+                    db.execute(
+                        f"UPDATE pickups SET claimed_by = ?, claimed_at = ? "
+                        f"WHERE seq IN ({', '.join('?' * len(rows))})",
+                        [self.owner, now, *(row[0] for row in rows)]
+                    )
+                db.execute('COMMIT')
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+        return rows
+
+    def _write(self, batch):
+        with self.get_connection() as conn:
+            if not conn:
+                raise RuntimeError('Database connection failed')
+            cursor = conn.cursor()
+            try:
+                conn.start_transaction()
+                keys = [row[1] for row in batch]
+                cursor.execute(
+                    f"SELECT entry_key FROM waste_pickups WHERE entry_key IN ({', '.join(['%s'] * len(keys))})",
+                    keys
+                )
+                written = {key for key, in cursor.fetchall()}
+                rows = [
+                    (entry_key, waste_type, Decimal(quantity), pickup_date, datetime.fromisoformat(scheduled_at))
+                    for _, entry_key, waste_type, quantity, pickup_date, scheduled_at in batch
+                    if entry_key not in written
+                ]
+                if rows:
+                    cursor.executemany(INSERT_SQL, rows)
+                    for day, count in Counter(row[4].date() for row in rows).items():
+                        rollups.record(cursor, day, pickups=count)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def _remove(self, seqs):
+        with self._db_lock:
+            self._journal().execute(f"DELETE FROM pickups WHERE seq IN ({', '.join('?' * len(seqs))})", seqs)
+
+    def _release(self, seqs, error):
+        with self._db_lock:
+            self._journal().execute(
+                f"UPDATE pickups SET claimed_by = NULL, claimed_at = NULL, attempts = attempts + 1, error = ? "
+                f"WHERE seq IN ({', '.join('?' * len(seqs))})",
+                [str(error)[:255], *seqs]
+            )
+
+    def _mark_failed(self, seq, error):
+        logger.error('Pickup rejected by database', extra={'seq': seq, 'error': str(error)})
+        with self._db_lock:
+            self._journal().execute(
+                "UPDATE pickups SET failed = 1, claimed_by = NULL, error = ? WHERE seq = ?",
+                (str(error)[:255], seq)
+            )
+
+    def pending(self):
+        with self._db_lock:
+            return self._journal().execute("SELECT COUNT(*) FROM pickups WHERE failed = 0").fetchone()[0]
+
+    def stats(self):
+        with self._db_lock:
+            pending, failed = self._journal().execute(
+                "SELECT COALESCE(SUM(failed = 0), 0), COALESCE(SUM(failed), 0) FROM pickups"
+            ).fetchone()
+        return {
+            'running': self._thread is not None,
+            'pending': pending,
+            'failed': failed,
+            'flushed': self.flushed,
+            'failures': self.failures,
+            'backoff': self._backoff,
+        }
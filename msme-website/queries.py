@@ -0,0 +1,147 @@
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+
+import mysql.connector
+
+import metrics
+
+
+# Read queries run as prepared statements, with tuple rows.
+#
+# Every pooled connection carries a StatementCache (see db.ConnectionPool),
+# used only by the thread that has the connection checked out.
+# On MySQL the first run of a query on a connection prepares it server-side
+# and keeps the prepared cursor; later runs send only the statement id and
+# the parameters, and rows come back over the binary protocol already typed
+# (Decimal, datetime) instead of as text the connector parses per value.
+# mysql-connector reuses a prepared statement only when it is handed the
+# very same string object, so the cache hands back the string it was first
+# given along with the cursor. On SQLite the cursor is cached the same way
+# and sqlite3 keeps the compiled statement (see storage.py).
+#
+# Results are a Result: column names once, rows as plain tuples, no dict
+# per row. A Query names its statement, and the query metrics are labelled
+# with that name instead of verb:table.
+
+STATEMENT_CACHE_SIZE = 64  # per connection; MySQL caps prepared statements server-wide
+
+
+class Query:
+    __slots__ = ('name', 'sql')
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+
+    def __repr__(self):
+        return f'Query({self.name!r})'
+
+
+@lru_cache(maxsize=256)
+def record_type(columns):
+    return namedtuple('Record', columns, rename=True)
+
+
+class Result:
+    __slots__ = ('columns', 'rows')
+
+    def __init__(self, columns, rows):
+        self.columns = tuple(columns)
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def index(self, name):
+        return self.columns.index(name)
+
+    def column(self, name):
+        index = self.columns.index(name)
+        return [row[index] for row in self.rows]
+
+    # Rows as namedtuples, for callers that read fields by name
+    def records(self):
+        return list(map(record_type(self.columns)._make, self.rows))
+
+    def first(self):
+        return record_type(self.columns)._make(self.rows[0]) if self.rows else None
+
+
+class StatementCache:
+    def __init__(self, conn, size=STATEMENT_CACHE_SIZE):
+        self.conn = conn
+        self.size = size
+        self._statements = OrderedDict()  # sql -> (sql object, cursor)
+
+    # (sql, cursor) prepared for `sql` on this connection
+    def get(self, sql, label=None):
+        entry = self._statements.get(sql)
+        if entry is not None:
+            self._statements.move_to_end(sql)
+            return entry
+        entry = self._statements[sql] = (sql, metrics.InstrumentedCursor(self.conn.cursor(prepared=True), label))
+        if len(self._statements) > self.size:
+            _close(self._statements.popitem(last=False)[1][1])
+        return entry
+
+    # Forget a statement whose cursor may be unusable (e.g. after an error
+    # or with rows left unread)
+    def discard(self, sql):
+        entry = self._statements.pop(sql, None)
+        if entry is not None:
+            _close(entry[1])
+
+    def __len__(self):
+        return len(self._statements)
+
+
+def _close(cursor):
+    try:
+        cursor.close()
+    except mysql.connector.Error:
+        pass
+
+
+def _execute(conn, query, params):
+    sql, label = (query.sql, f'query:{query.name}') if isinstance(query, Query) else (query, None)
+    cache = conn.statements
+    sql, cursor = cache.get(sql, label)
+    try:
+        cursor.execute(sql, tuple(params))
+    except Exception:
+        cache.discard(sql)
+        raise
+    return cache, sql, cursor
+
+
+# Run a read query and return all of its rows
+def fetch(conn, query, params=()):
+    cache, sql, cursor = _execute(conn, query, params)
+    try:
+        rows = cursor.fetchall()
+    except Exception:
+        cache.discard(sql)
+        raise
+    return Result([column[0] for column in cursor.description], rows)
+
+
+# Run a read query and yield (columns, rows) in chunks of `chunk_size` rows.
+# A stream closed early discards its statement, leaving no unread rows on
+# the connection's cached cursor.
+def stream(conn, query, params=(), chunk_size=1000):
+    cache, sql, cursor = _execute(conn, query, params)
+    finished = False
+    try:
+        columns = tuple(column[0] for column in cursor.description)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield columns, rows
+        finished = True
+    finally:
+        if not finished:
+            cache.discard(sql)
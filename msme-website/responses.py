@@ -0,0 +1,200 @@
+import gzip
+import json
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Response encoding for the JSON APIs: a faster JSON provider, column
+# projection and an optional columnar layout for list endpoints, and
+# gzip/brotli compression negotiated from Accept-Encoding.
+#
+# Decimals are written as JSON numbers and dates/datetimes as ISO 8601,
+# where Flask's provider writes strings and HTTP dates; clients format
+# amounts to the paisa themselves. orjson and brotli are used when
+# installed; without them encoding falls back to the json module and
+# compression to gzip.
+
+COMPRESS_MIN_SIZE = 1024
+COMPRESSIBLE = ('application/json', 'text/csv', 'text/plain', 'text/html')
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # quality 11 is far too slow for per-request compression
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', 'replace')
+    if isinstance(value, set):
+        return list(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps_bytes(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is not None:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
+
+
+# Columns to select for ?fields=a,b,c, restricted to `allowed`. Columns in
+# `required` (e.g. the keys a pagination cursor is built from) are always
+# included. Raises ValueError on unknown names.
+def projection(fields, allowed, required=()):
+    if not fields:
+        return list(allowed)
+    requested = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in requested if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return list(dict.fromkeys([*required, *requested]))
+
+
+# Converters for values the JSON encoder cannot write natively; orjson
+# writes dates and datetimes itself
+_COLUMN_CONVERTERS = {Decimal: float, timedelta: timedelta.total_seconds}
+if orjson is None:
+    _COLUMN_CONVERTERS.update({datetime: datetime.isoformat, date: date.isoformat, time: time.isoformat})
+
+
+# Columns of tuple rows, ready for the encoder. A column's converter is
+# picked once from its first non-NULL value rather than through the
+# encoder's fallback for every value. Rows serialized as objects skip this:
+# transposing them back costs more than the fallback does.
+def json_columns(columns, rows):
+    values_by_column = [list(values) for values in zip(*rows)] if rows else [[] for _ in columns]
+    for values in values_by_column:
+        convert = next((_COLUMN_CONVERTERS.get(type(value)) for value in values if value is not None), None)
+        if convert is not None:
+            values[:] = [None if value is None else convert(value) for value in values]
+    return values_by_column
+
+
+# Serialize a queries.Result as a list of objects, or with ?format=columns as
+# {"columns": [...], "data": [[column values], ...], "count": n}, which
+# repeats no keys and compresses better. `extra` adds computed columns
+# (name -> values, one per row).
+def rows_response(app, result, extra=None):
+    columns = [*result.columns, *(extra or ())]
+    rows = result.rows
+    if extra:
+        rows = [(*row, *values) for row, *values in zip(rows, *extra.values())]
+    if request.args.get('format') == 'columns':
+        return app.json.response({'columns': columns, 'data': json_columns(columns, rows), 'count': len(rows)})
+    return app.json.response([dict(zip(columns, row)) for row in rows])
+
+
+def _accepted(header):
+    accepted = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def choose_encoding(header):
+    accepted = _accepted(header or '')
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+def compress_bytes(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+# Compressed bodies of responses carrying an ETag (e.g. the product
+# catalog), so an unchanged body is not compressed again on every request
+class CompressedCache:
+    def __init__(self, capacity=16):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+
+_compressed = CompressedCache()
+
+
+# after_request hook: compress eligible responses for clients that accept it
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+
+    etag, weak = response.get_etag()
+    compressed = _compressed.get((etag, encoding)) if etag else None
+    if compressed is None:
+        compressed = compress_bytes(body, encoding)
+        if etag:
+            _compressed.put((etag, encoding), compressed)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    if etag and not weak:
+        # The encoded body is no longer byte-identical to the entity
+        response.set_etag(etag, weak=True)
+    return response
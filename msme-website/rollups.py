@@ -0,0 +1,114 @@
+import random
+
+
+# Summary counters maintained at write time so that /api/reports/summary and
+# /api/dashboard/stats read a handful of rows instead of scanning history.
+#
+# Every write adds its deltas to an all-time row in summary_counters and to
+# today's row in daily_rollups inside the writer's own transaction. Both
+# tables are split into SLOTS rows picked at random per write, so concurrent
+# terminals rarely wait on the same row lock; readers simply add the slots up.
+
+SLOTS = 8
+
+METRICS = ('revenue', 'bills', 'payments', 'verified_payments', 'pickups')
+
+
+def create_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS summary_counters (
+            slot TINYINT PRIMARY KEY,
+            revenue DECIMAL(15,2) NOT NULL DEFAULT 0,
+            bills INT NOT NULL DEFAULT 0,
+            payments INT NOT NULL DEFAULT 0,
+            verified_payments INT NOT NULL DEFAULT 0,
+            pickups INT NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_rollups (
+            day DATE NOT NULL,
+            slot TINYINT NOT NULL,
+            revenue DECIMAL(15,2) NOT NULL DEFAULT 0,
+            bills INT NOT NULL DEFAULT 0,
+            payments INT NOT NULL DEFAULT 0,
+            verified_payments INT NOT NULL DEFAULT 0,
+            pickups INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, slot)
+        )
+    ''')
+
+
+# Add deltas for `day`. Call inside the transaction that makes the change.
+def record(cursor, day, **deltas):
+    names = [name for name in METRICS if deltas.get(name)]
+    if not names:
+        return
+    values = [deltas[name] for name in names]
+    columns = ', '.join(names)
+    placeholders = ', '.join(['%s'] * len(names))
+    updates = ', '.join(f'{name} = {name} + %s' for name in names)
+    slot = random.randrange(SLOTS)
+
+    cursor.execute(
+        f"INSERT INTO summary_counters (slot, {columns}) VALUES (%s, {placeholders}) "
+        f"ON DUPLICATE KEY UPDATE {updates}",
+        [slot] + values + values
+    )
+    cursor.execute(
+        f"INSERT INTO daily_rollups (day, slot, {columns}) VALUES (%s, %s, {placeholders}) "
+        f"ON DUPLICATE KEY UPDATE {updates}",
+        [day, slot] + values + values
+    )
+
+
+def _sum_columns():
+    return ', '.join(f'COALESCE(SUM({name}), 0) as {name}' for name in METRICS)
+
+
+# Works with both plain and dictionary cursors
+def _row(cursor):
+    row = cursor.fetchone()
+    return row if isinstance(row, dict) else dict(zip(METRICS, row))
+
+
+def totals(cursor):
+    cursor.execute(f"SELECT {_sum_columns()} FROM summary_counters")
+    return _row(cursor)
+
+
+def day_totals(cursor, day):
+    cursor.execute(f"SELECT {_sum_columns()} FROM daily_rollups WHERE day = %s", (day,))
+    return _row(cursor)
+
+
+# Recompute both tables from the base tables and their archives. Used after
+# bulk loads, manual fixes or when the rollups are first introduced on an
+# existing database.
+def rebuild(cursor):
+    cursor.execute("DELETE FROM daily_rollups")
+    cursor.execute("DELETE FROM summary_counters")
+    cursor.execute('''
+        INSERT INTO daily_rollups (day, slot, revenue, bills)
+        SELECT DATE(created_at), 0, SUM(total), COUNT(*)
+        FROM (SELECT created_at, total FROM bills UNION ALL SELECT created_at, total FROM bills_archive) b
+        GROUP BY DATE(created_at)
+    ''')
+    cursor.execute('''
+        INSERT INTO daily_rollups (day, slot, payments, verified_payments)
+        SELECT DATE(created_at), 0, COUNT(*), SUM(CASE WHEN status = 'verified' THEN 1 ELSE 0 END)
+        FROM (SELECT created_at, status FROM payments UNION ALL SELECT created_at, status FROM payments_archive) p
+        GROUP BY DATE(created_at)
+        ON DUPLICATE KEY UPDATE payments = VALUES(payments), verified_payments = VALUES(verified_payments)
+    ''')
+    cursor.execute('''
+        INSERT INTO daily_rollups (day, slot, pickups)
+        SELECT DATE(scheduled_at), 0, COUNT(*)
+        FROM waste_pickups
+        GROUP BY DATE(scheduled_at)
+        ON DUPLICATE KEY UPDATE pickups = VALUES(pickups)
+    ''')
+    cursor.execute(f'''
+        INSERT INTO summary_counters (slot, {', '.join(METRICS)})
+        SELECT 0, {_sum_columns()} FROM daily_rollups
+    ''')
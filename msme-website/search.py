@@ -0,0 +1,258 @@
+import heapq
+import re
+from bisect import bisect_left, insort
+
+
+# In-memory search index over product names and categories.
+#
+# Names and categories are split into lowercase terms. Each query term is
+# matched against the term vocabulary in three ways, best first:
+#
+#   exact   - the whole term
+#   prefix  - terms starting with the query term (found by bisecting the
+#             sorted vocabulary, the flat equivalent of a prefix trie)
+#   fuzzy   - terms within one or two edits of the query term or of a prefix
+#             of the same length, found through a trigram index so that only
+#             terms sharing enough trigrams are compared
+#
+# A product matches when every query term matches one of its terms; matches
+# in the name count twice as much as matches in the category, and ties are
+# broken by name. Each term also keeps its products in name order per field,
+# so a one-word query (the common case while typing) walks those lists best
+# score first and stops after `limit` hits instead of ranking every match.
+# Longer queries are scored with set operations on whole score tiers.
+# The index only ever grows between loads; callers filter out products that
+# are no longer sellable.
+
+EXACT = 3.0
+PREFIX = 2.0
+FUZZY = 1.0
+NAME_WEIGHT = 1.0
+CATEGORY_WEIGHT = 0.5
+
+_TERM = re.compile(r'\w+')
+
+
+def terms(text):
+    return _TERM.findall(text.lower()) if text else []
+
+
+def trigrams(term):
+    padded = f'^{term}'
+    return {padded[i:i + 3] for i in range(max(1, len(padded) - 2))}
+
+
+def max_edits(term):
+    if len(term) < 4:
+        return 0
+    return 1 if len(term) < 8 else 2
+
+
+# Damerau-Levenshtein (optimal string alignment) distance between a and b, or
+# limit + 1 as soon as it is certain to exceed limit
+def bounded_distance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        best = current[0]
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+            best = min(best, value)
+        if best > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class ProductIndex:
+    def __init__(self):
+        self._ids = {}  # (term, field weight) -> set of product ids
+        self._ordered = {}  # (term, field weight) -> [(sort key, product id)] in name order
+        self._vocabulary = []  # sorted terms
+        self._grams = {}  # trigram -> set of terms
+        self._keys = {}  # product id -> sort key for ties
+        self._order = []  # (sort key, product id) for every product in name order
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, product_id, name, category, key=None):
+        if product_id not in self._keys:
+            self._keys[product_id] = key if key is not None else (name.lower(), product_id)
+            insort(self._order, (self._keys[product_id], product_id))
+        for field, weight in ((category, CATEGORY_WEIGHT), (name, NAME_WEIGHT)):
+            for term in terms(field):
+                position = bisect_left(self._vocabulary, term)
+                if position == len(self._vocabulary) or self._vocabulary[position] != term:
+                    self._vocabulary.insert(position, term)
+                    for gram in trigrams(term):
+                        self._grams.setdefault(gram, set()).add(term)
+                ids = self._ids.setdefault((term, weight), set())
+                if product_id not in ids:
+                    ids.add(product_id)
+                    insort(self._ordered.setdefault((term, weight), []), (self._keys[product_id], product_id))
+
+    @classmethod
+    def build(cls, products):
+        index = cls()
+        index._order = sorted(((product['name'].lower(), product['id']), product['id']) for product in products)
+        fields = {product['id']: (product.get('category'), product['name']) for product in products}
+        vocabulary = set()
+        # Walking products in name order leaves every per-term list sorted
+        for key, product_id in index._order:
+            index._keys[product_id] = key
+            category, name = fields[product_id]
+            for field, weight in ((category, CATEGORY_WEIGHT), (name, NAME_WEIGHT)):
+                for term in set(terms(field)):
+                    ids = index._ids.get((term, weight))
+                    if ids is None:
+                        ids = index._ids[(term, weight)] = set()
+                        index._ordered[(term, weight)] = []
+                        vocabulary.add(term)
+                    ids.add(product_id)
+                    index._ordered[(term, weight)].append((key, product_id))
+        index._vocabulary = sorted(vocabulary)
+        for term in index._vocabulary:
+            for gram in trigrams(term):
+                index._grams.setdefault(gram, set()).add(term)
+        return index
+
+    # Bring the index up to date with a fresh product list by adding the
+    # products it has not seen, which is far cheaper than a rebuild. Returns
+    # False when a rebuild is needed instead: an indexed product was renamed,
+    # or most indexed products are gone.
+    def refresh(self, products):
+        if len(self._keys) > 2 * len(products):
+            return False
+        unseen = []
+        for product in products:
+            key = self._keys.get(product['id'])
+            if key is None:
+                unseen.append(product)
+            elif key[0] != product['name'].lower():
+                return False
+        for product in unseen:
+            self.add(product['id'], product['name'], product.get('category'))
+        return True
+
+    # Vocabulary terms matching one query term, with their match score
+    def _matching_terms(self, query):
+        matches = {}
+        position = bisect_left(self._vocabulary, query)
+        if position < len(self._vocabulary) and self._vocabulary[position] == query:
+            matches[query] = EXACT
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(query):
+            matches.setdefault(self._vocabulary[position], PREFIX)
+            position += 1
+
+        limit = max_edits(query)
+        if limit:
+            grams = trigrams(query)
+            shared = {}
+            for gram in grams:
+                for term in self._grams.get(gram, ()):
+                    shared[term] = shared.get(term, 0) + 1
+            needed = max(1, len(grams) - 3 * limit)
+            for term, count in shared.items():
+                if count < needed or term in matches:
+                    continue
+                if (bounded_distance(query, term, limit) <= limit
+                        or bounded_distance(query, term[:len(query)], limit) <= limit):
+                    matches[term] = FUZZY
+        return matches
+
+    # {score: product ids} for one query term, each product under its best score
+    def _tiers(self, query):
+        tiers = {}
+        for term, score in self._matching_terms(query).items():
+            for weight in (NAME_WEIGHT, CATEGORY_WEIGHT):
+                ids = self._ids.get((term, weight))
+                if ids:
+                    tiers.setdefault(score * weight, set()).update(ids)
+        seen = set()
+        for value in sorted(tiers, reverse=True):
+            tiers[value] -= seen
+            seen |= tiers[value]
+        return tiers
+
+    # One query term: merge the name-ordered lists of the matching terms one
+    # score tier at a time until `limit` products are found
+    def _search_term(self, query, limit, accept):
+        tiers = {}
+        for term, score in self._matching_terms(query).items():
+            for weight in (NAME_WEIGHT, CATEGORY_WEIGHT):
+                entries = self._ordered.get((term, weight))
+                if entries:
+                    tiers.setdefault(score * weight, []).append(entries)
+
+        found = []
+        seen = set()
+        for score in sorted(tiers, reverse=True):
+            for _, product_id in heapq.merge(*tiers[score]):
+                if product_id in seen:
+                    continue
+                seen.add(product_id)
+                if accept is None or accept(product_id):
+                    found.append(product_id)
+                    if len(found) == limit:
+                        return found
+        return found
+
+    # Top `limit` product ids for a free-text query, best match first.
+    # `accept` filters ids, e.g. to skip products that are out of stock.
+    def search(self, text, limit=10, accept=None):
+        query_terms = list(dict.fromkeys(terms(text)))
+        if not query_terms:
+            return []
+        if len(query_terms) == 1:
+            return self._search_term(query_terms[0], limit, accept)
+
+        # Several terms: restrict each term's score tiers to the products
+        # matching every term, then rank whole groups of equal total score
+        per_term = [self._tiers(term) for term in query_terms]
+        candidates = set.intersection(*(set().union(*tiers.values()) for tiers in per_term))
+        if not candidates:
+            return []
+
+        groups = {0: candidates}
+        for tiers in per_term:
+            combined = {}
+            for total, ids in groups.items():
+                for value, tier in tiers.items():
+                    matched = ids & tier
+                    if matched:
+                        combined.setdefault(total + value, set()).update(matched)
+            groups = combined
+
+        found = []
+        for total in sorted(groups, reverse=True):
+            found += self._first_by_name(groups[total], limit - len(found), accept)
+            if len(found) == limit:
+                break
+        return found
+
+    # The `count` products of `group` that come first by name. A large group
+    # is found by walking the global name order, which on average takes
+    # count * len(index) / len(group) steps; a small one is ranked directly.
+    def _first_by_name(self, group, count, accept):
+        if len(group) * len(group) > count * len(self._order):
+            found = []
+            for _, product_id in self._order:
+                if product_id in group and (accept is None or accept(product_id)):
+                    found.append(product_id)
+                    if len(found) == count:
+                        break
+            return found
+        if accept is not None:
+            group = filter(accept, group)
+        return heapq.nsmallest(count, group, key=self._keys.__getitem__)
+
+    def stats(self):
+        return {'products': len(self._keys), 'terms': len(self._vocabulary), 'trigrams': len(self._grams)}
@@ -0,0 +1,168 @@
+from datetime import datetime, timedelta
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages):
+        self.shortages = shortages
+        names = ', '.join(s['name'] for s in shortages)
+        super().__init__(f'Insufficient stock for: {names}')
+
+
+# Sum the requested quantity per inventory id. Items without a productId are
+# free-text lines that are billed but not tracked in inventory.
+def collect_quantities(items):
+    quantities = {}
+    for item in items:
+        product_id = item.get('productId')
+        if product_id is None:
+            continue
+        quantity = int(item['quantity'])
+        if quantity <= 0:
+            continue
+        product_id = int(product_id)
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def _case(quantities, ids):
+    case = ' '.join(['WHEN %s THEN %s'] * len(ids))
+    params = [value for product_id in ids for value in (product_id, quantities[product_id])]
+    return f'CASE id {case} END', params
+
+
+# Take stock for every product in one conditional UPDATE. Rows are matched by
+# primary key in ascending order, so concurrent terminals lock the same rows
+# in the same order and only the touched rows are locked. If any product is
+# short the row is left alone, the affected-row count comes up short and
+# InsufficientStock is raised; the caller rolls the transaction back.
+#
+# The stock functions below return the stock changes they made as
+# {product_id: delta} so callers can patch caches once the work is committed.
+def decrement_stock(cursor, quantities):
+    if not quantities:
+        return {}
+    ids = sorted(quantities)
+    case, case_params = _case(quantities, ids)
+    placeholders = ', '.join(['%s'] * len(ids))
+    cursor.execute(
+        f"UPDATE inventory SET stock = stock - ({case}) "
+        f"WHERE id IN ({placeholders}) AND stock >= ({case})",
+        case_params + ids + case_params
+    )
+    if cursor.rowcount == len(ids):
+        return {product_id: -quantities[product_id] for product_id in ids}
+
+    cursor.execute(
+        f"SELECT id, product_name, stock FROM inventory WHERE id IN ({placeholders})",
+        ids
+    )
+    found = {row[0]: row for row in cursor.fetchall()}
+    shortages = []
+    for product_id in ids:
+        row = found.get(product_id)
+        available = row[2] if row else 0
+        if available < quantities[product_id]:
+            shortages.append({
+                'product_id': product_id,
+                'name': row[1] if row else f'#{product_id}',
+                'requested': quantities[product_id],
+                'available': available
+            })
+    raise InsufficientStock(shortages)
+
+
+def increment_stock(cursor, quantities):
+    if not quantities:
+        return {}
+    ids = sorted(quantities)
+    case, case_params = _case(quantities, ids)
+    placeholders = ', '.join(['%s'] * len(ids))
+    cursor.execute(
+        f"UPDATE inventory SET stock = stock + ({case}) WHERE id IN ({placeholders})",
+        case_params + ids
+    )
+    return dict(quantities)
+
+
+def merge_changes(*changes):
+    merged = {}
+    for change in changes:
+        for product_id, delta in change.items():
+            merged[product_id] = merged.get(product_id, 0) + delta
+    return {product_id: delta for product_id, delta in merged.items() if delta}
+
+
+# Reservations hold stock for carts left open at the counter. Holding stock
+# takes it out of inventory straight away, so a held cart can never be
+# oversold; releasing or expiring the reservation puts it back.
+def reserve_stock(cursor, quantities, ttl_seconds):
+    changes = decrement_stock(cursor, quantities)
+    expires_at = datetime.now() + timedelta(seconds=ttl_seconds)
+    cursor.execute(
+        "INSERT INTO stock_reservations (status, expires_at) VALUES ('held', %s)",
+        (expires_at,)
+    )
+    reservation_id = cursor.lastrowid
+    cursor.executemany(
+        "INSERT INTO stock_reservation_items (reservation_id, product_id, quantity) VALUES (%s, %s, %s)",
+        [(reservation_id, product_id, quantity) for product_id, quantity in sorted(quantities.items())]
+    )
+    return reservation_id, expires_at, changes
+
+
+# Move a held reservation to a final status. The status check in the UPDATE
+# makes sure only one caller ever releases or consumes a given reservation.
+# Given `now`, a reservation that has expired by then is left alone.
+def _close_reservation(cursor, reservation_id, status, now=None):
+    sql = "UPDATE stock_reservations SET status = %s WHERE id = %s AND status = 'held'"
+    params = [status, reservation_id]
+    if now is not None:
+        sql += " AND expires_at > %s"
+        params.append(now)
+    cursor.execute(sql, params)
+    return cursor.rowcount == 1
+
+
+def _reserved_quantities(cursor, reservation_id):
+    cursor.execute(
+        "SELECT product_id, quantity FROM stock_reservation_items WHERE reservation_id = %s",
+        (reservation_id,)
+    )
+    return dict(cursor.fetchall())
+
+
+def release_reservation(cursor, reservation_id):
+    if not _close_reservation(cursor, reservation_id, 'released'):
+        return None
+    return increment_stock(cursor, _reserved_quantities(cursor, reservation_id))
+
+
+# Turn a held, unexpired reservation into a sale. Only the difference
+# between what was held and what is finally billed touches inventory.
+def consume_reservation(cursor, reservation_id, quantities):
+    if not _close_reservation(cursor, reservation_id, 'consumed', datetime.now()):
+        raise ValueError('Reservation not found, expired or already used')
+    reserved = _reserved_quantities(cursor, reservation_id)
+
+    extra = {}
+    returned = {}
+    for product_id in set(reserved) | set(quantities):
+        delta = quantities.get(product_id, 0) - reserved.get(product_id, 0)
+        if delta > 0:
+            extra[product_id] = delta
+        elif delta < 0:
+            returned[product_id] = -delta
+
+    return merge_changes(decrement_stock(cursor, extra), increment_stock(cursor, returned))
+
+
+def release_expired_reservations(cursor, limit=100):
+    cursor.execute(
+        "SELECT id FROM stock_reservations WHERE status = 'held' AND expires_at < %s ORDER BY id LIMIT %s",
+        (datetime.now(), limit)
+    )
+    changes = {}
+    for (reservation_id,) in cursor.fetchall():
+        if _close_reservation(cursor, reservation_id, 'expired'):
+            changes = merge_changes(changes, increment_stock(cursor, _reserved_quantities(cursor, reservation_id)))
+    return changes
@@ -0,0 +1,332 @@
+import re
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+
+import mysql.connector
+from mysql.connector import errorcode
+
+
+# Storage backends for db.ConnectionPool.
+#
+# MySQL is the default. With DB_BACKEND=sqlite the same routes run on an
+# embedded SQLite file instead: counters that keep billing while the network
+# is down, and a service-free target for tests and benchmarks.
+#
+# SQLiteConnection wraps sqlite3 in the part of the mysql-connector interface
+# the app uses (%s parameters, dictionary cursors, start_transaction(),
+# lastrowid/rowcount) and raises mysql.connector exceptions carrying the
+# matching MySQL error numbers, so callers, the pool and their error handling
+# stay as they are. Statements stay written for MySQL and are translated once
+# per distinct SQL text; sqlite3 then keeps the compiled statement in a
+# per-connection cache, so a hot query is prepared once per pooled connection.
+#
+# The database runs in WAL mode: readers never block each other or the
+# writer, and writers are serialised on the database lock. A write takes that
+# lock when its transaction begins (BEGIN IMMEDIATE), which stands in for
+# SELECT ... FOR UPDATE. DECIMAL columns come back as Decimal and DATE,
+# DATETIME and TIMESTAMP columns as date/datetime. Aggregates and UNION
+# columns carry no declared type: their timestamps are recognised by shape
+# (e.g. MIN(created_at)), other values come back as float or int. Timestamps
+# are stored in local time, as MySQL does with the server's time zone.
+
+SQLITE_CACHED_STATEMENTS = 256
+_LOCAL_NOW = "datetime('now', 'localtime')"
+
+
+def connect_mysql(**connect_args):
+    return mysql.connector.connect(**connect_args)
+
+
+def connect_sqlite(path, busy_timeout=10.0, synchronous='FULL'):
+    try:
+        db = sqlite3.connect(
+            path, timeout=busy_timeout, isolation_level=None, check_same_thread=False,
+            detect_types=sqlite3.PARSE_DECLTYPES, cached_statements=SQLITE_CACHED_STATEMENTS
+        )
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute(f'PRAGMA synchronous={synchronous}')
+        db.execute('PRAGMA foreign_keys=ON')
+    except sqlite3.Error as e:
+        raise mysql.connector.InterfaceError(msg=f'Cannot open {path}: {e}') from e
+    return SQLiteConnection(db)
+
+
+BACKENDS = {
+    'mysql': connect_mysql,
+    'sqlite': connect_sqlite,
+}
+
+
+# Name of the backend behind a pooled connection
+def dialect(conn):
+    return getattr(conn, 'dialect', 'mysql')
+
+
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_converter('DECIMAL', lambda value: Decimal(value.decode()))
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()))
+sqlite3.register_converter('DATETIME', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+
+
+# MySQL to SQLite translation
+
+_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_MARKER = re.compile(r'\x00(\d+)\x00')
+_WRITE = re.compile(r'^\s*(?:INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+_CREATE_TABLE = re.compile(r'^\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', re.IGNORECASE)
+_AUTO_INCREMENT = re.compile(r'\b\w*INT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b', re.IGNORECASE)
+_INLINE_INDEX = re.compile(r',\s*(UNIQUE\s+)?(?:INDEX|KEY)\s+(\w+)\s*\(([^)]*)\)', re.IGNORECASE)
+_ON_UPDATE = re.compile(r'(\w+)(\s+(?:TIMESTAMP|DATETIME)\b[^,]*?)\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP', re.IGNORECASE)
+_AFTER_COLUMN = re.compile(r'^(\s*ALTER\s+TABLE\s.*\bADD\s+COLUMN\s.*?)\s+(?:AFTER\s+\w+|FIRST)\s*$',
+                           re.IGNORECASE | re.DOTALL)
+_ON_DUPLICATE = re.compile(r'\s+ON\s+DUPLICATE\s+KEY\s+UPDATE\s+(.*)$', re.IGNORECASE | re.DOTALL)
+_NO_OP_UPDATE = re.compile(r'\s*(\w+)\s*=\s*\1\s*')
+_VALUES_FN = re.compile(r'\bVALUES\((\w+)\)', re.IGNORECASE)
+_INTERVAL = re.compile(r'\bNOW\(\)\s*-\s*INTERVAL\s+(\S+)\s+(SECOND|MINUTE|HOUR|DAY)\b', re.IGNORECASE)
+_DELETE_LIMIT = re.compile(r'^\s*DELETE\s+FROM\s+(\w+)\s+(WHERE\s.*?)\s+LIMIT\s+(\S+)\s*$',
+                           re.IGNORECASE | re.DOTALL)
+_REWRITES = [
+    (re.compile(r'\bINSERT\s+IGNORE\b', re.IGNORECASE), 'INSERT OR IGNORE'),
+    (re.compile(r'\s+FOR\s+UPDATE\s*$', re.IGNORECASE), ''),
+    (re.compile(r'\bGREATEST\(', re.IGNORECASE), 'MAX('),
+    (re.compile(r'\bLEAST\(', re.IGNORECASE), 'MIN('),
+    (re.compile(r'\bNOW\(\)', re.IGNORECASE), _LOCAL_NOW),
+    (re.compile(r'\bDEFAULT\s+CURRENT_TIMESTAMP\b', re.IGNORECASE), f'DEFAULT ({_LOCAL_NOW})'),
+    (re.compile(r'\bCURRENT_TIMESTAMP\b', re.IGNORECASE), _LOCAL_NOW),
+]
+
+
+def _create_table(sql):
+    table = _CREATE_TABLE.match(sql).group(1)
+    extra = []
+    sql = _AUTO_INCREMENT.sub('INTEGER PRIMARY KEY AUTOINCREMENT', sql)
+
+    # Index names are per database in SQLite, per table in MySQL; the ones
+    # declared inline in this schema are unique across tables already
+    def index(match):
+        unique, name, columns = match.groups()
+        extra.append(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+        return ''
+
+    def on_update(match):
+        column = match.group(1)
+        extra.append(
+            f"CREATE TRIGGER IF NOT EXISTS trg_{table}_{column} AFTER UPDATE ON {table} FOR EACH ROW "
+            f"WHEN NEW.{column} IS OLD.{column} "
+            f"BEGIN UPDATE {table} SET {column} = {_LOCAL_NOW} WHERE rowid = NEW.rowid; END"
+        )
+        return column + match.group(2)
+
+    sql = _INLINE_INDEX.sub(index, sql)
+    sql = _ON_UPDATE.sub(on_update, sql)
+    return sql, extra
+
+
+def _upsert(sql):
+    match = _ON_DUPLICATE.search(sql)
+    head, assignments = sql[:match.start()], match.group(1)
+    # INSERT ... SELECT needs a WHERE before an upsert clause to parse
+    if re.search(r'\bSELECT\b', head, re.IGNORECASE) and not re.search(r'\b(?:WHERE|GROUP\s+BY)\b', head, re.IGNORECASE):
+        head += ' WHERE true'
+    if _NO_OP_UPDATE.fullmatch(assignments):
+        return f'{head} ON CONFLICT DO NOTHING'
+    return f'{head} ON CONFLICT DO UPDATE SET ' + _VALUES_FN.sub(r'excluded.\1', assignments)
+
+
+# Translate one MySQL statement. Returns the statement to run with the
+# caller's parameters followed by any extra statements it needs (indexes and
+# triggers of a CREATE TABLE).
+@lru_cache(maxsize=1024)
+def translate(sql):
+    literals = []
+
+    def mask(match):
+        literals.append(match.group(0))
+        return f'\x00{len(literals) - 1}\x00'
+
+    sql = _LITERAL.sub(mask, sql).replace('%s', '?')
+    extra = []
+    if _CREATE_TABLE.match(sql):
+        sql, extra = _create_table(sql)
+    sql = _AFTER_COLUMN.sub(r'\1', sql)
+    if _ON_DUPLICATE.search(sql):
+        sql = _upsert(sql)
+    sql = _INTERVAL.sub(lambda m: f"datetime('now', 'localtime', '-' || {m.group(1)} || ' {m.group(2).lower()}s')", sql)
+    for pattern, replacement in _REWRITES:
+        sql = pattern.sub(replacement, sql)
+        extra = [pattern.sub(replacement, statement) for statement in extra]
+    sql = _DELETE_LIMIT.sub(r'DELETE FROM \1 WHERE rowid IN (SELECT rowid FROM \1 \2 LIMIT \3)', sql)
+
+    def unmask(statement):
+        return _MARKER.sub(lambda m: literals[int(m.group(1))], statement)
+
+    return (unmask(sql), *(unmask(statement) for statement in extra))
+
+
+# sqlite3 errors as the mysql.connector errors the callers handle:
+# (sqlite3 class, message pattern, mysql.connector class, MySQL errno)
+_ERRORS = [
+    (sqlite3.IntegrityError, 'UNIQUE constraint', mysql.connector.IntegrityError, errorcode.ER_DUP_ENTRY),
+    (sqlite3.IntegrityError, 'PRIMARY KEY', mysql.connector.IntegrityError, errorcode.ER_DUP_ENTRY),
+    (sqlite3.IntegrityError, 'FOREIGN KEY', mysql.connector.IntegrityError, errorcode.ER_NO_REFERENCED_ROW_2),
+    (sqlite3.IntegrityError, 'NOT NULL', mysql.connector.IntegrityError, errorcode.ER_BAD_NULL_ERROR),
+    (sqlite3.IntegrityError, '', mysql.connector.IntegrityError, None),
+    (sqlite3.OperationalError, r'^index .* already exists', mysql.connector.ProgrammingError, errorcode.ER_DUP_KEYNAME),
+    (sqlite3.OperationalError, 'already exists', mysql.connector.ProgrammingError, errorcode.ER_TABLE_EXISTS_ERROR),
+    (sqlite3.OperationalError, 'duplicate column', mysql.connector.ProgrammingError, errorcode.ER_DUP_FIELDNAME),
+    (sqlite3.OperationalError, 'no such table', mysql.connector.ProgrammingError, errorcode.ER_NO_SUCH_TABLE),
+    (sqlite3.OperationalError, 'no such column', mysql.connector.ProgrammingError, errorcode.ER_BAD_FIELD_ERROR),
+    (sqlite3.OperationalError, 'syntax error', mysql.connector.ProgrammingError, errorcode.ER_PARSE_ERROR),
+    (sqlite3.OperationalError, 'locked', mysql.connector.OperationalError, errorcode.ER_LOCK_WAIT_TIMEOUT),
+    (sqlite3.OperationalError, '', mysql.connector.OperationalError, None),
+    (sqlite3.DataError, '', mysql.connector.DataError, None),
+    (sqlite3.ProgrammingError, '', mysql.connector.ProgrammingError, None),
+]
+
+
+def _mysql_error(error):
+    message = str(error)
+    for sqlite_class, pattern, mysql_class, errno in _ERRORS:
+        if isinstance(error, sqlite_class) and re.search(pattern, message):
+            return mysql_class(msg=message, errno=errno)
+    return mysql.connector.DatabaseError(msg=message)
+
+
+_TIMESTAMP_TEXT = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?:\.\d{1,6})?')
+
+
+def _timestamp(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return value
+
+
+# Row factory for one result set. Whether a column holds timestamp text is
+# decided once, from its first non-NULL value; later rows only touch the
+# columns that do, and rows without any come back as sqlite3 built them.
+def _row_factory(dictionary):
+    undecided = None
+    timestamps = []
+    names = None
+
+    def factory(cursor, row):
+        nonlocal undecided, names
+        if undecided is None:
+            undecided = list(range(len(row)))
+            names = [column[0] for column in cursor.description] if dictionary else None
+        if undecided:
+            for index in [index for index in undecided if row[index] is not None]:
+                undecided.remove(index)
+                if type(row[index]) is str and _TIMESTAMP_TEXT.fullmatch(row[index]):
+                    timestamps.append(index)
+        if timestamps:
+            row = list(row)
+            for index in timestamps:
+                row[index] = _timestamp(row[index])
+        if dictionary:
+            return dict(zip(names, row))
+        return tuple(row) if timestamps else row
+
+    return factory
+
+
+class SQLiteCursor:
+    def __init__(self, conn, dictionary=False):
+        self._conn = conn
+        self._dictionary = dictionary
+        self._cursor = conn._db.cursor()
+
+    def _run(self, operation, run):
+        statement, *extra = translate(operation)
+        try:
+            # Writes outside start_transaction() open a transaction of their
+            # own, as with autocommit off in MySQL; the caller commits
+            if _WRITE.match(statement) and not self._conn._db.in_transaction:
+                self._conn._db.execute('BEGIN IMMEDIATE')
+            run(statement)
+            for other in extra:
+                self._conn._db.execute(other)
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def execute(self, operation, params=None):
+        self._cursor.row_factory = _row_factory(self._dictionary)
+        self._run(operation, lambda statement: self._cursor.execute(statement, params or ()))
+
+    def executemany(self, operation, seq_params):
+        self._run(operation, lambda statement: self._cursor.executemany(statement, seq_params))
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    dialect = 'sqlite'
+    unread_result = False  # results are read lazily, nothing to drain
+
+    def __init__(self, db):
+        self._db = db
+
+    # Every statement is prepared: sqlite3 keeps compiled statements per
+    # connection, so `prepared` needs no cursor of its own
+    def cursor(self, dictionary=False, buffered=None, prepared=False):
+        return SQLiteCursor(self, dictionary)
+
+    @property
+    def in_transaction(self):
+        return self._db.in_transaction
+
+    def _execute(self, statement):
+        try:
+            self._db.execute(statement)
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def start_transaction(self):
+        if self._db.in_transaction:
+            raise mysql.connector.ProgrammingError(msg='Transaction already in progress')
+        self._execute('BEGIN IMMEDIATE')
+
+    def commit(self):
+        if self._db.in_transaction:
+            self._execute('COMMIT')
+
+    def rollback(self):
+        if self._db.in_transaction:
+            self._execute('ROLLBACK')
+
+    def ping(self, reconnect=False):
+        self._execute('SELECT 1')
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,639 @@
+import gzip
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import rollups
+
+
+# Delta sync between offline stores and the central server.
+#
+# An offline store runs this app on the SQLite backend. Triggers append
+# every new bill, payment (and payment status change), pickup and stock
+# change to change_log, whose seq is one monotonic sequence for all tables.
+# SyncClient pushes the log in batches: the rows behind up to BATCH_SIZE log
+# entries, as positional arrays in the *_FIELDS order, with the stock changes
+# summed per product, as one gzip-compressed JSON body.
+#
+# The server applies a batch in one transaction with multi-row inserts and
+# records the last seq it has applied for the store in sync_stores. A batch
+# must start where the last applied one ended: one that was already applied
+# is acknowledged again without being replayed, one that skips ahead is
+# refused with the seq to resume from. A dropped connection therefore costs
+# at most the batch in flight, and the client picks up from the server's
+# acknowledgement. Log entries are deleted on the store once acknowledged.
+# A store that starts over on a new database must use a new store id.
+#
+# Conflicts are resolved on the server as follows:
+#
+#   - stock is merged as deltas, so sales from several stores and the
+#     counter add up. A product pushed below zero is set to zero and
+#     reported as oversold; an unknown product is reported and skipped
+#   - bills are new rows keyed by "<store>:<local id>"
+#   - payments are keyed by the bank's transaction id. A known transaction
+#     keeps its row, and a final status from the store settles it while it
+#     is still pending; a differing amount is reported
+#   - pickups are keyed by their journal entry key
+#
+# Inventory flows the other way: the store pulls products changed since its
+# cursor, in pages ordered by (updated_at, id), and sets its stock to the
+# server's plus its own changes not pushed yet. updated_at only has second
+# resolution and is set before commit, so every pull starts PULL_OVERLAP
+# before the newest change it saw last time; re-applying a product is
+# harmless. Products are managed on the server: one added on an offline
+# store gets a local id the server does not know.
+
+PROTOCOL = 1
+BATCH_SIZE = 500
+PULL_PAGE_SIZE = 500
+PULL_OVERLAP = timedelta(seconds=5)
+MAX_BODY_SIZE = 32 * 1024 * 1024  # decompressed
+
+BILL_FIELDS = ('id', 'customer_name', 'customer_phone', 'subtotal', 'gst', 'total', 'created_at')
+ITEM_FIELDS = ('bill_id', 'item_name', 'quantity', 'price', 'gst_rate')
+PAYMENT_FIELDS = ('transaction_id', 'amount', 'status', 'verified_at', 'created_at')
+PICKUP_FIELDS = ('entry_key', 'waste_type', 'quantity', 'pickup_date', 'status', 'scheduled_at')
+PRODUCT_FIELDS = ('id', 'sku', 'product_name', 'category', 'price', 'stock', 'description', 'gst_rate', 'status',
+                  'updated_at')
+
+logger = logging.getLogger('msme')
+
+
+class SyncGap(Exception):
+    def __init__(self, acked):
+        super().__init__(f'Batch does not continue from seq {acked}')
+        self.acked = acked
+
+
+class SyncError(Exception):
+    def __init__(self, message, status=None, body=None):
+        super().__init__(message)
+        self.status = status
+        self.body = body or {}
+
+
+# Wire format
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)  # exact, unlike a JSON number
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def encode(payload, compress=True):
+    body = json.dumps(payload, default=_default, separators=(',', ':')).encode('utf-8')
+    return gzip.compress(body, 6) if compress else body
+
+
+# Decode a request or response body, refusing more than MAX_BODY_SIZE bytes
+# of JSON however well it compresses
+def decode(body, encoding=None):
+    if encoding == 'gzip':
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = inflater.decompress(body, MAX_BODY_SIZE)
+        except zlib.error as e:
+            raise ValueError(f'Invalid gzip body: {e}')
+        if inflater.unconsumed_tail:
+            raise ValueError('Sync body too large')
+    elif encoding:
+        raise ValueError(f'Unsupported Content-Encoding: {encoding}')
+    return json.loads(body)
+
+
+def _timestamp(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _decimal(value):
+    return Decimal(value) if value is not None else None
+
+
+# Offline store
+
+# Change capture on the offline store (SQLite only; see SQLITE_MIGRATIONS)
+LOCAL_SCHEMA = [
+    """
+        CREATE TABLE change_log (
+            seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+            table_name VARCHAR(32) NOT NULL,
+            row_id INT NOT NULL,
+            delta INT
+        )
+    """,
+    """
+        CREATE TABLE sync_state (
+            name VARCHAR(32) PRIMARY KEY,
+            value VARCHAR(64) NOT NULL
+        )
+    """,
+    "CREATE TRIGGER trg_sync_bills AFTER INSERT ON bills FOR EACH ROW "
+    "BEGIN INSERT INTO change_log (table_name, row_id) VALUES ('bills', NEW.id); END",
+    "CREATE TRIGGER trg_sync_payments AFTER INSERT ON payments FOR EACH ROW "
+    "BEGIN INSERT INTO change_log (table_name, row_id) VALUES ('payments', NEW.id); END",
+    "CREATE TRIGGER trg_sync_payment_status AFTER UPDATE OF status ON payments FOR EACH ROW "
+    "WHEN NEW.status IS NOT OLD.status "
+    "BEGIN INSERT INTO change_log (table_name, row_id) VALUES ('payments', NEW.id); END",
+    "CREATE TRIGGER trg_sync_pickups AFTER INSERT ON waste_pickups FOR EACH ROW "
+    "BEGIN INSERT INTO change_log (table_name, row_id) VALUES ('waste_pickups', NEW.id); END",
+    "CREATE TRIGGER trg_sync_stock AFTER UPDATE OF stock ON inventory FOR EACH ROW "
+    "WHEN NEW.stock != OLD.stock "
+    "BEGIN INSERT INTO change_log (table_name, row_id, delta) VALUES ('inventory', NEW.id, NEW.stock - OLD.stock); END",
+]
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+# Rows of the given tables (a hot table and its archive) with the given ids.
+# One query per table: SQLite gives UNION columns no declared type, and the
+# DECIMAL columns would come back as floats.
+def _rows(cursor, columns, tables, key, ids):
+    rows = []
+    if ids:
+        for table in tables:
+            cursor.execute(f"SELECT {columns} FROM {table} WHERE {key} IN ({_placeholders(ids)})", ids)
+            rows += [list(row) for row in cursor.fetchall()]
+    return rows
+
+
+# The next batch after `after`, or None when the log is drained
+def read_batch(conn, store, after, limit=BATCH_SIZE):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT seq, table_name, row_id, delta FROM change_log WHERE seq > %s ORDER BY seq LIMIT %s",
+            (after, limit)
+        )
+        entries = cursor.fetchall()
+        if not entries:
+            return None
+        ids = defaultdict(dict)  # ordered sets
+        stock = Counter()
+        for _, table, row_id, delta in entries:
+            if table == 'inventory':
+                stock[row_id] += delta
+            else:
+                ids[table][row_id] = None
+        bill_ids = list(ids['bills'])
+        pickups = _rows(cursor, f"id, {', '.join(PICKUP_FIELDS)}", ['waste_pickups'], 'id', list(ids['waste_pickups']))
+        return {
+            'v': PROTOCOL,
+            'store': store,
+            'from': after,
+            'to': entries[-1][0],
+            'bills': _rows(cursor, ', '.join(BILL_FIELDS), ['bills', 'bills_archive'], 'id', bill_ids),
+            'items': _rows(cursor, ', '.join(ITEM_FIELDS), ['bill_items', 'bill_items_archive'], 'bill_id', bill_ids),
+            'payments': _rows(cursor, ', '.join(PAYMENT_FIELDS), ['payments', 'payments_archive'], 'id',
+                              list(ids['payments'])),
+            # Pickups written before the journal had no entry key
+            'pickups': [[entry_key or hashlib.md5(f'{store}:{row_id}'.encode()).hexdigest(), *rest]
+                        for row_id, entry_key, *rest in pickups],
+            'stock': sorted([product_id, delta] for product_id, delta in stock.items() if delta),
+        }
+    finally:
+        cursor.close()
+
+
+# Drop log entries the server has applied
+def forget(conn, acked):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM change_log WHERE seq <= %s", (acked,))
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def pending_changes(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM change_log")
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def get_state(conn, name):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT value FROM sync_state WHERE name = %s", (name,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        cursor.close()
+
+
+# Upsert products pulled from the server, keeping the stock changes made
+# here that the server has not seen yet, and advance the pull cursor in the
+# same transaction
+def apply_products(conn, rows, cursor_value):
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log")
+        before = cursor.fetchone()[0]
+        if rows:
+            ids = [row[0] for row in rows]
+            cursor.execute(
+                f"SELECT row_id, SUM(delta) FROM change_log WHERE table_name = 'inventory' "
+                f"AND row_id IN ({_placeholders(ids)}) GROUP BY row_id",
+                ids
+            )
+            unpushed = dict(cursor.fetchall())
+            stock_index = PRODUCT_FIELDS.index('stock')
+            values = []
+            for row in rows:
+                row = list(row[:-1])  # updated_at is set locally
+                row[stock_index] += unpushed.get(row[0], 0)
+                values.append(row)
+            columns = PRODUCT_FIELDS[:-1]
+            cursor.executemany(
+                f"INSERT INTO inventory ({', '.join(columns)}) VALUES ({_placeholders(columns)}) "
+                f"ON DUPLICATE KEY UPDATE " + ', '.join(f'{name} = VALUES({name})' for name in columns[1:]),
+                values
+            )
+            # The stock trigger logged the server's own changes; they are
+            # not ours to push back
+            cursor.execute("DELETE FROM change_log WHERE seq > %s", (before,))
+        cursor.execute(
+            "INSERT INTO sync_state (name, value) VALUES ('pulled', %s) ON DUPLICATE KEY UPDATE value = VALUES(value)",
+            (cursor_value,)
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# Central server
+
+def acked_seq(conn, store):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT acked_seq FROM sync_stores WHERE store_id = %s", (store,))
+        row = cursor.fetchone()
+        conn.commit()
+        return row[0] if row else 0
+    finally:
+        cursor.close()
+
+
+def _apply_bills(cursor, store, bills, items):
+    if not bills:
+        return 0
+    keys = {f'{store}:{bill[0]}': bill for bill in bills}
+    cursor.execute(f"SELECT sync_key FROM bills WHERE sync_key IN ({_placeholders(keys)})", list(keys))
+    for key, in cursor.fetchall():
+        del keys[key]
+    if not keys:
+        return 0
+    rows = [(key, name, phone, Decimal(subtotal), Decimal(gst), Decimal(total), _timestamp(created_at))
+            for key, (_, name, phone, subtotal, gst, total, created_at) in keys.items()]
+    cursor.executemany(
+        "INSERT INTO bills (sync_key, customer_name, customer_phone, subtotal, gst, total, created_at) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+        rows
+    )
+    cursor.execute(f"SELECT sync_key, id FROM bills WHERE sync_key IN ({_placeholders(keys)})", list(keys))
+    bill_ids = dict(cursor.fetchall())
+    item_rows = [
+        (bill_ids[f'{store}:{local_id}'], name, quantity, Decimal(price), _decimal(rate))
+        for local_id, name, quantity, price, rate in items
+        if f'{store}:{local_id}' in bill_ids
+    ]
+    for start in range(0, len(item_rows), BATCH_SIZE):
+        cursor.executemany(
+            "INSERT INTO bill_items (bill_id, item_name, quantity, price, gst_rate) VALUES (%s, %s, %s, %s, %s)",
+            item_rows[start:start + BATCH_SIZE]
+        )
+    days = defaultdict(lambda: [Decimal(0), 0])
+    for row in rows:
+        day = days[row[6].date()]
+        day[0] += row[5]
+        day[1] += 1
+    for day, (revenue, count) in days.items():
+        rollups.record(cursor, day, revenue=revenue, bills=count)
+    return len(rows)
+
+
+def _apply_payments(cursor, payments, conflicts):
+    applied = 0
+    for transaction_id, amount, status, verified_at, created_at in payments:
+        amount, verified_at, created_at = Decimal(amount), _timestamp(verified_at), _timestamp(created_at)
+        cursor.execute(
+            "INSERT INTO payments (transaction_id, amount, status, verified_at, created_at) "
+            "VALUES (%s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE id = id",
+            (transaction_id, amount, status, verified_at, created_at)
+        )
+        if cursor.rowcount == 1:
+            applied += 1
+            rollups.record(cursor, created_at.date(), payments=1, verified_payments=int(status == 'verified'))
+            continue
+        cursor.execute(
+            "SELECT id, amount, status FROM payments WHERE transaction_id = %s FOR UPDATE", (transaction_id,)
+        )
+        payment_id, known_amount, known_status = cursor.fetchone()
+        if known_amount != amount:
+            conflicts.append({'table': 'payments', 'key': transaction_id, 'reason': 'amount differs',
+                              'server': known_amount, 'store': amount})
+        elif known_status == 'pending' and status in ('verified', 'failed'):
+            cursor.execute(
+                "UPDATE payments SET status = %s, verified_at = %s WHERE id = %s AND status = 'pending'",
+                (status, verified_at, payment_id)
+            )
+            applied += 1
+            if status == 'verified':
+                rollups.record(cursor, (verified_at or datetime.now()).date(), verified_payments=1)
+    return applied
+
+
+def _apply_pickups(cursor, pickups):
+    if not pickups:
+        return 0
+    keys = [pickup[0] for pickup in pickups]
+    cursor.execute(f"SELECT entry_key FROM waste_pickups WHERE entry_key IN ({_placeholders(keys)})", keys)
+    known = {key for key, in cursor.fetchall()}
+    rows = [
+        (entry_key, waste_type, Decimal(quantity), date.fromisoformat(pickup_date), status, _timestamp(scheduled_at))
+        for entry_key, waste_type, quantity, pickup_date, status, scheduled_at in pickups
+        if entry_key not in known
+    ]
+    if rows:
+        cursor.executemany(
+            "INSERT INTO waste_pickups (entry_key, waste_type, quantity, pickup_date, status, scheduled_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            rows
+        )
+        for day, count in Counter(row[5].date() for row in rows).items():
+            rollups.record(cursor, day, pickups=count)
+    return len(rows)
+
+
+# Add the store's stock deltas, never below zero. Returns {product_id: delta}
+# as applied, for the caches.
+def _apply_stock(cursor, stock, conflicts):
+    if not stock:
+        return {}
+    deltas = dict(stock)
+    ids = sorted(deltas)
+    cursor.execute(f"SELECT id, stock FROM inventory WHERE id IN ({_placeholders(ids)}) ORDER BY id FOR UPDATE", ids)
+    current = dict(cursor.fetchall())
+    changes = {}
+    for product_id in ids:
+        if product_id not in current:
+            conflicts.append({'table': 'inventory', 'id': product_id, 'reason': 'unknown product',
+                              'delta': deltas[product_id]})
+            continue
+        new_stock = current[product_id] + deltas[product_id]
+        if new_stock < 0:
+            conflicts.append({'table': 'inventory', 'id': product_id, 'reason': 'oversold', 'short': -new_stock})
+            new_stock = 0
+        if new_stock != current[product_id]:
+            changes[product_id] = new_stock - current[product_id]
+    if changes:
+        changed = sorted(changes)
+        case = ' '.join(['WHEN %s THEN %s'] * len(changed))
+        cursor.execute(
+            f"UPDATE inventory SET stock = stock + (CASE id {case} END) WHERE id IN ({_placeholders(changed)})",
+            [value for product_id in changed for value in (product_id, changes[product_id])] + changed
+        )
+    return changes
+
+
+# Apply one pushed batch. Returns (acked seq, conflicts, counts, stock
+# changes); raises SyncGap when the batch does not continue from the seq the
+# server has acknowledged.
+def apply_batch(conn, batch):
+    if batch.get('v') != PROTOCOL:
+        raise ValueError(f"Unsupported sync protocol version: {batch.get('v')}")
+    store = str(batch['store'])[:64]
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        # Pushes from the same store queue up on its row
+        cursor.execute(
+            "INSERT INTO sync_stores (store_id) VALUES (%s) ON DUPLICATE KEY UPDATE store_id = store_id", (store,)
+        )
+        cursor.execute("SELECT acked_seq FROM sync_stores WHERE store_id = %s FOR UPDATE", (store,))
+        acked = cursor.fetchone()[0]
+        if batch['to'] <= acked:
+            conn.commit()
+            return acked, [], {}, {}  # a retry of a batch already applied
+        if batch['from'] != acked:
+            conn.rollback()
+            raise SyncGap(acked)
+
+        conflicts = []
+        counts = {
+            'bills': _apply_bills(cursor, store, batch['bills'], batch['items']),
+            'payments': _apply_payments(cursor, batch['payments'], conflicts),
+            'pickups': _apply_pickups(cursor, batch['pickups']),
+        }
+        changes = _apply_stock(cursor, batch['stock'], conflicts)
+        counts['stock'] = len(changes)
+        cursor.execute(
+            "INSERT INTO sync_stores (store_id, acked_seq) VALUES (%s, %s) "
+            "ON DUPLICATE KEY UPDATE acked_seq = VALUES(acked_seq)",
+            (store, batch['to'])
+        )
+        conn.commit()
+        return batch['to'], conflicts, counts, changes
+    except SyncGap:
+        raise
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+# Products changed at or after `since` (an updated_at), after (since, after_id)
+# in (updated_at, id) order. Returns (rows, next cursor or None).
+def read_products(conn, since=None, after_id=0, limit=PULL_PAGE_SIZE):
+    conditions, params = [], []
+    if since is not None:
+        conditions.append("(updated_at > %s OR (updated_at = %s AND id > %s))")
+        params += [since, since, after_id]
+    where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"SELECT {', '.join(PRODUCT_FIELDS)} FROM inventory {where} ORDER BY updated_at, id LIMIT %s",
+            params + [limit + 1]
+        )
+        rows = [list(row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1][-1], rows[-1][0])
+
+
+class SyncClient:
+    def __init__(self, get_connection, url, store, token, batch_size=BATCH_SIZE, interval=60.0, timeout=30.0,
+                 max_backoff=600.0):
+        self.get_connection = get_connection
+        self.url = url.rstrip('/') if url else None
+        self.store = store
+        self.token = token
+        self.batch_size = batch_size
+        self.interval = interval
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.on_pulled = None  # called with the number of products pulled
+
+        self._thread = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._backoff = 0.0
+
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.failures = 0
+        self.last_sync = None
+
+    def _request(self, method, path, params=None, payload=None):
+        query = urllib.parse.urlencode({'store': self.store, **(params or {})})
+        headers = {'X-Sync-Token': self.token or '', 'Accept-Encoding': 'gzip'}
+        body = None
+        if payload is not None:
+            body = encode(payload)
+            headers.update({'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+        req = urllib.request.Request(f'{self.url}{path}?{query}', data=body, headers=headers, method=method)
+        self.bytes_sent += len(body or b'')
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                data = response.read()
+                self.bytes_received += len(data)
+                return decode(data, response.headers.get('Content-Encoding'))
+        except urllib.error.HTTPError as e:
+            data = e.read()
+            self.bytes_received += len(data)
+            try:
+                body = decode(data, e.headers.get('Content-Encoding'))
+            except ValueError:
+                body = {}
+            raise SyncError(body.get('message') or f'HTTP {e.code}', e.code, body) from e
+
+    # Push every pending change, then pull inventory. Returns a summary.
+    def sync(self):
+        with self._sync_lock:
+            started = time.perf_counter()
+            summary = {'batches': 0, 'changes': 0, 'pulled': 0, 'conflicts': []}
+            with self.get_connection() as conn:
+                if not conn:
+                    raise SyncError('Database connection failed')
+                acked = self._request('GET', '/api/sync/state')['acked']
+                forget(conn, acked)
+                while not self._stopping.is_set():
+                    batch = read_batch(conn, self.store, acked, self.batch_size)
+                    if batch is None:
+                        break
+                    try:
+                        result = self._request('POST', '/api/sync/push', payload=batch)
+                    except SyncError as e:
+                        if e.status == 429:
+                            # Shed by the server's admission control: wait as told, then resend
+                            self._stopping.wait(float(e.body.get('retryAfter') or 1))
+                            continue
+                        if e.status != 409:
+                            raise
+                        acked = e.body['acked']  # resume where the server is
+                        forget(conn, acked)
+                        continue
+                    summary['batches'] += 1
+                    summary['changes'] += len(batch['bills']) + len(batch['payments']) + len(batch['pickups']) \
+                        + len(batch['stock'])
+                    summary['conflicts'] += result['conflicts']
+                    acked = result['acked']
+                    forget(conn, acked)
+                summary['pulled'] = self._pull(conn)
+            for conflict in summary['conflicts']:
+                logger.warning('Sync conflict', extra=conflict)
+            self.last_sync = datetime.now()
+            summary['seconds'] = round(time.perf_counter() - started, 3)
+            return summary
+
+    def _pull(self, conn):
+        pulled = 0
+        saved = get_state(conn, 'pulled')
+        since, after_id = (saved.rsplit('|', 1) if saved else (None, 0))
+        while not self._stopping.is_set():
+            params = {'since': since, 'after': after_id} if since else {}
+            page = self._request('GET', '/api/sync/pull', params)
+            rows = [[_decimal(value) if name in ('price', 'gst_rate') else value
+                     for name, value in zip(PRODUCT_FIELDS, row)] for row in page['rows']]
+            if page['next']:
+                since, after_id = page['next']
+            elif rows:
+                # Caught up: start the next pull a little before the newest change
+                since = (_timestamp(max(row[-1] for row in rows)) - PULL_OVERLAP).isoformat(sep=' ')
+                after_id = 0
+            apply_products(conn, rows, f'{since}|{after_id}' if since else '')
+            pulled += len(rows)
+            if not page['next']:
+                break
+        if pulled and self.on_pulled:
+            self.on_pulled(pulled)
+        return pulled
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='sync-client', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stopping.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+    # Sync every `interval` seconds; while the server is unreachable, back
+    # off exponentially with jitter
+    def _run(self):
+        delay = 0
+        while not self._stopping.wait(delay):
+            try:
+                self.sync()
+                self._backoff = 0.0
+                delay = self.interval
+            except Exception as e:
+                self.failures += 1
+                self._backoff = min(max(self.interval, self._backoff * 2), self.max_backoff)
+                delay = self._backoff * random.uniform(0.5, 1.0)
+                logger.warning('Sync failed, retrying', extra={'error': str(e), 'retry_in': round(delay, 2)})
+
+    def stats(self):
+        return {
+            'running': self._thread is not None,
+            'store': self.store,
+            'last_sync': self.last_sync,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'failures': self.failures,
+            'backoff': self._backoff,
+        }
@@ -0,0 +1,35 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('WARM_UP', '0')
+os.environ.setdefault('EVENTS_RELAY_INTERVAL', '0')
+
+
+# The same check as `flask --app app explain-queries`: every hot query must
+# plan an index access. Runs against the MySQL database configured in .env
+# (DB_HOST, DB_NAME, ...), migrated and with realistic data, and is skipped
+# when none can be reached.
+#
+#   python -m unittest discover -s tests
+
+
+class ExplainQueriesTest(unittest.TestCase):
+    def test_hot_queries_use_an_index(self):
+        import app
+        import migrations
+        import storage
+
+        with app.get_db_connection() as conn:
+            if not conn:
+                self.skipTest('No MySQL database available')
+            if storage.dialect(conn) != 'mysql':
+                self.skipTest('explain-queries reads MySQL query plans')
+            failures = migrations.unindexed_queries(conn, app.HOT_QUERIES)
+
+        self.assertEqual(failures, {}, 'Hot queries without an index')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,338 @@
+import json
+import queue
+import random
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta
+
+import rollups
+
+
+# Payment verification pipeline.
+#
+# /api/verify_payment records the payment as 'pending' together with a row in
+# verification_jobs and returns at once. A pool of worker threads calls the
+# bank and settles the payment, so a slow bank API ties up these workers
+# rather than request workers. Jobs are claimed with a conditional UPDATE, so
+# several processes (or a restart replaying unfinished jobs) never verify the
+# same payment twice.
+#
+# A pool gives up on a job after a few failed attempts in a row and marks it
+# 'error'. Polling the payment's status queues it again, until the job has
+# used `max_attempts` attempts in all; then the payment is failed rather
+# than left pending.
+
+
+# Talks to the bank's verification API at BANK_API_URL. Without a URL it
+# falls back to the old in-process simulation (roughly 66% success).
+class BankClient:
+    def __init__(self, url=None, timeout=10.0):
+        self.url = url
+        self.timeout = timeout
+
+    def verify(self, transaction_id, amount):
+        if not self.url:
+            return random.choice([True, True, False])
+
+        body = json.dumps({'transactionId': transaction_id, 'amount': str(amount)}).encode('utf-8')
+        req = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req, timeout=self.timeout) as response:
+            return bool(json.load(response).get('verified'))
+
+
+def create_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS verification_jobs (
+            payment_id INT PRIMARY KEY,
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            attempts INT NOT NULL DEFAULT 0,
+            error VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_jobs_status_updated (status, updated_at),
+            FOREIGN KEY (payment_id) REFERENCES payments(id)
+        )
+    ''')
+
+
+# Job state kept in MySQL
+class MySQLJobStore:
+    def __init__(self, get_connection, stale_after=300, max_attempts=9):
+        self.get_connection = get_connection
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+
+    # Record a payment unless its transaction_id is already known. Returns
+    # (payment_id, created); a retried submission gets the existing payment
+    # back and creates no new verification work.
+    def enqueue(self, cursor, transaction_id, amount, now):
+        cursor.execute(
+            "INSERT INTO payments (transaction_id, amount, status, created_at) VALUES (%s, %s, 'pending', %s) "
+            "ON DUPLICATE KEY UPDATE id = id",
+            (transaction_id, amount, now)
+        )
+        if cursor.rowcount != 1:
+            cursor.execute("SELECT id FROM payments WHERE transaction_id = %s", (transaction_id,))
+            return cursor.fetchone()[0], False
+        payment_id = cursor.lastrowid
+        cursor.execute("INSERT INTO verification_jobs (payment_id) VALUES (%s)", (payment_id,))
+        rollups.record(cursor, now.date(), payments=1)
+        return payment_id, True
+
+    def claim(self, payment_id):
+        with self.get_connection() as conn:
+            if not conn:
+                return None
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    "UPDATE verification_jobs SET status = 'processing', attempts = attempts + 1 "
+                    "WHERE payment_id = %s AND status = 'queued'",
+                    (payment_id,)
+                )
+                claimed = cursor.rowcount == 1
+                if not claimed:
+                    conn.commit()
+                    return None
+                cursor.execute("SELECT transaction_id, amount FROM payments WHERE id = %s", (payment_id,))
+                row = cursor.fetchone()
+                conn.commit()
+                return row
+            finally:
+                cursor.close()
+
+    def complete(self, payment_id, verified):
+        now = datetime.now()
+        with self.get_connection() as conn:
+            if not conn:
+                raise RuntimeError('Database connection failed')
+            cursor = conn.cursor()
+            try:
+                conn.start_transaction()
+                cursor.execute(
+                    "UPDATE payments SET status = %s, verified_at = %s WHERE id = %s",
+                    ('verified' if verified else 'failed', now, payment_id)
+                )
+                cursor.execute(
+                    "UPDATE verification_jobs SET status = 'done', error = NULL WHERE payment_id = %s",
+                    (payment_id,)
+                )
+                if verified:
+                    rollups.record(cursor, now.date(), verified_payments=1)
+                conn.commit()
+            finally:
+                cursor.close()
+
+    # Put the job back in the queue (retry) or give up on it. Giving up on a
+    # job with no attempts left fails its payment too; returns True then.
+    def fail(self, payment_id, error, retry):
+        with self.get_connection() as conn:
+            if not conn:
+                return False
+            cursor = conn.cursor()
+            try:
+                conn.start_transaction()
+                cursor.execute(
+                    "UPDATE verification_jobs SET status = %s, error = %s WHERE payment_id = %s",
+                    ('queued' if retry else 'error', str(error)[:255], payment_id)
+                )
+                failed = False
+                if not retry:
+                    cursor.execute(
+                        "UPDATE payments SET status = 'failed', verified_at = %s "
+                        "WHERE id = %s AND status = 'pending' "
+                        "AND (SELECT attempts FROM verification_jobs WHERE payment_id = %s) >= %s",
+                        (datetime.now(), payment_id, payment_id, self.max_attempts)
+                    )
+                    failed = cursor.rowcount == 1
+                conn.commit()
+                return failed
+            finally:
+                cursor.close()
+
+    # Queue the job of a pending payment again: one recorded before
+    # verification jobs existed gets a job, one whose job gave up goes back
+    # in the queue while it has attempts left. Returns True when a job was
+    # queued.
+    def requeue(self, payment_id):
+        with self.get_connection() as conn:
+            if not conn:
+                return False
+            cursor = conn.cursor()
+            try:
+                cursor.execute("INSERT IGNORE INTO verification_jobs (payment_id) VALUES (%s)", (payment_id,))
+                queued = cursor.rowcount == 1
+                if not queued:
+                    cursor.execute(
+                        "UPDATE verification_jobs SET status = 'queued' "
+                        "WHERE payment_id = %s AND status = 'error' AND attempts < %s",
+                        (payment_id, self.max_attempts)
+                    )
+                    queued = cursor.rowcount == 1
+                conn.commit()
+                return queued
+            finally:
+                cursor.close()
+
+    # Jobs to replay on startup: queued ones plus any left 'processing' by a
+    # worker that died more than stale_after seconds ago
+    def unfinished(self, limit=10000):
+        with self.get_connection() as conn:
+            if not conn:
+                return []
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    "UPDATE verification_jobs SET status = 'queued' WHERE status = 'processing' AND updated_at < %s",
+                    (datetime.now() - timedelta(seconds=self.stale_after),)
+                )
+                cursor.execute(
+                    "SELECT payment_id FROM verification_jobs WHERE status = 'queued' ORDER BY payment_id LIMIT %s",
+                    (limit,)
+                )
+                ids = [row[0] for row in cursor.fetchall()]
+                conn.commit()
+                return ids
+            finally:
+                cursor.close()
+
+    def status(self, payment_id):
+        with self.get_connection() as conn:
+            if not conn:
+                return None
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute(
+                    "SELECT p.id, p.transaction_id, p.amount, p.status, p.verified_at, j.status AS job_status, j.error "
+                    "FROM payments p LEFT JOIN verification_jobs j ON j.payment_id = p.id WHERE p.id = %s",
+                    (payment_id,)
+                )
+                return cursor.fetchone()
+            finally:
+                cursor.close()
+
+
+class VerificationPool:
+    def __init__(self, bank, store, workers=8, max_attempts=3, retry_delay=1.0):
+        self.bank = bank
+        self.store = store
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._done = {}  # payment_id -> Event, for callers waiting on a result
+        self._attempts = {}
+
+        self.on_settled = None  # called with (payment_id, status) after the bank answers
+
+        self.processed = 0
+        self.failures = 0
+
+    def start(self, replay=True):
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'verify-{number}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        if replay:
+            for payment_id in self.store.unfinished():
+                self.submit(payment_id)
+
+    # Stop taking work; with drain=True let the workers finish what is queued
+    def stop(self, drain=True, timeout=30):
+        if not drain:
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout)
+
+    def submit(self, payment_id):
+        with self._lock:
+            self._done.setdefault(payment_id, threading.Event())
+        self._queue.put(payment_id)
+
+    # True while the job is queued, running or waiting to retry in this pool
+    def in_flight(self, payment_id):
+        with self._lock:
+            return payment_id in self._done
+
+    # Block until the payment settles; returns False on timeout. Jobs
+    # submitted to this pool are waited on directly. Jobs of other processes,
+    # or from before a restart, are polled in the store every
+    # `poll_interval` seconds.
+    def wait(self, payment_id, timeout, poll_interval=0.5):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                event = self._done.get(payment_id)
+            if event is not None:
+                return event.wait(max(deadline - time.monotonic(), 0))
+            payment = self.store.status(payment_id)
+            if payment is None or payment['status'] != 'pending' or payment['job_status'] == 'error':
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(poll_interval, remaining))
+
+    def _settle(self, payment_id):
+        with self._lock:
+            event = self._done.pop(payment_id, None)
+            self._attempts.pop(payment_id, None)
+        if event:
+            event.set()
+
+    def _run(self):
+        while True:
+            payment_id = self._queue.get()
+            if payment_id is None:
+                return
+            try:
+                job = self.store.claim(payment_id)
+                if job is None:
+                    self._settle(payment_id)
+                    continue
+                transaction_id, amount = job
+                verified = self.bank.verify(transaction_id, amount)
+                self.store.complete(payment_id, verified)
+                self.processed += 1
+                self._settle(payment_id)
+            except Exception as e:
+                self.failures += 1
+                with self._lock:
+                    attempts = self._attempts[payment_id] = self._attempts.get(payment_id, 0) + 1
+                retry = attempts < self.max_attempts
+                try:
+                    failed = self.store.fail(payment_id, e, retry)
+                except Exception:
+                    failed = False
+                if retry:
+                    threading.Timer(self.retry_delay * attempts, self._queue.put, (payment_id,)).start()
+                else:
+                    self._settle(payment_id)
+                    if failed and self.on_settled:
+                        self.on_settled(payment_id, 'failed')
+            else:
+                if self.on_settled:
+                    self.on_settled(payment_id, 'verified' if verified else 'failed')
+
+    def stats(self):
+        return {
+            'workers': len(self._threads),
+            'queued': self._queue.qsize(),
+            'processed': self.processed,
+            'failures': self.failures,
+        }